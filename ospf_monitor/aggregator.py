@@ -0,0 +1,234 @@
+# !/usr/bin/env python
+
+## Sits between the monitors and the collector: monitors export to the
+## aggregator instead (HTTP posts and/or framed streams), it passes one
+## deduplicated change stream on (lib/aggregate.py), so the collector sees
+## the same load however many monitors there are.
+
+import sys, getopt, os, time, threading, traceback, Queue
+from lsa_receiver import *
+from lib.ospfv3 import *
+from lib.api import Api
+from lib.aggregate import Aggregator, fromPayload
+
+#-------------------------------------------------------------------------------
+
+EXPIRE_INTERVAL = 10            # seconds between expire() passes
+QUEUE_LEN       = 10000         # messages waiting for the exporter
+POST_WAIT       = 1.0           # seconds a post waits on a full queue
+RETRY           = 0.05          # seconds between offers to a full queue
+
+def usage():
+
+    print """Usage: %s [ options ] <OSPF listener's host> <OSPF listener's port number>
+       %s [ options ] -t unix <OSPF listener's socket path>
+    -h|--help                   : Help
+    -q|--quiet                  : Be quiet
+    -v|--verbose                : Be verbose
+    -H|--http <addr>            : Take monitor posts (/ospf_monitor/lsa_put)
+                                  on tcp:host:port or unix:path
+    -S|--stream <addr>          : Take monitor streams (lib/stream.py) on
+                                  tcp:host:port or unix:path
+    -e|--encoding json|bin      : Export encoding; bin needs the monitors to
+                                  export bin too [def: json]
+    -t|--transport http|tcp|unix: Export transport [def: http]
+    -s|--spool <dir>            : Spool exports to disk while the collector is
+                                  unreachable (lib/spool.py)
+    -r|--rate <n>               : Spool replay rate, records/s [def: %d]
+    -a|--api <addr>             : Serve /arrivals, per source arrival times
+                                  of each LSA, on tcp:host:port or unix:path""" %\
+        (os.path.basename(sys.argv[0]), os.path.basename(sys.argv[0]),
+         DEFAULT_DRAIN_RATE)
+    sys.exit(1)
+
+#-------------------------------------------------------------------------------
+
+class Intake:
+
+    ## what the monitors send, from any number of server threads, goes
+    ## through the aggregator and onto one queue for the exporter.  A full
+    ## queue pushes back: a post waits a while, then is refused so the
+    ## monitor spools it; a stream waits, and so stops acking.  With raw,
+    ## for a bin export, what carries no raw message (a JSON export) is
+    ## refused before the aggregator records any of it
+
+    def __init__(self, agg, verbose=1, raw=False):
+
+        self.agg     = agg
+        self.raw     = raw
+        self.queue   = Queue.Queue(QUEUE_LEN)
+        self.verbose = verbose
+        self.faults  = 0
+        self.refused = 0
+
+    def offer(self, rv):
+
+        try:
+            self.queue.put_nowait(rv)
+        except Queue.Full:
+            return False
+        return True
+
+    def add(self, source, payload, wait=None):
+
+        ## -> 200, 400 for a bad export (or one that cannot go out), or 503
+        ## when the exporter stayed backed up for wait seconds (None: as
+        ## long as it takes)
+        try:
+            msgs = fromPayload(payload)
+        except Exception, e:
+            self.faults += 1
+            if self.verbose > 0: print "[ *** bad export from %s: %s *** ]" % (source, e)
+            return 400
+        if self.raw and [ m for m in msgs if m[1] is None ]:
+            self.faults += 1
+            if self.verbose > 0: print "[ *** JSON export from %s cannot go out as bin *** ]" % source
+            return 400
+
+        ## what was queued before a refusal is a duplicate when resent
+        deadline = wait is not None and time.time() + wait
+        for (msg, raw) in msgs:
+            while self.agg.add(source, msg, raw, put=self.offer) is False:
+                if deadline and time.time() > deadline:
+                    self.refused += 1
+                    return 503
+                time.sleep(RETRY)
+        return 200
+
+    def post(self, h, body):
+
+        ## the source of a post is the monitor's address
+        rv = self.add(h.address_string(), body, POST_WAIT)
+        if rv == 200: h.reply(200, {})
+        elif rv == 400: h.reply(400, { "ERROR": "bad export" })
+        else: h.reply(503, { "ERROR": "export queue full" })
+
+    def stream(self, session, seq, payload):
+
+        ## the source of a stream is its session
+        self.add("%016x" % session, payload)
+
+################################################################################
+
+if __name__ == "__main__":
+
+    VERBOSE   = 1
+    HTTP      = None
+    STREAM    = None
+    ENCODING  = "json"
+    TRANSPORT = "http"
+    SPOOL     = None
+    RATE      = DEFAULT_DRAIN_RATE
+    API       = None
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hqvH:S:e:t:s:r:a:",
+                                   ("help", "quiet", "verbose", "http=",
+                                    "stream=", "encoding=", "transport=",
+                                    "spool=", "rate=", "api=", ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-q', '--quiet'):
+            VERBOSE = 0
+
+        elif x in ('-v', '--verbose'):
+            VERBOSE = 2
+
+        elif x in ('-H', '--http'):
+            HTTP = y
+
+        elif x in ('-S', '--stream'):
+            STREAM = y
+
+        elif x in ('-e', '--encoding'):
+            if y not in CODECS: usage()
+            ENCODING = y
+
+        elif x in ('-t', '--transport'):
+            if y not in ("http", "tcp", "unix"): usage()
+            TRANSPORT = y
+
+        elif x in ('-s', '--spool'):
+            SPOOL = y
+
+        elif x in ('-r', '--rate'):
+            RATE = float(y)
+
+        elif x in ('-a', '--api'):
+            API = y
+
+    if not (HTTP or STREAM): usage()
+
+    spool = None
+    if SPOOL: spool = Spool(SPOOL)
+    if TRANSPORT == "unix":
+        if len(args) != 1: usage()
+        lsar = StreamLSAR("unix:%s" % args[0], CODECS[ENCODING](),
+                          spool=spool, rate=RATE)
+    else:
+        if len(args) != 2: usage()
+        if TRANSPORT == "tcp":
+            lsar = StreamLSAR("tcp:%s:%d" % (args[0], int(args[1])), CODECS[ENCODING](),
+                              spool=spool, rate=RATE)
+        else:
+            lsar = LSAR(args[0], int(args[1]), CODECS[ENCODING](), spool, RATE)
+
+    #---------------------------------------------------------------------------
+
+    agg    = Aggregator()
+    intake = Intake(agg, VERBOSE, ENCODING == "bin")
+
+    if HTTP:
+        hapi = Api(HTTP, None, VERBOSE, routes={})
+        hapi.post("/ospf_monitor/lsa_put", intake.post)
+        hapi.start()
+        if VERBOSE > 0: print "monitor posts on %s" % HTTP
+
+    coll = None
+    if STREAM:
+        coll = StreamCollector(STREAM, intake.stream)
+        t = threading.Thread(target=coll.serve)
+        t.setDaemon(True)
+        t.start()
+        if VERBOSE > 0: print "monitor streams on %s" % (coll.name(), )
+
+    if API:
+        api = Api(API, None, VERBOSE, routes={ "/arrivals": agg.handle })
+        api.route("/stats", lambda h, qs: h.reply(200, {
+            "SOURCES": agg.sources, "LSAS": len(agg), "IN": agg.lsas,
+            "OUT": agg.passed, "HELLOS_IN": agg.hellos, "HELLOS_OUT": agg.hpassed,
+            "FAULTS": intake.faults, "REFUSED": intake.refused }))
+        api.start()
+        if VERBOSE > 0: print "aggregator API on %s" % API
+
+    try:
+        expired = time.time()
+        while 1:
+
+            ## one exporter: LSAR and its spool are not thread safe
+            try:
+                (msg, raw) = intake.queue.get(True, 1)
+            except Queue.Empty:
+                msg = None
+
+            if time.time() - expired > EXPIRE_INTERVAL:
+                agg.expire() ; expired = time.time()
+                if VERBOSE > 1: print agg
+            if msg is None: continue
+
+            try:
+                lsar.export(msg, raw, VERBOSE, 0)
+            except Exception, e:
+                if VERBOSE > 1: traceback.print_exc()
+                print "[ *** export: %s: %s *** ]" % (e.__class__.__name__, e)
+
+    except (KeyboardInterrupt):
+        if coll is not None: coll.stop()
+        if spool is not None: spool.close()
+        if VERBOSE > 0: print agg
+        sys.exit(1)
@@ -0,0 +1,566 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     adj: optional adjacency mode -- hellos, database exchange and
+##     LS requests, so the monitor pulls the whole LSDB at startup
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## A Speaker runs on one interface and keeps an Adj per neighbour, driven
+## through the RFC 2328 section 10 states (RFC 5340 packet formats):
+##
+##   DOWN -> INIT -> 2WAY -> EXSTART -> EXCHANGE -> LOADING -> FULL
+##
+## The monitor takes part with priority 0, so it is never elected, and
+## with the R-bit clear, so no router will route through it.  It forms
+## adjacencies with the DR and BDR (or every neighbour, on point-to-point
+## links), describes an empty database, requests everything the
+## neighbour describes that the LSDB lacks or holds an older copy of, and
+## acknowledges every LSUPD it receives.  It never floods.
+##
+## The hello and dead intervals and the area are taken from the first
+## hello heard unless given.  Received LSUPDs are applied to the LSDB by
+## the caller, as in passive mode; handle() only drives the adjacency.
+##
+## With advertise set the Speaker instead describes its LSDB and answers
+## LS requests from it: that is the stand-in router of the __main__
+## block, not something the monitor does.
+
+import os, socket, struct, time, collections, itertools
+
+from ospfv3 import *
+from lsdb import lsaKey, lsaCompare, MAX_AGE
+from codec import splitLsas
+
+#-------------------------------------------------------------------------------
+
+ALLSPFROUTERS = "ff02::5"
+ALLDROUTERS   = "ff02::6"
+
+NBR_STATES = { 0: "DOWN",
+               1: "INIT",
+               2: "2WAY",
+               3: "EXSTART",
+               4: "EXCHANGE",
+               5: "LOADING",
+               6: "FULL",
+               }
+for k in NBR_STATES.keys(): NBR_STATES[ NBR_STATES[k] ] = k
+
+DD_INIT   = 0x04
+DD_MORE   = 0x02
+DD_MASTER = 0x01
+
+OPT_V6 = 0x01
+OPT_E  = 0x02
+OPT_R  = 0x10
+
+MONITOR_OPTS  = OPT_V6 | OPT_E          # R clear: never a transit router
+
+DEFAULT_HELLO = 10                      # seconds
+DEFAULT_DEAD  = 40
+RXMT_INTERVAL = 5
+
+def ifMtu(ifname):
+
+    return int(open("/sys/class/net/%s/mtu" % ifname).read())
+
+################################################################################
+
+class Adj:
+
+    def __init__(self, spk, rid, src, now):
+
+        self._spk     = spk
+        self.rid      = rid
+        self.src      = src
+        self.state    = NBR_STATES["DOWN"]
+        self.prio     = 0
+        self.ts       = now
+        self.started  = None
+        self.full     = None
+
+        self._master  = 0
+        self._ddseqno = 0
+        self._last    = None            # last DBDesc sent, for retransmission
+        self._more    = 0               # its M-bit
+        self._rxmt    = 0
+        self._summary = []              # raw LSA headers still to describe
+        self._reqs    = collections.OrderedDict()
+        self._sent    = set()           # requested, not yet received
+
+    def __repr__(self):
+
+        return "adjacency %s (%s): %s, requests:%d" %(
+            id2str(self.rid), self.src, NBR_STATES[self.state], len(self._reqs))
+
+    def setState(self, state, now):
+
+        if self._spk._verbose > 0:
+            print "%s: %s -> %s" % (id2str(self.rid), NBR_STATES[self.state],
+                                    NBR_STATES[state])
+        self.state = state
+        if state == NBR_STATES["EXSTART"]: self.started = now
+        if state == NBR_STATES["FULL"]:    self.full = now
+
+    def reset(self, state, now):
+
+        self._summary = [] ; self._reqs.clear() ; self._sent.clear()
+        self.setState(state, now)
+
+    #---------------------------------------------------------------------------
+
+    def hello(self, v, src, now):
+
+        self.ts = now ; self.src = src ; self.prio = v["PRIO"]
+
+        if self.state == NBR_STATES["DOWN"]:
+            self.setState(NBR_STATES["INIT"], now)
+
+        if self._spk._rid not in v["NBORS"]:
+            if self.state >= NBR_STATES["2WAY"]:
+                self.reset(NBR_STATES["INIT"], now)
+            return
+
+        if self.state == NBR_STATES["INIT"]:
+            self.setState(NBR_STATES["2WAY"], now)
+        if self.state == NBR_STATES["2WAY"] and self._spk.wantAdj(self):
+            self.exstart(now)
+
+    def exstart(self, now):
+
+        self.reset(NBR_STATES["EXSTART"], now)
+        self._master  = 1
+        self._ddseqno = int(now) & 0xffffffff
+        self._summary = self._spk.summary()
+        self.sendDesc(DD_INIT | DD_MORE | DD_MASTER, [], now)
+
+    def sendDesc(self, flags, hdrs, now):
+
+        self._last = mkDesc(self._spk._opts, self._spk._mtu, flags, self._ddseqno, hdrs)
+        self._more = flags & DD_MORE
+        self._rxmt = now + RXMT_INTERVAL
+        self._spk.send(MSG_TYPES["DBDESC"], self._last, self.src)
+
+    def nextDesc(self, flags, now):
+
+        n = self._spk.descMax()
+        hdrs = self._summary[:n] ; self._summary = self._summary[n:]
+        if self._summary: flags |= DD_MORE
+        self.sendDesc(flags, hdrs, now)
+
+    #---------------------------------------------------------------------------
+
+    def desc(self, v, now):
+
+        ## RFC 2328 10.6
+        flags = (v["INIT"] << 2) | (v["MORE"] << 1) | v["MASTERSLAVE"]
+        seq   = v["DDSEQNO"]
+
+        if self.state < NBR_STATES["EXSTART"]:
+            return
+
+        if self.state == NBR_STATES["EXSTART"]:
+            if flags == DD_INIT | DD_MORE | DD_MASTER and not v["LSAS"] and\
+                   self.rid > self._spk._rid:
+                self._master = 0 ; self._ddseqno = seq
+                self.setState(NBR_STATES["EXCHANGE"], now)
+                self.nextDesc(0, now)
+                return
+
+            if flags & (DD_INIT | DD_MASTER) or seq != self._ddseqno or\
+                   self.rid > self._spk._rid:
+                return
+            self.setState(NBR_STATES["EXCHANGE"], now)
+
+        elif self.state > NBR_STATES["EXCHANGE"]:
+            ## exchange over: the slave answers the master's retransmissions,
+            ## anything else restarts it
+            if not self._master and flags & DD_MASTER and seq == self._ddseqno:
+                self._spk.send(MSG_TYPES["DBDESC"], self._last, self.src)
+            elif flags & DD_INIT:
+                self.exstart(now)
+            return
+
+        if self._master:
+            if flags & DD_MASTER or flags & DD_INIT:
+                self.exstart(now)
+            elif seq == self._ddseqno:
+                self.describe(v["LSAS"])
+                if not self._more and not flags & DD_MORE:
+                    self.exchangeDone(now)
+                else:
+                    self._ddseqno = (self._ddseqno + 1) & 0xffffffff
+                    self.nextDesc(DD_MASTER, now)
+            elif seq != (self._ddseqno - 1) & 0xffffffff:
+                self.exstart(now)
+
+        else:
+            if flags & DD_MASTER and seq == self._ddseqno:
+                self._spk.send(MSG_TYPES["DBDESC"], self._last, self.src)
+            elif flags & DD_INIT or not flags & DD_MASTER:
+                self.exstart(now)
+            elif seq == (self._ddseqno + 1) & 0xffffffff:
+                self._ddseqno = seq
+                self.describe(v["LSAS"])
+                self.nextDesc(0, now)
+                if not flags & DD_MORE and not self._more:
+                    self.exchangeDone(now)
+            else:
+                self.exstart(now)
+
+    def describe(self, hdrs):
+
+        ## queue a request for every described LSA we lack, or hold an
+        ## older instance of
+        snap = self._spk._lsdb.snapshot()
+        for cnt in sorted(hdrs.keys()):
+            hdr = hdrs[cnt]
+            cur = snap.get(lsaKey(self._spk._aid, hdr))
+            if cur is None:
+                if hdr["AGE"] >= MAX_AGE: continue
+            elif lsaCompare(hdr, cur["H"]) <= 0:
+                continue
+            self._reqs[(hdr["T"], hdr["LSID"], hdr["ADVRTR"])] = hdr
+
+    def exchangeDone(self, now):
+
+        if self._reqs:
+            self.setState(NBR_STATES["LOADING"], now)
+            self.sendReq(now)
+        else:
+            self.setState(NBR_STATES["FULL"], now)
+
+    #---------------------------------------------------------------------------
+
+    def sendReq(self, now):
+
+        if not self._sent:
+            self._sent = set(itertools.islice(self._reqs, self._spk.reqMax()))
+        self._rxmt = now + RXMT_INTERVAL
+        self._spk.send(MSG_TYPES["LSREQ"], mkLsReq(self._sent), self.src)
+
+    def lsreq(self, v, now):
+
+        if self.state < NBR_STATES["EXCHANGE"]: return
+
+        snap = self._spk._lsdb.snapshot() ; lsas = []
+        for r in v["REQS"]:
+            e = snap.get((self._spk._aid, r["T"], r["LSID"], r["ADVRTR"]))
+            if e is None:
+                ## BadLSReq
+                self.exstart(now)
+                return
+            lsas.append(e["RAW"])
+
+        self._spk.sendLsas(lsas, self.src)
+
+    def lsupd(self, h, raw, now):
+
+        if self.state < NBR_STATES["EXCHANGE"]: return
+
+        lsas = h["V"]["LSAS"]
+        raws = splitLsas(raw[OSPFV3_HDR_LEN+OSPFV3_LSUPD_LEN:h["LEN"]])
+        acks = []
+        for cnt in sorted(lsas.keys()):
+            hdr = lsas[cnt]["H"]
+            k   = (hdr["T"], hdr["LSID"], hdr["ADVRTR"])
+            req = self._reqs.get(k)
+            if req is not None and lsaCompare(hdr, req) >= 0:
+                del self._reqs[k]
+                self._sent.discard(k)
+            acks.append(raws[cnt-1][:OSPFV3_LSAHDR_LEN])
+
+        ## direct acknowledgement (RFC 2328 13.5)
+        if acks: self._spk.send(MSG_TYPES["LSACK"], "".join(acks), self.src)
+
+        if self.state == NBR_STATES["LOADING"]:
+            if not self._reqs:
+                self.setState(NBR_STATES["FULL"], now)
+            elif not self._sent:
+                self.sendReq(now)
+
+    def tick(self, now):
+
+        ## -> 0 once the neighbour is dead
+        if now - self.ts > self._spk._dead: return 0
+
+        if now >= self._rxmt:
+            if self.state == NBR_STATES["EXSTART"] or\
+                   (self.state == NBR_STATES["EXCHANGE"] and self._master):
+                self._rxmt = now + RXMT_INTERVAL
+                self._spk.send(MSG_TYPES["DBDESC"], self._last, self.src)
+            elif self.state == NBR_STATES["LOADING"]:
+                self.sendReq(now)
+
+        return 1
+
+################################################################################
+
+class Speaker:
+
+    def __init__(self, ospf, ifname, rid, lsdb, aid=None, instanceid=0,
+                 prio=0, p2p=0, advertise=0, hello=None, dead=None, verbose=1):
+
+        self._ospf      = ospf
+        self._ifname    = ifname
+        self._ifindex   = ifIndex(ifname)
+        self._mtu       = ifMtu(ifname)
+        self._rid       = rid
+        self._lsdb      = lsdb
+        self._aid       = aid
+        self._iid       = instanceid
+        self._prio      = prio
+        self._p2p       = p2p
+        self._advertise = advertise
+        self._opts      = advertise and MONITOR_OPTS | OPT_R or MONITOR_OPTS
+        self._hello     = hello
+        self._dead      = dead
+        self._verbose   = verbose
+
+        ## a stand-in router with priority elects itself; the monitor
+        ## learns the DR and BDR from the hellos it hears
+        self._desig     = prio and rid or 0
+        self._bdesig    = 0
+
+        self._adjs       = ospf._adjs
+        self._next_hello = 0
+
+        sock = ospf.sock(self._ifindex)
+        for g in (ALLSPFROUTERS, ALLDROUTERS):
+            mreq = socket.inet_pton(socket.AF_INET6, g) + struct.pack("@I", self._ifindex)
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_JOIN_GROUP, mreq)
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_LOOP, 0)
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_HOPS, 1)
+
+    def __repr__(self):
+
+        rs = "OSPFv3 speaker on %s (%d), rtr id:%s, area:%s, prio:%d, mtu:%d" %(
+            self._ifname, self._ifindex, id2str(self._rid),
+            self._aid is None and "?" or id2str(self._aid), self._prio, self._mtu)
+        for a in self._adjs.values():
+            rs += "\n" + INDENT + repr(a)
+        return rs
+
+    #---------------------------------------------------------------------------
+
+    def send(self, typ, body, dst):
+
+        self._ospf.sendMsg(mkOspfMsg(typ, body, self._rid, self._aid or 0, self._iid),
+                           dst, self._ifindex, self._verbose, 1)
+
+    def sendHello(self, now):
+
+        self._next_hello = now + (self._hello or DEFAULT_HELLO)
+        if self._hello is None: return
+
+        self.send(MSG_TYPES["HELLO"],
+                  mkHello(self._ifindex, self._prio, self._opts, self._hello,
+                          self._dead, self._desig, self._bdesig,
+                          [ a.rid for a in self._adjs.values() ]),
+                  ALLSPFROUTERS)
+
+    def sendLsas(self, lsas, dst):
+
+        room = self._mtu - IPV6_HDR_LEN - OSPFV3_HDR_LEN - OSPFV3_LSUPD_LEN
+        chunk = [] ; l = 0
+        for lsa in lsas:
+            if chunk and l + len(lsa) > room:
+                self.send(MSG_TYPES["LSUPD"], mkLsUpd(chunk), dst)
+                chunk = [] ; l = 0
+            chunk.append(lsa) ; l += len(lsa)
+        if chunk: self.send(MSG_TYPES["LSUPD"], mkLsUpd(chunk), dst)
+
+    def descMax(self):
+
+        return (self._mtu - IPV6_HDR_LEN - OSPFV3_HDR_LEN - OSPFV3_DESC_LEN) / OSPFV3_LSAHDR_LEN
+
+    def reqMax(self):
+
+        return (self._mtu - IPV6_HDR_LEN - OSPFV3_HDR_LEN) / OSPFV3_LSREQ_LEN
+
+    def summary(self):
+
+        if not self._advertise: return []
+        return [ e["RAW"][:OSPFV3_LSAHDR_LEN]
+                 for e in self._lsdb.snapshot().lsas.itervalues() if e["AID"] == self._aid ]
+
+    def wantAdj(self, adj):
+
+        return self._p2p or self._rid == self._desig or\
+               adj.rid in (self._desig, self._bdesig)
+
+    #---------------------------------------------------------------------------
+
+    def handle(self, rv, raw, src, now=None):
+
+        ## one received message: parsed, raw, and its recvfrom() address;
+        ## anything for another interface, area or instance is ignored
+        if rv is None or src is None: return
+        if now is None: now = time.time()
+        if len(src) > 3 and src[3] and src[3] != self._ifindex: return
+
+        h = rv["V"]
+        if h["RID"] == self._rid or h["INSTANCEID"] != self._iid: return
+        typ = MSG_TYPES.get(rv["T"])
+
+        if typ == "HELLO":
+            self.hello(h, src[0], now)
+            return
+
+        adj = self._adjs.get(h["RID"])
+        if adj is None or h["AID"] != self._aid: return
+
+        if   typ == "DBDESC": adj.desc(h["V"], now)
+        elif typ == "LSREQ":  adj.lsreq(h["V"], now)
+        elif typ == "LSUPD":  adj.lsupd(h, raw, now)
+
+    def hello(self, h, src, now):
+
+        v = h["V"]
+        if self._aid is None: self._aid = h["AID"]
+        if self._hello is None:
+            (self._hello, self._dead) = (v["HELLO"], v["DEAD"])
+            self._next_hello = now
+
+        ## RFC 2328 10.5: a mismatched hello is dropped
+        if h["AID"] != self._aid or v["HELLO"] != self._hello or v["DEAD"] != self._dead:
+            if self._verbose > 1:
+                print "[ *** hello mismatch from %s *** ]" % id2str(h["RID"])
+            return
+
+        if v["PRIO"] > 0 and not self._prio:
+            (self._desig, self._bdesig) = (v["DESIG"], v["BDESIG"])
+
+        adj = self._adjs.get(h["RID"])
+        if adj is None:
+            adj = self._adjs[h["RID"]] = Adj(self, h["RID"], src, now)
+            self._next_hello = now
+        adj.hello(v, src, now)
+
+    def tick(self, now=None):
+
+        ## timers: hellos, retransmissions, dead neighbours
+        if now is None: now = time.time()
+
+        for (rid, adj) in self._adjs.items():
+            if not adj.tick(now):
+                if self._verbose > 0: print "%s: dead" % id2str(rid)
+                del self._adjs[rid]
+
+        if now >= self._next_hello: self.sendHello(now)
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import sys, getopt, select
+    from lsdb import Lsdb
+
+    VERBOSE = 1
+    RID     = None
+    AID     = 0
+    NLSAS   = 0
+
+    def usage():
+
+        print """Usage: %s [ options ] <interface>
+        -h|--help            : Help
+        -q|--quiet           : Be quiet
+        -v|--verbose         : Be verbose
+        -r|--router-id <id>  : Router ID [*]
+        -a|--area <id>       : Area [def: 0.0.0.0]
+        -p|--peer <n>        : Act as a stand-in router holding n synthetic
+                               router LSAs; otherwise form an adjacency as the
+                               monitor does and time the database exchange
+
+    Between two network namespaces joined by a veth pair:
+
+        ip netns add a ; ip netns add b
+        ip link add va netns a type veth peer name vb netns b
+        ip -n a link set va up ; ip -n b link set vb up
+        ip netns exec a %s -r 2.2.2.2 -p 100000 va &
+        ip netns exec b %s -r 1.1.1.1 vb""" %\
+            ((os.path.basename(sys.argv[0]), ) * 3)
+        sys.exit(0)
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hqvr:a:p:",
+                                   ("help", "quiet", "verbose", "router-id=",
+                                    "area=", "peer=", ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-q', '--quiet'):
+            VERBOSE = 0
+
+        elif x in ('-v', '--verbose'):
+            VERBOSE = 2
+
+        elif x in ('-r', '--router-id'):
+            RID = str2id(y)
+
+        elif x in ('-a', '--area'):
+            AID = str2id(y)
+
+        elif x in ('-p', '--peer'):
+            NLSAS = int(y)
+
+    if len(args) != 1 or RID is None: usage()
+
+    lsdb = Lsdb()
+    if NLSAS:
+        body = struct.pack(OSPFV3_LSARTR, 0, "\x00\x00\x13") +\
+               struct.pack(OSPFV3_LSARTR_INTERFACE, 1, 0, 10, 1, 1, 1)
+        for r in xrange(1, NLSAS + 1, 100):
+            lsas = [ mkLsa(0x2001, 0, x, 0x80000001, body, 1)
+                     for x in xrange(r, min(r + 100, NLSAS + 1)) ]
+            raw  = mkOspfMsg(MSG_TYPES["LSUPD"], mkLsUpd(lsas), RID, AID)
+            lsdb.update(parseOspfMsg(raw, 0), raw)
+
+    ospf = Ospfv3("::")
+    spk  = Speaker(ospf, args[0], RID, lsdb, AID, prio=NLSAS and 1 or 0,
+                   advertise=NLSAS and 1 or 0,
+                   hello=DEFAULT_HELLO, dead=DEFAULT_DEAD, verbose=VERBOSE)
+    if VERBOSE > 0: print spk ; print lsdb
+
+    try:
+        while 1:
+            rfds, _, _ = select.select([ospf], [], [], 0.1)
+            now = time.time()
+            if rfds:
+                rv = ospf.parseMsg(VERBOSE - 1, 0)
+                if rv is not None and MSG_TYPES.get(rv["T"]) == "LSUPD" and not NLSAS:
+                    lsdb.update(rv, ospf._rcvd, now)
+                spk.handle(rv, ospf._rcvd, ospf._src, now)
+            spk.tick(now)
+
+            if not NLSAS:
+                for a in spk._adjs.values():
+                    if a.full:
+                        print "FULL with %s: %d LSAs in %.2fs" %(
+                            id2str(a.rid), len(lsdb), a.full - a.started)
+                        sys.exit(0)
+
+    except (KeyboardInterrupt):
+        ospf.close()
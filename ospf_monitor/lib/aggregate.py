@@ -0,0 +1,275 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     aggregate: merge the exports of several monitors into one change
+##     stream
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## Every monitor in an area hears the same flooding, so the collector
+## would get each LSA once per monitor.  The Aggregator keeps, per LSA
+## (lsdb.lsaKey), the newest instance any monitor has reported and, for
+## that instance, when each monitor reported it -- a vector of arrival
+## times, one entry per source.  An LSUPD is passed on holding only the
+## LSAs that are newer (RFC 2328 13.1, lsdb.lsaCompare) than that; an
+## instance already passed on just gets the new arrival recorded.  A
+## hello is passed on when it differs from the last one passed on for
+## that (area, router, interface), or half its hello interval later, so
+## routers heard by several monitors are not reported several times.
+##
+## What goes out is the monitor's own message, cut down: same header,
+## same TS, IFINDEX and SRC, plus MONITOR, the source that reported it
+## first.  With the raw bytes at hand (binary records) the raw message is
+## rebuilt too, so either codec can carry it on.
+##
+## An instance counts as passed on only once it is: add() can hand what
+## is to go out to put() under its lock, and if that refuses -- the
+## exporter is backed up -- records nothing, so the same message offered
+## again later, or by another monitor, still goes out.
+##
+## Memory is one entry per LSA, as in the LSDB; flushed (MaxAge) LSAs are
+## dropped by expire() once no monitor can still be reporting them.
+
+import struct, time, threading
+
+from ospfv3 import *
+from lsdb import lsaKey, lsaCompare, MAX_AGE
+from codec import splitLsas, decodeRecord, fromJson, REC_LEN_SZ
+
+#-------------------------------------------------------------------------------
+
+FLUSH_HOLD = 60                 # seconds a flushed LSA is remembered
+
+class AggregateExc(Exception): pass
+
+def fromRecord(rec):
+
+    ## a decoded binary record -> (parsed message, raw message)
+    typ = rec["T"]
+    if typ == MSG_TYPES["LSUPD"]:
+        body = mkLsUpd(rec["ITEMS"])
+    elif typ == MSG_TYPES["LSACK"]:
+        body = "".join(rec["ITEMS"])
+    else:
+        body = rec["ITEMS"] and rec["ITEMS"][0] or ""
+
+    raw = mkOspfMsg(typ, body, rec["RID"], rec["AID"])
+    rv  = parseOspfMsg(raw, 0)
+    rv["TS"] = rec["TS"]
+    return (rv, raw)
+
+def fromPayload(payload):
+
+    ## one export, as posted or streamed by a monitor -> [(msg, raw)]
+    if payload[:1] == "{":
+        return [ (fromJson(payload), None) ]
+
+    rv = [] ; off = 0
+    while off + REC_LEN_SZ <= len(payload):
+        (rec, off) = decodeRecord(payload, off)
+        rv.append(fromRecord(rec))
+    return rv
+
+################################################################################
+
+class Aggregator:
+
+    def __init__(self):
+
+        self._lsas   = {}       # lsaKey: { "H", "ORIGIN", "ARRIVALS": { source: ts } }
+        self._hellos = {}       # (aid, rid, interface id): (hello, passed on at)
+        self._lock   = threading.Lock()
+
+        self.sources = {}       # source: counters
+        self.lsas    = 0        # LSAs received
+        self.passed  = 0        # LSAs passed on
+        self.hellos  = 0        # hellos received
+        self.hpassed = 0        # hellos passed on
+
+    def __repr__(self):
+
+        return "aggregator: %d sources, %d LSAs held, LSAs %d in/%d out, hellos %d in/%d out" %(
+            len(self.sources), len(self._lsas), self.lsas, self.passed,
+            self.hellos, self.hpassed)
+
+    def __len__(self):
+
+        return len(self._lsas)
+
+    #---------------------------------------------------------------------------
+
+    def add(self, source, msg, raw=None, now=None, put=None):
+
+        ## -> (msg, raw) to pass on, or None if there is nothing new in it.
+        ## With put, that is first handed to put((msg, raw)); if put
+        ## returns false nothing at all is recorded and add returns False
+        if now is None: now = time.time()
+        self._lock.acquire()
+        try:
+            typ = MSG_TYPES.get(msg["T"])
+            if typ == "LSUPD": rv = self.lsupd(source, msg, raw, msg.get("TS", now), put)
+            elif typ == "HELLO": rv = self.hello(source, msg, raw, now, put)
+            else: rv = None
+            if rv is False: return False
+
+            s = self.sources.setdefault(source, { "MSGS": 0, "LSAS": 0, "NEW": 0, "LAST": 0 })
+            s["MSGS"] += 1 ; s["LAST"] = now
+            if typ == "LSUPD":
+                n = len(msg["V"]["V"]["LSAS"]) ; s["LSAS"] += n ; self.lsas += n
+                if rv is not None: s["NEW"] += rv[0]["V"]["V"]["NLSAS"]
+            return rv
+        finally:
+            self._lock.release()
+
+    def lsupd(self, source, msg, raw, ts, put):
+
+        aid  = msg["V"]["AID"]
+        lsas = msg["V"]["V"]["LSAS"]
+        keys = sorted(lsas.keys(), key=int)
+        raws = raw and splitLsas(raw[OSPFV3_HDR_LEN + OSPFV3_LSUPD_LEN:msg["V"]["LEN"]])
+
+        new = [] ; same = []
+        for (i, k) in enumerate(keys):
+            hdr = lsas[k]["H"] ; key = lsaKey(aid, hdr)
+            e = self._lsas.get(key)
+            if e is None or lsaCompare(hdr, e["H"]) > 0:
+                new.append(i)
+            elif lsaCompare(hdr, e["H"]) == 0 and source not in e["ARRIVALS"]:
+                same.append(e)
+
+        rv = None
+        if new:
+            out = dict(msg) ; hdr = dict(msg["V"])
+            hdr["V"] = { "NLSAS" : len(new),
+                         "LSAS"  : dict([ (j + 1, lsas[keys[i]]) for (j, i) in enumerate(new) ]),
+                         }
+            out["V"] = hdr ; out["MONITOR"] = source
+            if raw is not None:
+                raw = mkOspfMsg(msg["T"], mkLsUpd([ raws[i] for i in new ]),
+                                hdr["RID"], aid, hdr.get("INSTANCEID", 0))
+                hdr["LEN"] = len(raw)
+            rv = (out, raw)
+            if put is not None and not put(rv): return False
+
+        for i in new:
+            hdr = lsas[keys[i]]["H"]
+            self._lsas[lsaKey(aid, hdr)] = { "H": hdr, "ORIGIN": source, "ARRIVALS": { source: ts } }
+        for e in same:
+            e["ARRIVALS"][source] = ts
+        self.passed += len(new)
+        return rv
+
+    def hello(self, source, msg, raw, now, put):
+
+        h = msg["V"] ; v = h["V"]
+        key  = (h["AID"], h["RID"], v["INTERFACEID"])
+        last = self._hellos.get(key)
+        if last is not None and last[0] == v and now - last[1] < v["HELLO"] / 2.0:
+            self.hellos += 1
+            return None
+
+        out = dict(msg) ; out["MONITOR"] = source
+        if put is not None and not put((out, raw)): return False
+        self._hellos[key] = (v, now)
+        self.hellos += 1 ; self.hpassed += 1
+        return (out, raw)
+
+    #---------------------------------------------------------------------------
+
+    def expire(self, now=None):
+
+        ## forget flushed LSAs, and routers no longer heard
+        if now is None: now = time.time()
+        self._lock.acquire()
+        try:
+            gone = [ k for (k, e) in self._lsas.iteritems()
+                     if e["H"]["AGE"] >= MAX_AGE and
+                        now - min(e["ARRIVALS"].values()) > FLUSH_HOLD ]
+            for k in gone: del self._lsas[k]
+            for (k, (v, t)) in self._hellos.items():
+                if now - t > v["DEAD"]: del self._hellos[k]
+            return len(gone)
+        finally:
+            self._lock.release()
+
+    def arrivals(self, advrtr=None):
+
+        ## -> [ instance with its per source arrival times ], newest first
+        self._lock.acquire()
+        try:
+            rv = []
+            for ((aid, t, lsid, adv), e) in self._lsas.iteritems():
+                if advrtr is not None and adv != advrtr: continue
+                first = min(e["ARRIVALS"].values())
+                rv.append({ "AID"      : aid,
+                            "T"        : t,
+                            "LSID"     : lsid,
+                            "ADVRTR"   : adv,
+                            "LSSEQNO"  : e["H"]["LSSEQNO"],
+                            "ORIGIN"   : e["ORIGIN"],
+                            "ARRIVALS" : dict([ (src, ts - first)
+                                                for (src, ts) in e["ARRIVALS"].items() ]),
+                            "TS"       : first,
+                            })
+        finally:
+            self._lock.release()
+
+        rv.sort(key=lambda x: -x["TS"])
+        return rv
+
+    def handle(self, h, qs):
+
+        ## API route handler: GET /arrivals[?advrtr=a.b.c.d&limit=n]
+        advrtr = "advrtr" in qs and str2id(qs["advrtr"][0]) or None
+        limit  = int(qs.get("limit", [100])[0])
+        h.reply(200, { "SOURCES"  : self.sources,
+                       "ARRIVALS" : self.arrivals(advrtr)[:limit],
+                       })
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import sys
+    from codec import BinCodec
+
+    ## four monitors each reporting the same LSUPDs, a few ms apart: what
+    ## reaches the collector, and the cost per message
+
+    nrtrs = len(sys.argv) > 1 and int(sys.argv[1]) or 2000
+    body  = struct.pack(OSPFV3_LSARTR, 0, "\x00\x00\x13") +\
+            struct.pack(OSPFV3_LSARTR_INTERFACE, 1, 0, 10, 1, 1, 1)
+    codec = BinCodec() ; recs = []
+    for r in xrange(1, nrtrs + 1, 10):
+        lsas = [ mkLsa(0x2001, 0, x, 0x80000001, body, 1) for x in xrange(r, r + 10) ]
+        raw  = mkOspfMsg(MSG_TYPES["LSUPD"], mkLsUpd(lsas), 1)
+        recs.append(codec.encode(parseOspfMsg(raw, 0), raw, 1000.0 + r))
+
+    agg = Aggregator() ; out = 0 ; t = time.time()
+    for rec in recs:
+        for m in ("node2", "node3", "node4", "node7"):
+            for (msg, raw) in fromPayload(rec):
+                if agg.add(m, msg, raw) is not None: out += 1
+    t = time.time() - t
+
+    print agg
+    print "%d records in, %d out, %.1f us per record" % (
+        4 * len(recs), out, t / (4 * len(recs)) * 1e6)
+    a = agg.arrivals(str2id("0.0.0.1"))[0]
+    print "%s: origin %s, arrivals %s" % (id2str(a["ADVRTR"]), a["ORIGIN"], a["ARRIVALS"])
@@ -0,0 +1,256 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     api: local read API over the monitor's LSDB, on HTTP or a Unix
+##     socket
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## Endpoints:
+##
+##   GET /snapshot[?view=graph]     full LSDB (or router graph) + version
+##   GET /delta?since=<v>[&wait=s]  changes after version v; with wait, long
+##                                  polls up to s seconds for the next one.
+##                                  410 when v is older than the change log
+##   GET /stream?since=<v>          newline-delimited JSON deltas, one line
+##                                  per new version, until the client goes
+##   GET /known                     LSAs known only from DBDesc/LSAck
+##                                  headers, not (yet) held in full
+##   GET /sids                      SRv6 SID table: End SIDs from Locator
+##                                  LSAs, End.X SIDs from E-Router-LSAs
+##
+## A new consumer takes /snapshot, then follows /delta or /stream from the
+## version it returned.
+
+import os, json, socket, threading, urlparse
+import BaseHTTPServer, SocketServer
+
+from lsdb import *
+from stream import parseAddr
+
+#-------------------------------------------------------------------------------
+
+MAX_WAIT    = 300               # seconds, longest long-poll honoured
+STREAM_WAIT = 30                # seconds between /stream keepalive lines
+
+OP_NAMES = OPS
+
+def keyView(key):
+
+    (aid, t, lsid, advrtr) = key
+    return { "AID": aid, "T": t, "LSID": lsid, "ADVRTR": advrtr }
+
+def changeView(change):
+
+    (ver, op, key, entry) = change
+    rv = { "VERSION": ver, "OP": OP_NAMES[op], "KEY": keyView(key) }
+    if entry is not None: rv["LSA"] = lsaView(entry)
+    return rv
+
+################################################################################
+
+class ApiHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    server_version = "ospf_monitor/" + VERSION
+
+    def log_message(self, format, *args):
+
+        if self.server.verbose > 1:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def address_string(self):
+
+        ## Unix-domain peers have no address
+        return self.client_address and str(self.client_address[0]) or "local"
+
+    def reply(self, code, obj):
+
+        data = json.dumps(obj, default=str)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    #---------------------------------------------------------------------------
+
+    def do_GET(self):
+
+        url = urlparse.urlparse(self.path)
+        qs  = urlparse.parse_qs(url.query)
+        handler = self.server.routes.get(url.path)
+        if handler is None:
+            self.reply(404, { "ERROR": "no such endpoint: %s" % url.path })
+            return
+
+        try:
+            handler(self, qs)
+        except (ValueError, KeyError), e:
+            self.reply(400, { "ERROR": "bad request: %s" % e })
+        except socket.error:
+            pass
+
+    def do_POST(self):
+
+        url = urlparse.urlparse(self.path)
+        handler = self.server.posts.get(url.path)
+        if handler is None:
+            self.reply(404, { "ERROR": "no such endpoint: %s" % url.path })
+            return
+
+        try:
+            n = int(self.headers.getheader("Content-Length", 0))
+            handler(self, self.rfile.read(n))
+        except (ValueError, KeyError), e:
+            self.reply(400, { "ERROR": "bad request: %s" % e })
+        except socket.error:
+            pass
+
+    def getSnapshot(self, qs):
+
+        snap = self.server.lsdb.snapshot()
+        if qs.get("view", [""])[0] == "graph":
+            self.reply(200, { "VERSION": snap.version,
+                              "GRAPH": lsdbGraph(snap.lsas.itervalues()) })
+        else:
+            self.reply(200, { "VERSION": snap.version,
+                              "LSAS": [ lsaView(e) for e in snap.lsas.itervalues() ] })
+
+    def getDelta(self, qs):
+
+        since = int(qs["since"][0])
+        wait  = min(float(qs.get("wait", [0])[0]), MAX_WAIT)
+        if wait > 0: self.server.lsdb.wait(since, wait)
+
+        rv = self.server.lsdb.delta(since)
+        if rv is None:
+            self.reply(410, { "ERROR": "version %d no longer in the change log" % since,
+                              "VERSION": self.server.lsdb.version() })
+            return
+
+        (ver, changes) = rv
+        self.reply(200, { "VERSION": ver,
+                          "CHANGES": [ changeView(c) for c in changes ] })
+
+    def getStream(self, qs):
+
+        since = int(qs["since"][0])
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+        while self.server.running:
+            self.server.lsdb.wait(since, STREAM_WAIT)
+            rv = self.server.lsdb.delta(since)
+            if rv is None:
+                self.wfile.write(json.dumps({ "ERROR": "resync",
+                                              "VERSION": self.server.lsdb.version() }) + "\n")
+                return
+
+            (ver, changes) = rv
+            self.wfile.write(json.dumps({ "VERSION": ver,
+                                          "CHANGES": [ changeView(c) for c in changes ] },
+                                        default=str) + "\n")
+            self.wfile.flush()
+            since = ver
+
+    def getKnown(self, qs):
+
+        self.reply(200, { "VERSION": self.server.lsdb.version(),
+                          "KNOWN": [ { "KEY": keyView(key), "H": hdr, "TS": ts }
+                                     for (key, hdr, ts) in self.server.lsdb.known() ] })
+
+    def getSids(self, qs):
+
+        snap = self.server.lsdb.snapshot()
+        self.reply(200, { "VERSION": snap.version,
+                          "SIDS": sidTable(snap.lsas.itervalues()) })
+
+ROUTES = { "/snapshot" : ApiHandler.getSnapshot,
+           "/delta"    : ApiHandler.getDelta,
+           "/stream"   : ApiHandler.getStream,
+           "/known"    : ApiHandler.getKnown,
+           "/sids"     : ApiHandler.getSids,
+           }
+
+#-------------------------------------------------------------------------------
+
+class TcpApiServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads      = True
+    allow_reuse_address = True
+
+class Tcp6ApiServer(TcpApiServer):
+
+    address_family = socket.AF_INET6
+
+class UnixApiServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    daemon_threads = True
+
+################################################################################
+
+class Api:
+
+    def __init__(self, addr, lsdb, verbose=1, routes=ROUTES):
+
+        (family, sockaddr) = parseAddr(addr)
+        if family == socket.AF_UNIX:
+            if os.path.exists(sockaddr): os.unlink(sockaddr)
+            server = UnixApiServer(sockaddr, ApiHandler)
+        elif family == socket.AF_INET6:
+            server = Tcp6ApiServer(sockaddr, ApiHandler)
+        else:
+            server = TcpApiServer(sockaddr, ApiHandler)
+
+        server.lsdb    = lsdb
+        server.verbose = verbose
+        server.routes  = dict(routes)
+        server.posts   = {}
+        server.running = True
+
+        self._server = server
+        self._thread = None
+
+    def __repr__(self):
+
+        return "LSDB API on %s" % (self._server.server_address, )
+
+    def route(self, path, handler):
+
+        ## handler(request handler, query dict) -- lets other modules hang
+        ## their own read endpoints off the same server
+        self._server.routes[path] = handler
+
+    def post(self, path, handler):
+
+        ## handler(request handler, body) for POSTs to path
+        self._server.posts[path] = handler
+
+    def start(self):
+
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def close(self):
+
+        self._server.running = False
+        self._server.shutdown()
+        self._server.server_close()
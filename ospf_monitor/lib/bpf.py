@@ -0,0 +1,233 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     bpf: in-kernel message filter (classic BPF, SO_ATTACH_FILTER)
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## A MsgFilter names the message types, areas and sending routers the
+## monitor wants; any of them left as None means all.  It is compiled to
+## a classic BPF program and attached to the raw sockets, so the kernel
+## drops everything else before it is queued -- no copy, no wakeup, no
+## Python.  A raw IPv6 socket's filter sees the packet from the OSPF
+## header on, the same bytes recvfrom() returns:
+##
+##      ld    len               ; too short to judge: let the parser
+##      jge   #16, 0, accept    ; count it as a fault
+##      ldb   [1]               ; type
+##      jeq   #4, next, 0       ; one test per wanted value ...
+##      jeq   #1, next, reject
+##    next:
+##      ld    [8]               ; area, then [4], router id, alike
+##      ...
+##    accept:
+##      ret   #262144
+##    reject:
+##      ret   #0
+##
+## match() is the same test in Python.  The listener applies it too, to
+## whatever was queued before the filter was attached, and in place of
+## the filter where the kernel will not take one.
+
+import socket, struct, ctypes
+
+from ospfv3 import *
+
+#-------------------------------------------------------------------------------
+
+SO_ATTACH_FILTER = 26
+SO_DETACH_FILTER = 27
+
+BPF_LD   = 0x00 ; BPF_JMP = 0x05 ; BPF_RET = 0x06
+BPF_W    = 0x00 ; BPF_H   = 0x08 ; BPF_B   = 0x10
+BPF_ABS  = 0x20 ; BPF_LEN = 0x80
+BPF_JEQ  = 0x10 ; BPF_JGE = 0x30
+BPF_K    = 0x00
+
+BPF_INSN = "@HBBI"                  # code, jt, jf, k
+BPF_MAXJUMP  = 255
+ACCEPT_BYTES = 0x40000
+
+## (name, offset in the OSPFv3 header, load size)
+FIELDS = ( ("TYPE", 1, BPF_B),
+           ("AID",  8, BPF_W),
+           ("RID",  4, BPF_W),
+           )
+MIN_LEN = OSPFV3_HDR_LEN
+
+class BpfExc(Exception): pass
+
+def insn(code, jt=0, jf=0, k=0):
+
+    return (code, jt, jf, k)
+
+################################################################################
+
+class MsgFilter:
+
+    def __init__(self, types=None, areas=None, routers=None):
+
+        ## sets of message type codes, area ids and router ids, or None
+        self.types   = types   is not None and frozenset(types)   or None
+        self.areas   = areas   is not None and frozenset(areas)   or None
+        self.routers = routers is not None and frozenset(routers) or None
+
+    def __repr__(self):
+
+        show = lambda s, f: s is None and "all" or ",".join(sorted([ f(x) for x in s ]))
+        return "message filter: types:%s, areas:%s, routers:%s" %(
+            show(self.types, lambda t: MSG_TYPES.get(t, str(t))),
+            show(self.areas, id2str), show(self.routers, id2str))
+
+    def __nonzero__(self):
+
+        return not (self.types is None and self.areas is None and self.routers is None)
+
+    def tests(self):
+
+        ## -> [(offset, size, sorted values)] for the fields filtered on
+        sets = { "TYPE": self.types, "AID": self.areas, "RID": self.routers }
+        return [ (off, size, sorted(sets[name])) for (name, off, size) in FIELDS
+                 if sets[name] is not None ]
+
+    #---------------------------------------------------------------------------
+
+    def match(self, msg):
+
+        if len(msg) < MIN_LEN: return True
+        (typ, ) = struct.unpack_from(">B", msg, 1)
+        if self.types is not None and typ not in self.types: return False
+        (rid, aid) = struct.unpack_from(">LL", msg, 4)
+        if self.areas is not None and aid not in self.areas: return False
+        if self.routers is not None and rid not in self.routers: return False
+        return True
+
+    def program(self):
+
+        ## -> [ (code, jt, jf, k) ]; jumps are resolved once the layout is
+        ## known, as they are relative and at most 255 forward
+        prog = [ insn(BPF_LD|BPF_W|BPF_LEN),
+                 [ BPF_JMP|BPF_JGE|BPF_K, 0, "accept", MIN_LEN ],
+                 ]
+        for (off, size, values) in self.tests():
+            prog.append(insn(BPF_LD|size|BPF_ABS, k=off))
+            for (i, v) in enumerate(values):
+                jf = (i == len(values) - 1) and "reject" or 0
+                prog.append([ BPF_JMP|BPF_JEQ|BPF_K, "next", jf, v ])
+            prog.append("next")
+
+        prog += [ "accept", insn(BPF_RET|BPF_K, k=ACCEPT_BYTES),
+                  "reject", insn(BPF_RET|BPF_K, k=0) ]
+
+        ## labels: "next" is the next label in the list, resolve to indices
+        labels = {} ; out = [] ; nexts = []
+        for p in prog:
+            if p == "next": nexts.append(len(out))
+            elif isinstance(p, str): labels[p] = len(out)
+            else: out.append(p)
+
+        rv = [] ; n = 0
+        for (i, p) in enumerate(out):
+            if isinstance(p, list):
+                p = list(p)
+                for j in (1, 2):
+                    if p[j] == "next":
+                        p[j] = min([ x for x in nexts if x > i ])
+                    elif isinstance(p[j], str):
+                        p[j] = labels[p[j]]
+                    else:
+                        continue
+                    p[j] -= i + 1
+                    if p[j] > BPF_MAXJUMP:
+                        raise BpfExc("filter too large: jump of %d" % p[j])
+                p = tuple(p)
+            rv.append(p)
+
+        return rv
+
+    #---------------------------------------------------------------------------
+
+    def attach(self, sock):
+
+        prog = self.program()
+        buf  = ctypes.create_string_buffer("".join([ struct.pack(BPF_INSN, *p) for p in prog ]))
+        fprog = struct.pack("@HL", len(prog), ctypes.addressof(buf))
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+        except socket.error, se:
+            raise BpfExc("SO_ATTACH_FILTER: %s" % se)
+
+def detach(sock):
+
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_DETACH_FILTER, 0)
+    except socket.error:
+        pass
+
+def disasm(prog):
+
+    ## tcpdump -d style listing
+    names = { BPF_LD|BPF_W|BPF_LEN: "ld    len",
+              BPF_LD|BPF_B|BPF_ABS: "ldb   [%(k)d]",
+              BPF_LD|BPF_H|BPF_ABS: "ldh   [%(k)d]",
+              BPF_LD|BPF_W|BPF_ABS: "ld    [%(k)d]",
+              BPF_JMP|BPF_JEQ|BPF_K: "jeq   #0x%(k)x jt %(jt)d jf %(jf)d",
+              BPF_JMP|BPF_JGE|BPF_K: "jge   #%(k)d jt %(jt)d jf %(jf)d",
+              BPF_RET|BPF_K: "ret   #%(k)d",
+              }
+    out = []
+    for (i, (code, jt, jf, k)) in enumerate(prog):
+        d = { "k": k, "jt": i + 1 + jt, "jf": i + 1 + jf }
+        out.append("(%03d) %s" % (i, names.get(code, "0x%02x" % code) % d))
+    return "\n".join(out)
+
+def parseFilter(types=None, areas=None, routers=None):
+
+    ## from the comma separated lists main.py takes
+    split = lambda s: s and [ x.strip() for x in s.split(",") if x.strip() ]
+    try:
+        t = types   and [ MSG_TYPES[x.upper()] for x in split(types) ]
+    except KeyError, ke:
+        raise BpfExc("unknown message type %s" % ke)
+    a = areas   and [ filterId(x, "area") for x in split(areas) ]
+    r = routers and [ filterId(x, "router") for x in split(routers) ]
+    return MsgFilter(t or None, a or None, r or None)
+
+def filterId(s, what):
+
+    ## dotted quad -> id, BpfExc for anything else
+    try:
+        q = [ int(x) for x in s.split(".") ]
+    except ValueError:
+        q = []
+    if len(q) != 4 or [ x for x in q if not 0 <= x <= 255 ]:
+        raise BpfExc("bad %s id %s" % (what, s))
+    return str2id(s)
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import sys
+
+    ## print the program for a filter, eg: bpf.py LSUPD,LSACK 0.0.0.0
+    args = sys.argv[1:] + [ None, None, None ]
+    f = parseFilter(*args[:3])
+    print f
+    print disasm(f.program())
@@ -0,0 +1,372 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     bulk: LSA headers of whole archives decoded at once into NumPy
+##     structured arrays, for offline churn statistics
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## An archive -- pcap, MRT or the monitor's binary records, as read by
+## convergence.py -- is mapped, and one pass in Python only walks it: to
+## each LSUPD, then from LSA to LSA by the length field, noting where
+## every LSA header starts and when its message was heard.  The headers
+## themselves are never unpacked in Python.  All of them are gathered
+## with one fancy index over the mapped bytes (offsets + 0..19) and viewed
+## as big endian OSPFV3_LSAHDR records, then widened into HEADER, one
+## row per LSA heard:
+##
+##      ts  point  age  type  lsid  advrtr  seqno  cksum  len
+##
+## Statistics are sorts and reductions over those columns: per LSA
+## (type, lsid, advrtr) how often it was heard and how many instances
+## (sequence numbers) it went through, per advertising router the same
+## summed, per LS type the counts.  toFrame() hands the rows to pandas
+## for anything else.
+##
+## NumPy is needed (available() says whether it is there); pandas only by
+## toFrame().
+
+import os, sys, time, struct, mmap, array
+
+from ospfv3 import *
+from convergence import PCAP_MAGIC, PCAP_HDR, PCAP_HDR_LEN, PCAP_REC, PCAP_REC_LEN, \
+     LINKTYPES, IP6_HDR_LEN, IP6_EXTHDRS, IP6_FRAGMENT, IPPROTO_OSPF, \
+     MRT_HDR, MRT_HDR_LEN, MRT_OSPFV3, MRT_OSPFV3_ET, sniff
+from codec import REC_LEN, REC_LEN_SZ, REC_HDR, REC_HDR_LEN, ITEM_HDR_LEN
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#-------------------------------------------------------------------------------
+
+if numpy is not None:
+    ## OSPFV3_LSAHDR as it is on the wire, and the row it is widened into
+    LSAHDR_DTYPE = numpy.dtype([ ("age", ">u2"), ("type", ">u2"), ("lsid", ">u4"),
+                                 ("advrtr", ">u4"), ("seqno", ">u4"), ("cksum", ">u2"),
+                                 ("len", ">u2") ])
+    HEADER_DTYPE = numpy.dtype([ ("ts", "f8"), ("point", "u2"), ("age", "u2"),
+                                 ("type", "u2"), ("lsid", "u4"), ("advrtr", "u4"),
+                                 ("seqno", "u4"), ("cksum", "u2"), ("len", "u2") ])
+    LSA_STATS_DTYPE = numpy.dtype([ ("type", "u2"), ("lsid", "u4"), ("advrtr", "u4"),
+                                    ("heard", "u4"), ("instances", "u4"),
+                                    ("first", "f8"), ("last", "f8") ])
+    RTR_STATS_DTYPE = numpy.dtype([ ("advrtr", "u4"), ("lsas", "u4"),
+                                    ("heard", "u4"), ("instances", "u4") ])
+
+class BulkExc(Exception): pass
+
+def available():
+
+    return numpy is not None
+
+################################################################################
+
+## scanners: (ts, start, end) of the LSAs of every OSPFv3 LSUPD in a
+## mapped file, by offset into it
+
+def lsupdSpan(buf, off, end):
+
+    ## the LSAs of the OSPFv3 message at off, or None if not an LSUPD
+    if off + OSPFV3_HDR_LEN + OSPFV3_LSUPD_LEN > end: return None
+    (ver, typ, l) = struct.unpack_from(">BBH", buf, off)
+    if ver != 3 or typ != MSG_TYPES["LSUPD"] or off + l > end: return None
+    return (off + OSPFV3_HDR_LEN + OSPFV3_LSUPD_LEN, off + l)
+
+def ospfOffset(buf, off, end):
+
+    ## where the OSPF message in the IPv6 packet at off starts, past any
+    ## extension headers, or None (convergence.ip6Payload, by offset)
+    if off + IP6_HDR_LEN > end or ord(buf[off]) >> 4 != 6: return None
+    nh = ord(buf[off + 6]) ; off += IP6_HDR_LEN
+    while nh != IPPROTO_OSPF:
+        if off + 8 > end: return None
+        if nh in IP6_EXTHDRS: (nh, off) = (ord(buf[off]), off + (ord(buf[off + 1]) + 1) * 8)
+        elif nh == IP6_FRAGMENT: (nh, off) = (ord(buf[off]), off + 8)
+        else: return None
+    return off
+
+def scanPcap(buf):
+
+    (magic, _, _, _, _, _, linktype) = struct.unpack_from(PCAP_HDR, buf)
+    if magic != PCAP_MAGIC or linktype not in LINKTYPES:
+        raise BulkExc("not a pcap of a supported link type")
+    skip = LINKTYPES[linktype]
+
+    off = PCAP_HDR_LEN ; size = len(buf)
+    while off + PCAP_REC_LEN <= size:
+        (secs, usecs, caplen, _) = struct.unpack_from(PCAP_REC, buf, off)
+        pkt = off + PCAP_REC_LEN ; end = min(pkt + caplen, size) ; off = end
+        if linktype == 1 and buf[pkt+12:pkt+14] == "\x81\x00": m = pkt + skip + 4
+        else: m = pkt + skip
+        m = ospfOffset(buf, m, end)
+        span = m is not None and lsupdSpan(buf, m, end)
+        if span: yield (secs + usecs * 1e-6, ) + span
+
+def scanMrt(buf):
+
+    off = 0 ; size = len(buf)
+    while off + MRT_HDR_LEN <= size:
+        (secs, typ, _, l) = struct.unpack_from(MRT_HDR, buf, off)
+        body = off + MRT_HDR_LEN ; end = min(body + l, size) ; off = end
+        if typ not in (MRT_OSPFV3, MRT_OSPFV3_ET): continue
+
+        ts = secs
+        if typ == MRT_OSPFV3_ET:
+            ts += struct.unpack_from(">L", buf, body)[0] * 1e-6 ; body += 4
+        (af, ) = struct.unpack_from(">H", buf, body)
+        span = lsupdSpan(buf, body + 2 + 2 * (af == 2 and 16 or 4), end)
+        if span: yield (ts, ) + span
+
+SCANNERS = { "pcap": scanPcap,
+             "mrt" : scanMrt,
+             }
+
+#-------------------------------------------------------------------------------
+
+def offsets(buf, fmt):
+
+    ## -> (array of header offsets, array of times), one entry per LSA
+    offs = array.array("l") ; tss = array.array("d")
+    size = len(buf) ; lsupd = MSG_TYPES["LSUPD"]
+    unpack = struct.unpack_from
+
+    if fmt == "rec":
+        ## records hold one LSA per item; no need to walk lengths
+        off = 0
+        while off + REC_LEN_SZ <= size:
+            (blen, ) = unpack(REC_LEN, buf, off)
+            rec = off + REC_LEN_SZ ; off = rec + blen
+            if off > size: break
+            (_, typ, nitems, _, _, sec, usec) = unpack(REC_HDR, buf, rec)
+            if typ != lsupd: continue
+            ts = sec + usec * 1e-6 ; i = rec + REC_HDR_LEN
+            for n in xrange(nitems):
+                (ilen, ) = unpack(">H", buf, i)
+                if ilen >= OSPFV3_LSAHDR_LEN:
+                    offs.append(i + ITEM_HDR_LEN) ; tss.append(ts)
+                i += ITEM_HDR_LEN + ilen
+        return (offs, tss)
+
+    for (ts, off, end) in SCANNERS[fmt](buf):
+        while off + OSPFV3_LSAHDR_LEN <= end:
+            (l, ) = unpack(">H", buf, off + OSPFV3_LSAHDR_LEN - 2)
+            if l < OSPFV3_LSAHDR_LEN or off + l > end: break
+            offs.append(off) ; tss.append(ts)
+            off += l
+    return (offs, tss)
+
+def decode(buf, offs, tss=None, point=0):
+
+    ## every header at once: one gather, one view, one widening copy
+    if numpy is None: raise BulkExc("NumPy is not installed")
+    n = len(offs)
+    rv = numpy.zeros(n, HEADER_DTYPE)
+    if not n: return rv
+
+    u8  = numpy.frombuffer(buf, numpy.uint8)
+    idx = numpy.frombuffer(offs, numpy.int64)[:, None] + numpy.arange(OSPFV3_LSAHDR_LEN)
+    hdrs = u8[idx].view(LSAHDR_DTYPE)[:, 0]
+    for f in LSAHDR_DTYPE.names: rv[f] = hdrs[f]
+    if tss is not None: rv["ts"] = numpy.frombuffer(tss, numpy.float64)
+    rv["point"] = point
+    return rv
+
+def readFile(path, fmt=None, point=0):
+
+    ## -> HEADER rows of every LSA in an archive
+    fmt = fmt or sniff(path)
+    if fmt not in ("rec", ) + tuple(SCANNERS):
+        raise BulkExc("%s: %s archives are not supported" % (path, fmt))
+
+    f = open(path, "rb")
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if not size: return decode("", [])
+        buf = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+
+    try:
+        (offs, tss) = offsets(buf, fmt)
+        return decode(buf, offs, tss, point)
+    finally:
+        buf.close()
+
+def readFiles(specs, fmt=None):
+
+    ## specs as convergence.readFile's: path or point=path; -> (rows in
+    ## time order, [ point names ])
+    points = [] ; parts = []
+    for spec in specs:
+        if "=" in spec: (name, path) = spec.split("=", 1)
+        else: (name, path) = (os.path.basename(spec), spec)
+        parts.append(readFile(path, fmt, len(points)))
+        points.append(name)
+
+    rv = numpy.concatenate(parts)
+    return (rv[numpy.argsort(rv["ts"], kind="mergesort")], points)
+
+################################################################################
+
+def lsaStats(h):
+
+    ## -> LSA_STATS rows, one per (type, lsid, advrtr), most instances first
+    n = len(h)
+    if not n: return numpy.zeros(0, LSA_STATS_DTYPE)
+
+    ## (type, lsid, advrtr, seqno) is 112 bits; numbered densely one field
+    ## at a time it sorts as one uint64, much faster than a lexsort
+    u64 = numpy.uint64 ; hi = lambda x: x.astype(u64) << u64(32)
+    (_, ls)  = numpy.unique(hi(h["type"]) | h["lsid"], return_inverse=True)
+    (_, lsa) = numpy.unique(hi(ls) | h["advrtr"], return_inverse=True)
+    k = hi(lsa) | h["seqno"]
+    order = numpy.argsort(k) ; k = k[order] ; lsa = lsa[order]
+
+    key = numpy.ones(n, bool) ; key[1:] = lsa[1:] != lsa[:-1]
+    inst = numpy.ones(n, bool) ; inst[1:] = k[1:] != k[:-1]
+    starts = numpy.flatnonzero(key)
+    ts = h["ts"][order] ; first = h[order[starts]]
+
+    rv = numpy.zeros(len(starts), LSA_STATS_DTYPE)
+    for f in ("type", "lsid", "advrtr"): rv[f] = first[f]
+    rv["heard"]     = numpy.diff(numpy.append(starts, n))
+    rv["instances"] = numpy.add.reduceat(inst.astype(numpy.uint32), starts)
+    rv["first"]     = numpy.minimum.reduceat(ts, starts)
+    rv["last"]      = numpy.maximum.reduceat(ts, starts)
+    return rv[numpy.argsort(-rv["instances"].astype(numpy.int64), kind="mergesort")]
+
+def routerStats(stats):
+
+    ## lsaStats() summed per advertising router, most instances first
+    (rtrs, inv) = numpy.unique(stats["advrtr"], return_inverse=True)
+    rv = numpy.zeros(len(rtrs), RTR_STATS_DTYPE)
+    rv["advrtr"]    = rtrs
+    rv["lsas"]      = numpy.bincount(inv)
+    rv["heard"]     = numpy.bincount(inv, stats["heard"])
+    rv["instances"] = numpy.bincount(inv, stats["instances"])
+    return rv[numpy.argsort(-rv["instances"].astype(numpy.int64), kind="mergesort")]
+
+def typeCounts(h):
+
+    ## -> { LS type name: headers heard }
+    (types, counts) = numpy.unique(h["type"], return_counts=True)
+    return dict([ (LSAV3_TYPES.get(int(t), int(t)), int(c)) for (t, c) in zip(types, counts) ])
+
+def toFrame(h, points=None):
+
+    ## HEADER rows -> pandas DataFrame, points named if given
+    try:
+        import pandas
+    except ImportError:
+        raise BulkExc("pandas is not installed")
+    df = pandas.DataFrame(h)
+    if points is not None:
+        df["point"] = pandas.Categorical.from_codes(h["point"], points)
+    return df
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import getopt
+
+    def usage():
+        print """Usage: %s [ options ] <[point=]file> ...
+    -h|--help                   : Help
+    -f|--format pcap|mrt|rec    : Input format [def: by content]
+    -n|--top <n>                : LSAs and routers listed [def: 10]
+    -o|--output <file>          : Write the rows with pandas, .csv or .pkl
+    -b|--bench                  : Also time struct.unpack per header""" %\
+            os.path.basename(sys.argv[0])
+        sys.exit(1)
+
+    FORMAT = None
+    TOP    = 10
+    OUTPUT = None
+    BENCH  = False
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hf:n:o:b",
+                                   ("help", "format=", "top=", "output=", "bench", ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-f', '--format'):
+            FORMAT = y
+
+        elif x in ('-n', '--top'):
+            TOP = int(y)
+
+        elif x in ('-o', '--output'):
+            OUTPUT = y
+
+        elif x in ('-b', '--bench'):
+            BENCH = True
+
+    if not args: usage()
+    if not available():
+        print "[ *** NumPy is not installed *** ]"
+        sys.exit(1)
+
+    t = time.time()
+    (h, points) = readFiles(args, FORMAT)
+    t = time.time() - t
+    print "%d LSA headers from %d files in %.2fs, %.0f/s" %(
+        len(h), len(points), t, len(h) / max(t, 1e-9))
+
+    if BENCH:
+        ## the per header path this replaces, over the same offsets
+        for spec in args:
+            path = spec.split("=", 1)[-1]
+            f = open(path, "rb") ; buf = f.read() ; f.close()
+            (offs, tss) = offsets(buf, FORMAT or sniff(path))
+            t0 = time.time()
+            rows = [ struct.unpack_from(OSPFV3_LSAHDR, buf, o) for o in offs ]
+            t1 = time.time()
+            decode(buf, offs, tss)
+            t2 = time.time()
+            print "%s: %d headers, struct.unpack %.3fs, decode %.3fs" %(
+                path, len(offs), t1 - t0, t2 - t1)
+
+    t = time.time()
+    stats = lsaStats(h) ; rtrs = routerStats(stats) ; types = typeCounts(h)
+    print "statistics in %.3fs: %d LSAs, %d routers" % (time.time() - t, len(stats), len(rtrs))
+    print "by type:", ", ".join([ "%s:%d" % x for x in sorted(types.items()) ])
+
+    print "\n%-22s %-15s %-15s %8s %9s" % ("type", "lsid", "advrtr", "heard", "instances")
+    for s in stats[:TOP]:
+        print "%-22s %-15s %-15s %8d %9d" %(
+            LSAV3_TYPES.get(int(s["type"]), s["type"]), id2str(int(s["lsid"])),
+            id2str(int(s["advrtr"])), s["heard"], s["instances"])
+
+    print "\n%-15s %6s %8s %9s" % ("advrtr", "lsas", "heard", "instances")
+    for r in rtrs[:TOP]:
+        print "%-15s %6d %8d %9d" % (id2str(int(r["advrtr"])), r["lsas"], r["heard"], r["instances"])
+
+    if OUTPUT:
+        df = toFrame(h, points)
+        if OUTPUT.endswith(".pkl"): df.to_pickle(OUTPUT)
+        else: df.to_csv(OUTPUT, index=False)
+        print "\n%d rows to %s" % (len(df), OUTPUT)
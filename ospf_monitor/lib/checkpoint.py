@@ -0,0 +1,285 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     checkpoint: periodic on-disk copy of the LSDB and neighbour table,
+##     so a restarted monitor is useful before the routers re-flood
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## Layout of a checkpoint file:
+##
+##   CKPT_HDR                       magic, version, written at, counts
+##   nlsas x (LSA_REC  raw LSA)     area, time heard, then the LSA as flooded
+##   nnbrs x (NBR_REC  src)         one per neighbour heard in hellos, with
+##                                  the interface and source address (as
+##                                  text, scope and all) it was heard from
+##
+## LSAs are kept exactly as they were flooded, so loading is the normal
+## LSUPD path: their ages are advanced by the time since they were heard,
+## they are packed back into LSUPDs and fed to Lsdb.update().  Anything
+## that reached MaxAge in the meantime is dropped there.  Fresh LSUPDs
+## then supersede restored LSAs in the usual way, and restored neighbours
+## are kept only until their dead interval passes without a hello.
+##
+## A checkpoint is written to a temporary file, fsync'd and renamed over
+## the old one, so a crash mid-write leaves the previous checkpoint intact.
+
+import os, mmap, struct, time
+
+from ospfv3 import *
+from lsdb import MAX_AGE
+from codec import CodecExc
+
+#-------------------------------------------------------------------------------
+
+CKPT_MAGIC   = 0x4f434b50           # "OCKP"
+CKPT_VERSION = 2
+
+CKPT_HDR     = "> L L d L L"        # magic, ver, written at, nlsas, nnbrs
+CKPT_HDR_LEN = struct.calcsize(CKPT_HDR)
+LSA_REC      = "> L d"              # area id, time heard
+LSA_REC_LEN  = struct.calcsize(LSA_REC)
+NBR_REC      = "> L L L L B H H L L d H"  # ..., interface index, ..., len(src)
+NBR_REC_LEN  = struct.calcsize(NBR_REC)
+
+MAX_LSUPD    = 60000                # bytes of LSAs per rebuilt LSUPD
+
+DEFAULT_INTERVAL = 60               # seconds between checkpoints
+
+class CheckpointExc(Exception): pass
+
+################################################################################
+
+def save(path, lsdb, nbrs, now=None):
+
+    if now is None: now = time.time()
+
+    snap = lsdb.snapshot()
+    out  = [ None ]
+    for e in snap.lsas.itervalues():
+        out.append(struct.pack(LSA_REC, e["AID"], e["TS"]))
+        out.append(e["RAW"])
+
+    nbrl = nbrs.values()
+    for n in nbrl:
+        src = n["SRC"] or ""
+        out.append(struct.pack(NBR_REC, n["AID"], n["RID"], n["INTERFACEID"],
+                               n["IFINDEX"], n["PRIO"], n["HELLO"], n["DEAD"],
+                               n["DESIG"], n["BDESIG"], n["TS"], len(src)))
+        out.append(src)
+
+    out[0] = struct.pack(CKPT_HDR, CKPT_MAGIC, CKPT_VERSION, now,
+                         len(snap), len(nbrl))
+
+    tmp = path + ".tmp"
+    f = open(tmp, "wb")
+    try:
+        f.write("".join(out))
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
+    os.rename(tmp, path)
+
+    d = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(d)
+    finally:
+        os.close(d)
+
+    return len(snap)
+
+#-------------------------------------------------------------------------------
+
+def read(path):
+
+    ## -> (written at, [(aid, heard, raw lsa)], [neighbour dict])
+    f = open(path, "rb")
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if size < CKPT_HDR_LEN:
+            raise CheckpointExc("%s: truncated checkpoint" % path)
+        buf = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+
+    try:
+        (magic, ver, written, nlsas, nnbrs) = struct.unpack_from(CKPT_HDR, buf)
+        if magic != CKPT_MAGIC or ver != CKPT_VERSION:
+            raise CheckpointExc("%s: not a checkpoint" % path)
+
+        off = CKPT_HDR_LEN ; lsas = []
+        for i in xrange(nlsas):
+            (aid, heard) = struct.unpack_from(LSA_REC, buf, off)
+            off += LSA_REC_LEN
+            l = struct.unpack_from(OSPFV3_LSAHDR, buf, off)[-1]
+            lsas.append((aid, heard, buf[off:off+l]))
+            off += l
+
+        nbrs = []
+        for i in xrange(nnbrs):
+            (aid, rid, ifid, ifindex, prio, hello, dead, desig, bdesig, ts, l) =\
+                  struct.unpack_from(NBR_REC, buf, off)
+            off += NBR_REC_LEN
+            src = buf[off:off+l]
+            if len(src) < l:
+                raise CheckpointExc("%s: truncated checkpoint" % path)
+            off += l
+            nbrs.append({ "AID"         : aid,
+                          "RID"         : rid,
+                          "INTERFACEID" : ifid,
+                          "PRIO"        : prio,
+                          "HELLO"       : hello,
+                          "DEAD"        : dead,
+                          "DESIG"       : desig,
+                          "BDESIG"      : bdesig,
+                          "IFINDEX"     : ifindex,
+                          "SRC"         : src or None,
+                          "TS"          : ts,
+                          })
+
+    except struct.error, e:
+        raise CheckpointExc("%s: truncated checkpoint (%s)" % (path, e))
+
+    finally:
+        buf.close()
+
+    return (written, lsas, nbrs)
+
+def load(path, lsdb, nbrs, now=None):
+
+    ## restore a checkpoint into an (empty) LSDB and neighbour table;
+    ## returns (LSAs restored, neighbours restored)
+    if now is None: now = time.time()
+
+    (written, lsas, nbrl) = read(path)
+
+    ## everything is parsed before anything is applied, so a corrupt LSA
+    ## leaves the LSDB empty rather than half restored
+    msgs = []
+    try:
+        byarea = {}
+        for (aid, heard, raw) in lsas:
+            age = struct.unpack_from(">H", raw)[0] + int(now - heard)
+            if age >= MAX_AGE: continue
+            byarea.setdefault(aid, []).append(struct.pack(">H", age) + raw[2:])
+
+        for (aid, raws) in byarea.items():
+            i = 0
+            while i < len(raws):
+                chunk = [] ; l = 0
+                while i < len(raws) and (not chunk or l + len(raws[i]) <= MAX_LSUPD):
+                    chunk.append(raws[i]) ; l += len(raws[i]) ; i += 1
+
+                raw = mkOspfMsg(MSG_TYPES["LSUPD"],
+                                struct.pack(OSPFV3_LSUPD, len(chunk)) + "".join(chunk),
+                                0, aid)
+                msgs.append((parseOspfMsg(raw, 0), raw))
+
+    except (ParseExc, CodecExc, struct.error), e:
+        raise CheckpointExc("%s: corrupt LSA (%s)" % (path, e))
+
+    for (msg, raw) in msgs:
+        lsdb.update(msg, raw, now)
+
+    for n in nbrl:
+        if now - n["TS"] <= n["DEAD"]: nbrs.restore(n)
+
+    return (len(lsdb), len(nbrs))
+
+################################################################################
+
+class Checkpointer:
+
+    ## the receive loop checks due() and calls write() every interval
+    ## seconds
+
+    def __init__(self, path, lsdb, nbrs, interval=DEFAULT_INTERVAL):
+
+        self._path     = path
+        self._lsdb     = lsdb
+        self._nbrs     = nbrs
+        self._interval = interval
+        self._next     = time.time() + interval
+
+        self.written  = 0
+        self.duration = 0.0
+
+    def __repr__(self):
+
+        return "checkpoint %s: every %ds, written:%d, last took %.3fs" %(
+            self._path, self._interval, self.written, self.duration)
+
+    def load(self):
+
+        if not os.path.exists(self._path): return (0, 0)
+        return load(self._path, self._lsdb, self._nbrs)
+
+    def write(self):
+
+        t = time.time()
+        save(self._path, self._lsdb, self._nbrs, t)
+        self.duration = time.time() - t
+        self.written += 1
+        self._next = t + self._interval
+
+    def due(self, now=None):
+
+        if now is None: now = time.time()
+        return now >= self._next
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import sys
+    from lsdb import Lsdb, Neighbours
+
+    ## print a checkpoint; with -b n, time save/load of n router LSAs
+
+    if len(sys.argv) == 3 and sys.argv[1] == "-b":
+        n = int(sys.argv[2]) ; path = "/tmp/ospf_monitor.ckpt"
+        body = struct.pack(OSPFV3_LSARTR, 0, "\x00\x00\x13") +\
+               struct.pack(OSPFV3_LSARTR_INTERFACE, 1, 0, 10, 1, 1, 1)
+
+        lsdb = Lsdb() ; nbrs = Neighbours()
+        for r in xrange(1, n + 1, 100):
+            lsas = [ mkLsa(0x2001, 0, x, 0x80000001, body, 100)
+                     for x in xrange(r, min(r + 100, n + 1)) ]
+            raw  = mkOspfMsg(MSG_TYPES["LSUPD"],
+                             struct.pack(OSPFV3_LSUPD, len(lsas)) + "".join(lsas), 1)
+            lsdb.update(parseOspfMsg(raw, 0), raw)
+
+        t = time.time() ; save(path, lsdb, nbrs) ; t = time.time() - t
+        print "save: %d LSAs, %d bytes, %.3fs" % (len(lsdb), os.path.getsize(path), t)
+
+        lsdb2 = Lsdb() ; nbrs2 = Neighbours()
+        t = time.time() ; load(path, lsdb2, nbrs2) ; t = time.time() - t
+        print "load: %d LSAs, %.3fs" % (len(lsdb2), t)
+        os.unlink(path)
+        sys.exit(0)
+
+    for path in sys.argv[1:]:
+        (written, lsas, nbrs) = read(path)
+        print "%s: written %s, %d LSAs, %d neighbours" %(
+            path, time.ctime(written), len(lsas), len(nbrs))
+        for n in nbrs:
+            print INDENT + "neighbour %s, area %s, ifindex %d, src %s, heard %s" %(
+                id2str(n["RID"]), id2str(n["AID"]), n["IFINDEX"], n["SRC"],
+                time.ctime(n["TS"]))
@@ -0,0 +1,349 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     churn: LSA change rates and adjacency flap damping, from the LSDB
+##     change stream
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## Churn subscribes to the LSDB (Lsdb.subscribe) and sees every ADD, UPD
+## and DEL as it is published.  Two kinds of state, both a few numbers
+## per item and both updated in O(1):
+##
+## Rates.  Each LSA, and each advertising router, has a Rate: counts
+## decayed exponentially with a time constant of SHORT and of LONG
+## seconds, so count/tau is the change rate over roughly the last tau
+## seconds, a sliding window with no buckets to keep.  Decay is applied
+## lazily, when the item changes or is read.
+##
+## Flaps.  Router-LSA links (router, interface, neighbour, neighbour's
+## interface) are compared with the same LSA's previous links; an
+## adjacency is up while every half of it is advertised -- both routers
+## for point-to-point, the one for a transit link -- and goes down when
+## one is withdrawn.  Each down adds PENALTY to the adjacency's damping
+## penalty, which halves every HALF_LIFE seconds (RFC 2439 route flap
+## damping, applied to adjacencies).  Above SUPPRESS the adjacency is
+## flapping, and stays so until the penalty decays below REUSE.
+##
+## Top-N lists are worked out only when asked for (API, metrics scrape).
+## Items whose counts have decayed to nothing are pruned once there are
+## more than max items; a pass that leaves more than half of that sets
+## the next one off at twice what is left, so pruning stays amortised
+## O(1) per change however many items are live.
+
+import math, time, heapq, threading
+
+from ospfv3 import *
+from lsdb import OPS, tlvValues
+
+#-------------------------------------------------------------------------------
+
+SHORT       = 60.0              # seconds, rate time constants
+LONG        = 900.0
+
+PENALTY     = 1000.0            # per adjacency down
+SUPPRESS    = 2000.0            # flapping above this ...
+REUSE       = 750.0             # ... until back under this
+HALF_LIFE   = 60.0              # seconds
+MAX_PENALTY = 16000.0
+
+MAX_ITEMS   = 100000
+DEFAULT_TOP = 10
+
+RTR_TYPES   = (0x2001, 0xA021)
+
+class ChurnExc(Exception): pass
+
+def decay(v, dt, tau):
+
+    if dt <= 0: return v
+    return v * math.exp(-dt / tau)
+
+class Rate(object):
+
+    ## changes of one item, total and decayed over SHORT and LONG
+    __slots__ = ("t", "short", "long", "total")
+
+    def __init__(self):
+
+        self.t = 0.0 ; self.short = 0.0 ; self.long = 0.0 ; self.total = 0
+
+    def add(self, now):
+
+        dt = now - self.t ; self.t = now
+        self.short = decay(self.short, dt, SHORT) + 1
+        self.long  = decay(self.long, dt, LONG) + 1
+        self.total += 1
+
+    def rates(self, now):
+
+        ## -> (changes per minute over ~SHORT, over ~LONG)
+        dt = now - self.t
+        return (decay(self.short, dt, SHORT) / SHORT * 60,
+                decay(self.long, dt, LONG) / LONG * 60)
+
+class Adjacency(object):
+
+    ## the halves of one adjacency heard, and its damping state
+    __slots__ = ("halves", "expected", "up", "t", "penalty", "flapping",
+                 "flaps", "changed")
+
+    def __init__(self, expected):
+
+        self.halves = 0 ; self.expected = expected ; self.up = False
+        self.t = 0.0 ; self.penalty = 0.0 ; self.flapping = False
+        self.flaps = 0 ; self.changed = 0.0
+
+    def current(self, now):
+
+        return decay(self.penalty, now - self.t, HALF_LIFE / math.log(2))
+
+def rtrLinks(entry):
+
+    ## a Router-LSA's links -> { adjacency key: halves expected }
+    v = entry["V"] or {} ; rid = entry["H"]["ADVRTR"] ; rv = {}
+    if entry["T"] == 0x2001: links = v.get("INTERFACES", [])
+    else: links = tlvValues(v.get("TLVS", []), ELSA_TLV_TYPES["ROUTER LINK"])
+
+    for l in links:
+        me = (rid, l["INTERFACEID"]) ; nbr = (l["NBROUTERID"], l["NBINTERFACEID"])
+        if l["TYPE"] == RTR_LINK_TYPE["TRANSIT"]:
+            rv[(entry["AID"], me, nbr)] = 1
+        else:
+            rv[(entry["AID"], ) + tuple(sorted((me, nbr)))] = 2
+    return rv
+
+def adjName(key):
+
+    (aid, a, b) = key
+    return "%s#%d-%s#%d" % (id2str(a[0]), a[1], id2str(b[0]), b[1])
+
+def lsaName(key):
+
+    (aid, t, lsid, advrtr) = key
+    return "%s %s %s" % (LSAV3_TYPES.get(t, t), id2str(lsid), id2str(advrtr))
+
+################################################################################
+
+class Churn:
+
+    def __init__(self, max_items=MAX_ITEMS, verbose=1):
+
+        self._lsas    = {}      # lsaKey: Rate
+        self._rtrs    = {}      # advertising router: Rate
+        self._links   = {}      # Router-LSA key: { adjacency key: halves }
+        self._adjs    = {}      # adjacency key: Adjacency
+        self._max     = max_items
+        self._limit   = max_items   # prune above this
+        self._verbose = verbose
+        self._lock    = threading.Lock()
+
+        self.ops      = dict([ (op, 0) for op in OPS.values() ])
+        self.downs    = 0
+        self.flapping = 0
+
+    def __repr__(self):
+
+        return "churn: %d LSAs, %d routers, %d adjacencies, %d flapping" %(
+            len(self._lsas), len(self._rtrs), len(self._adjs), self.flapping)
+
+    #---------------------------------------------------------------------------
+
+    def changes(self, version, changes, now=None):
+
+        ## Lsdb.subscribe() callback
+        if now is None: now = time.time()
+        self._lock.acquire()
+        try:
+            for (op, key, entry) in changes:
+                self.change(op, key, entry, now)
+            if len(self._lsas) > self._limit or len(self._adjs) > self._limit:
+                self.prune(now)
+        finally:
+            self._lock.release()
+
+    def change(self, op, key, entry, now):
+
+        self.ops[OPS[op]] += 1
+        r = self._lsas.get(key)
+        if r is None: r = self._lsas[key] = Rate()
+        r.add(now)
+        r = self._rtrs.get(key[3])
+        if r is None: r = self._rtrs[key[3]] = Rate()
+        r.add(now)
+
+        if key[1] not in RTR_TYPES: return
+        old = self._links.get(key, {})
+        new = entry is not None and rtrLinks(entry) or {}
+        if new: self._links[key] = new
+        else: self._links.pop(key, None)
+
+        for k in old:
+            if k not in new: self.half(k, old[k], -1, now)
+        for k in new:
+            if k not in old: self.half(k, new[k], 1, now)
+
+    def half(self, key, expected, d, now):
+
+        a = self._adjs.get(key)
+        if a is None: a = self._adjs[key] = Adjacency(expected)
+        a.halves = max(a.halves + d, 0)
+        up = a.halves >= a.expected
+        if up == a.up: return
+        a.up = up ; a.changed = now
+        if up: return
+
+        ## down: damp
+        a.penalty = min(a.current(now) + PENALTY, MAX_PENALTY) ; a.t = now
+        a.flaps += 1 ; self.downs += 1
+        if not a.flapping and a.penalty > SUPPRESS:
+            a.flapping = True ; self.flapping += 1
+            if self._verbose > 0:
+                print "[ *** adjacency %s flapping: %d downs, penalty %.0f *** ]" %(
+                    adjName(key), a.flaps, a.penalty)
+
+    def reuse(self, now):
+
+        ## flapping adjacencies whose penalty has decayed under REUSE
+        for (k, a) in self._adjs.iteritems():
+            if a.flapping and a.current(now) < REUSE:
+                a.flapping = False ; self.flapping -= 1
+                if self._verbose > 0:
+                    print "[ adjacency %s stable again ]" % adjName(k)
+
+    def prune(self, now):
+
+        for d in (self._lsas, self._rtrs):
+            for (k, r) in d.items():
+                if r.rates(now)[1] < 1e-3: del d[k]
+        for (k, a) in self._adjs.items():
+            if not a.halves and not a.flapping and a.current(now) < 1: del self._adjs[k]
+        self._limit = max(self._max, 2 * max(len(self._lsas), len(self._adjs)))
+
+    #---------------------------------------------------------------------------
+
+    def top(self, n=DEFAULT_TOP, now=None):
+
+        ## -> the n busiest LSAs and routers and the n most penalised
+        ## adjacencies, with rates in changes per minute
+        if now is None: now = time.time()
+        self._lock.acquire()
+        try:
+            self.reuse(now)
+            lsas = heapq.nlargest(n, [ (r.rates(now), k, r.total) for (k, r) in self._lsas.iteritems() ])
+            rtrs = heapq.nlargest(n, [ (r.rates(now), k, r.total) for (k, r) in self._rtrs.iteritems() ])
+            adjs = heapq.nlargest(n, [ (a.current(now), k, a) for (k, a) in self._adjs.iteritems()
+                                       if a.flaps ])
+            return { "LSAS"     : [ { "LSA": lsaName(k), "RATE": s, "RATE_LONG": l, "TOTAL": t }
+                                    for ((s, l), k, t) in lsas ],
+                     "ROUTERS"  : [ { "ADVRTR": id2str(k), "RATE": s, "RATE_LONG": l, "TOTAL": t }
+                                    for ((s, l), k, t) in rtrs ],
+                     "ADJACENCIES" : [ { "ADJACENCY": adjName(k), "PENALTY": p, "FLAPS": a.flaps,
+                                         "FLAPPING": a.flapping, "UP": a.up,
+                                         "CHANGED": a.changed }
+                                       for (p, k, a) in adjs ],
+                     "OPS"      : dict(self.ops),
+                     "FLAPPING" : self.flapping,
+                     }
+        finally:
+            self._lock.release()
+
+    def suppressed(self, now=None):
+
+        ## -> how many adjacencies are flapping, after reuse()
+        if now is None: now = time.time()
+        self._lock.acquire()
+        try:
+            self.reuse(now)
+            return self.flapping
+        finally:
+            self._lock.release()
+
+    def handle(self, h, qs):
+
+        ## API route handler: GET /churn[?n=10]
+        h.reply(200, self.top(int(qs.get("n", [DEFAULT_TOP])[0])))
+
+    def register(self, metrics, n=DEFAULT_TOP):
+
+        ## gauges and counters on a Metrics.  A scrape calls these in
+        ## order, so the top lists are worked out once, for the LSA rates,
+        ## and the adjacency penalties that follow take the same result
+        scrape = []
+
+        def lsas():
+            scrape[:] = [ self.top(n) ]
+            return dict([ (x["LSA"], x["RATE"]) for x in scrape[0]["LSAS"] ])
+
+        def adjs():
+            top = scrape and scrape.pop() or self.top(n)
+            return dict([ (x["ADJACENCY"], x["PENALTY"]) for x in top["ADJACENCIES"] ])
+
+        metrics.callback("lsdb_changes_total", "LSDB changes", "counter", "op",
+                         lambda: dict(self.ops))
+        metrics.callback("adjacency_downs_total", "adjacencies withdrawn", "counter",
+                         fn=lambda: self.downs)
+        metrics.callback("adjacencies_flapping", "adjacencies over the damping threshold",
+                         fn=self.suppressed)
+        metrics.callback("churn_top_lsa_rate", "changes per minute of the busiest LSAs",
+                         label="lsa", fn=lsas)
+        metrics.callback("churn_top_adjacency_penalty", "damping penalty of the worst adjacencies",
+                         label="adjacency", fn=adjs)
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import sys
+    from lsdb import Lsdb
+
+    ## two routers, one point-to-point adjacency; router 2 flaps it every
+    ## 10s for a while, router 3 refreshes; then time per change
+
+    def rtr(rid, seq, links):
+        body = struct.pack(OSPFV3_LSARTR, 0, "\x00\x00\x13") + "".join(
+            [ struct.pack(OSPFV3_LSARTR_INTERFACE, 1, 0, 10, i, ni, nr) for (i, ni, nr) in links ])
+        lsa = mkLsa(0x2001, 0, rid, seq, body, 1)
+        raw = mkOspfMsg(MSG_TYPES["LSUPD"], mkLsUpd([ lsa ]), rid)
+        return (parseOspfMsg(raw, 0), raw)
+
+    lsdb = Lsdb() ; churn = Churn() ; lsdb.subscribe(churn.changes)
+    t = 1000.0 ; seq = 0x80000001
+    lsdb.update(*(rtr(3, seq, [ (1, 2, 2) ]) + (t, )))
+    for i in xrange(12):
+        up = i % 2 == 0
+        lsdb.update(*(rtr(2, seq + i, up and [ (2, 1, 3) ] or []) + (t + 10 * i, )))
+    print churn
+    r = churn.top(5, t + 120)
+    for a in r["ADJACENCIES"]: print a
+    print churn.top(5, t + 600)["ADJACENCIES"]
+
+    n = len(sys.argv) > 1 and int(sys.argv[1]) or 20000
+    ups = [ rtr(r, seq, [ (1, 1, r + 1) ]) for r in xrange(1, 101) ]
+    now = time.time() ; tm = time.time()
+    for i in xrange(n):
+        (msg, raw) = ups[i % 100]
+        lsdb.update(msg, raw, now)
+        msg["V"]["V"]["LSAS"][1]["H"]["LSSEQNO"] += 1
+        raw = raw[:OSPFV3_HDR_LEN + OSPFV3_LSUPD_LEN + 12] + \
+              struct.pack(">L", msg["V"]["V"]["LSAS"][1]["H"]["LSSEQNO"]) + \
+              raw[OSPFV3_HDR_LEN + OSPFV3_LSUPD_LEN + 16:]
+        ups[i % 100] = (msg, raw)
+    tm = time.time() - tm
+    print "%s; %.1f us per LSUPD with churn" % (churn, tm / n * 1e6)
@@ -0,0 +1,292 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     codec: export encodings for parsed OSPFv3 messages, plus the
+##     matching decoder for the collector side
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## Binary record layout (all fields network order):
+##
+##   record  := len:L body                     (len counts body only)
+##   body    := hdr item*
+##   hdr     := ver:B type:B nitems:H rid:L aid:L sec:L usec:L
+##   item    := len:H raw
+##
+## For LSUPD and LSACK each item is one raw LSA (LSUPD) or LSA header
+## (LSACK), exactly as received; for every other message type there is a
+## single item holding the raw message body after the OSPFv3 header.  The
+## collector gets the bytes the router sent, together with the few header
+## fields it needs to route/index the record, and can run the ospfv3
+## parsers over the items if it wants the full decode.
+##
+## The JSON export is the parsed message with router IDs and the like
+## rendered dotted-quad, through the interned id2str(), so the few hundred
+## IDs in a network cost a dict lookup each; fromJson() turns them back
+## into ints, so a collector keys LSAs the same whichever encoding a
+## monitor sent.
+
+import struct, json, time, sys, os
+
+from ospfv3 import *
+
+#-------------------------------------------------------------------------------
+
+BIN_VERSION = 1
+
+REC_LEN     = "> L"
+REC_LEN_SZ  = struct.calcsize(REC_LEN)
+
+REC_HDR     = "> BBH L L L L"
+REC_HDR_LEN = struct.calcsize(REC_HDR)
+
+ITEM_HDR     = "> H"
+ITEM_HDR_LEN = struct.calcsize(ITEM_HDR)
+
+## parsed message fields holding a router ID / LSID, or a list of them
+ID_FIELDS   = frozenset(("RID", "AID", "LSID", "ADVRTR", "NBROUTERID", "DESIG",
+                         "BDESIG", "DESTRTR", "REFLSID", "REFADVRTR"))
+ID_LISTS    = frozenset(("RTRS", "NBORS"))
+
+class CodecExc(Exception): pass
+
+def idOut(x):
+
+    if isinstance(x, (int, long)): return id2str(x)
+    return x
+
+def idIn(x):
+
+    if isinstance(x, basestring): return str2id(x)
+    return x
+
+def jsonView(v):
+
+    ## parsed message (dict) -> copy with IDs as dotted-quad strings; only
+    ## the dicts and lists on the way to them are copied
+    rv = dict(v)
+    for (k, x) in v.iteritems():
+        t = type(x)
+        if t is dict: rv[k] = jsonView(x)
+        elif t is list:
+            if k in ID_LISTS: rv[k] = map(idOut, x)
+            else: rv[k] = [ type(i) is dict and jsonView(i) or i for i in x ]
+        elif k in ID_FIELDS: rv[k] = idOut(x)
+    return rv
+
+def parsedView(v):
+
+    ## jsonView() undone: dotted-quad IDs back to ints
+    if isinstance(v, dict):
+        for (k, x) in v.iteritems():
+            if k in ID_FIELDS: v[k] = idIn(x)
+            elif k in ID_LISTS and isinstance(x, list): v[k] = map(idIn, x)
+            elif isinstance(x, (dict, list)): parsedView(x)
+    elif isinstance(v, list):
+        for x in v: parsedView(x)
+    return v
+
+def fromJson(data):
+
+    ## one JSON export -> the parsed message
+    return parsedView(json.loads(data))
+
+################################################################################
+
+class JsonCodec:
+
+    name         = "json"
+    content_type = "application/json"
+
+    def encode(self, msg, raw=None, ts=None):
+
+        return json.dumps(jsonView(msg), ensure_ascii=False, default=str)
+
+    def show(self, data):
+
+        return data
+
+#-------------------------------------------------------------------------------
+
+class BinCodec:
+
+    name         = "bin"
+    content_type = "application/octet-stream"
+
+    def encode(self, msg, raw, ts=None):
+
+        if ts is None: ts = time.time()
+
+        typ  = msg["T"]
+        hdr  = msg["V"]
+        body = raw[OSPFV3_HDR_LEN:msg["V"]["LEN"]]
+
+        if typ == MSG_TYPES["LSUPD"]:
+            items = splitLsas(body[OSPFV3_LSUPD_LEN:])
+        elif typ == MSG_TYPES["LSACK"]:
+            items = [ body[i:i+OSPFV3_LSAHDR_LEN]
+                      for i in xrange(0, len(body) - OSPFV3_LSAHDR_LEN + 1,
+                                      OSPFV3_LSAHDR_LEN) ]
+        else:
+            items = [ body ]
+
+        parts = [ None, None ] ; blen = REC_HDR_LEN
+        for item in items:
+            parts.append(struct.pack(ITEM_HDR, len(item)))
+            parts.append(item)
+            blen += ITEM_HDR_LEN + len(item)
+
+        parts[0] = struct.pack(REC_LEN, blen)
+        parts[1] = struct.pack(REC_HDR, BIN_VERSION, typ, len(items),
+                               hdr["RID"], hdr["AID"],
+                               int(ts), int((ts - int(ts)) * 1000000))
+
+        return "".join(parts)
+
+    def show(self, data):
+
+        (rec, _) = decodeRecord(data)
+        return "%s rid:%s aid:%s items:%d len:%d" %(
+            MSG_TYPES.get(rec["T"], rec["T"]), id2str(rec["RID"]),
+            id2str(rec["AID"]), len(rec["ITEMS"]), len(data))
+
+CODECS = { JsonCodec.name : JsonCodec,
+           BinCodec.name  : BinCodec,
+           }
+
+################################################################################
+
+def splitLsas(lsas):
+
+    ## raw LSAs back to back -> list of per-LSA slices, using each header's
+    ## length field
+    rv = [] ; off = 0 ; end = len(lsas)
+    while off + OSPFV3_LSAHDR_LEN <= end:
+        (l, ) = struct.unpack_from(">H", lsas, off + OSPFV3_LSAHDR_LEN - 2)
+        if l < OSPFV3_LSAHDR_LEN or off + l > end:
+            raise CodecExc("bad LSA length %d at offset %d" % (l, off))
+        rv.append(lsas[off:off+l])
+        off += l
+
+    return rv
+
+#-------------------------------------------------------------------------------
+
+def decodeRecord(data, off=0):
+
+    ## one framed record at data[off:] -> (record dict, offset after it)
+    (blen, ) = struct.unpack_from(REC_LEN, data, off)
+    off += REC_LEN_SZ ; end = off + blen
+    if end > len(data) or blen < REC_HDR_LEN:
+        raise CodecExc("truncated record")
+
+    (ver, typ, nitems, rid, aid, sec, usec) =\
+          struct.unpack_from(REC_HDR, data, off)
+    if ver != BIN_VERSION:
+        raise CodecExc("unknown record version %d" % ver)
+
+    off += REC_HDR_LEN ; items = []
+    for i in xrange(nitems):
+        (ilen, ) = struct.unpack_from(ITEM_HDR, data, off)
+        off += ITEM_HDR_LEN
+        if off + ilen > end:
+            raise CodecExc("truncated item")
+        items.append(data[off:off+ilen])
+        off += ilen
+
+    return ({ "T"     : typ,
+              "RID"   : rid,
+              "AID"   : aid,
+              "TS"    : sec + usec * 0.000001,
+              "ITEMS" : items,
+              }, end)
+
+def decodeRecords(data):
+
+    ## generator over all complete records in a buffer
+    off = 0
+    while off + REC_LEN_SZ <= len(data):
+        (rec, off) = decodeRecord(data, off)
+        yield rec
+
+def parseRecord(rec, verbose=0, level=0):
+
+    ## full decode of a record's items with the ospfv3 parsers; the result
+    ## has the same shape as the JSON export's "V" field
+    typ = rec["T"]
+    if typ == MSG_TYPES["LSUPD"]:
+        lsas = "".join(rec["ITEMS"])
+        return { "NLSAS" : len(rec["ITEMS"]),
+                 "LSAS"  : parseOspfLsas(lsas, verbose, level),
+                 }
+    elif typ == MSG_TYPES["LSACK"]:
+        return parseOspfLsAck("".join(rec["ITEMS"]), verbose, level)
+    elif typ == MSG_TYPES["HELLO"]:
+        return parseOspfHello(rec["ITEMS"][0], verbose, level)
+    elif typ == MSG_TYPES["DBDESC"]:
+        return parseOspfDesc(rec["ITEMS"][0], verbose, level)
+
+    return None
+
+################################################################################
+
+if __name__ == "__main__":
+
+    ## encoding cost and size of the JSON export against the binary records,
+    ## over a synthetic LSUPD of router and intra-area-prefix LSAs
+
+    import timeit
+
+    def mkLsupd(nrtrs):
+        lsas = []
+        for r in xrange(1, nrtrs + 1):
+            body = struct.pack(OSPFV3_LSARTR, 0, "\x00\x00\x13")
+            for n in xrange(4):
+                body += struct.pack(OSPFV3_LSARTR_INTERFACE, 1, 0, 10, n, n, r + n + 1)
+            lsas.append(mkLsa(0x2001, 0, r, 0x80000001, body))
+
+            body = struct.pack(OSPFV3_LSAINTRAPREFIX, 4, 0x2001, 0, r)
+            for n in xrange(4):
+                body += struct.pack(OSPFV3_PREFIX, 64, 0, 10) +\
+                        struct.pack(">LL", 0x20010db8, (r << 16) | n)
+            lsas.append(mkLsa(0x2009, 0, r, 0x80000001, body))
+
+        return mkOspfMsg(MSG_TYPES["LSUPD"],
+                         struct.pack(OSPFV3_LSUPD, len(lsas)) + "".join(lsas), 1)
+
+    nrtrs  = len(sys.argv) > 1 and int(sys.argv[1]) or 20
+    number = 2000
+    raw    = mkLsupd(nrtrs)
+    msg    = parseOspfMsg(raw, 0)
+
+    print "LSUPD: %d LSAs, %d bytes on the wire from the router" %(
+        msg["V"]["V"]["NLSAS"], len(raw))
+    for codec in (JsonCodec(), BinCodec()):
+        data = codec.encode(msg, raw)
+        t = min(timeit.repeat(lambda: codec.encode(msg, raw),
+                              number=number, repeat=3))
+        print "%-5s: %6d bytes, %7.1f us/msg" %(
+            codec.name, len(data), t / number * 1000000)
+
+    (rec, _) = decodeRecord(BinCodec().encode(msg, raw))
+    assert len(rec["ITEMS"]) == msg["V"]["V"]["NLSAS"]
+    assert parseRecord(rec)["LSAS"][1]["H"] == msg["V"]["V"]["LSAS"][1]["H"]
+    h = fromJson(JsonCodec().encode(msg, raw))["V"]["V"]["LSAS"]["1"]["H"]
+    assert h["ADVRTR"] == msg["V"]["V"]["LSAS"][1]["H"]["ADVRTR"]
+    print "id cache: %(HITS)d hits, %(MISSES)d misses" % cacheStats()["ID"]
@@ -0,0 +1,474 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     convergence: convergence timelines from captured or live LSA streams
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## Each input is one observation point: a pcap taken on a link, an MRT
+## file (RFC 6396 OSPFv3 / OSPFv3_ET records), a file of the monitor's
+## binary export records, or its JSON export one message per line.  Or,
+## live, every monitor streaming to us (lib/stream.py) is a point.  The
+## LSAs in the LSUPDs are merged by time across points, in one pass.
+##
+## An LSA instance is (type, LSID, advertising router, seqno); a flush
+## (MaxAge) of an instance counts as another.  An instance newer than any
+## seen before opens an event, or joins the open one; an event closes
+## after gap seconds without a new instance.  For each event:
+##
+##   origination delay  per advertising router, from the start of the
+##                      event (or the failure time, if given) to the first
+##                      sighting of any of its new instances, anywhere
+##   flooding time      per router, the longest any of its instances took
+##                      from its first sighting to its last point
+##   convergence        per point, from the start to the last new instance
+##                      it saw; the event's is the latest of these
+##
+## Only the highest seqno per LSA is kept across events, and the open
+## event's instances, capped at max instances (the rest are counted but
+## not timed), so memory is bounded by the LSDB size, not the input.
+
+import sys, os, struct, json, heapq, getopt, time, threading, mmap
+
+from ospfv3 import *
+from codec import splitLsas, decodeRecords, fromJson, CodecExc
+
+#-------------------------------------------------------------------------------
+
+DEFAULT_GAP   = 5.0             # seconds without a new instance ending an event
+MAX_INSTANCES = 100000
+MAX_AGE       = 3600
+
+PCAP_MAGIC    = 0xa1b2c3d4
+PCAP_HDR      = "< L HH l L L L"
+PCAP_HDR_LEN  = struct.calcsize(PCAP_HDR)
+PCAP_REC      = "< L L L L"
+PCAP_REC_LEN  = struct.calcsize(PCAP_REC)
+LINKTYPES     = { 1: 14,            # ethernet
+                  101: 0,           # raw IP (the quarantine)
+                  113: 16,          # linux cooked
+                  }
+
+IP6_HDR_LEN   = 40
+IP6_EXTHDRS   = (0, 43, 60)         # hop by hop, routing, destination options
+IP6_FRAGMENT  = 44
+IPPROTO_OSPF  = 89
+
+MRT_HDR       = "> L H H L"         # time, type, subtype, length
+MRT_HDR_LEN   = struct.calcsize(MRT_HDR)
+MRT_OSPFV3    = 48
+MRT_OSPFV3_ET = 49
+
+class ConvergenceExc(Exception): pass
+
+def signedSeq(seqno):
+
+    ## LS sequence numbers are signed, 0x80000001 the lowest
+    if seqno >= 0x80000000: return seqno - 0x100000000
+    return seqno
+
+################################################################################
+
+## readers: each yields (time, point, (type, lsid, advrtr), seqno, age), in
+## time order
+
+def lsupdLsas(msg):
+
+    ## the raw LSAs of an OSPFv3 LSUPD, or none for anything else
+    if len(msg) < OSPFV3_HDR_LEN + OSPFV3_LSUPD_LEN: return []
+    (ver, typ, l) = struct.unpack_from(">BBH", msg)
+    if ver != 3 or typ != MSG_TYPES["LSUPD"]: return []
+    try:
+        return splitLsas(msg[OSPFV3_HDR_LEN + OSPFV3_LSUPD_LEN:l])
+    except CodecExc:
+        return []
+
+def observe(ts, point, lsas):
+
+    for lsa in lsas:
+        (age, typ, lsid, advrtr, seqno) = struct.unpack_from(">HHLLL", lsa)
+        yield (ts, point, (typ, lsid, advrtr), seqno, age)
+
+def ip6Payload(pkt, off):
+
+    ## the OSPF message in an IPv6 packet at off, past extension headers
+    if len(pkt) < off + IP6_HDR_LEN or ord(pkt[off]) >> 4 != 6: return None
+    nh = ord(pkt[off + 6]) ; off += IP6_HDR_LEN
+    while nh != IPPROTO_OSPF:
+        if off + 8 > len(pkt): return None
+        if nh in IP6_EXTHDRS:
+            (nh, l) = (ord(pkt[off]), (ord(pkt[off + 1]) + 1) * 8)
+        elif nh == IP6_FRAGMENT:
+            (nh, l) = (ord(pkt[off]), 8)
+        else:
+            return None
+        off += l
+    return pkt[off:]
+
+def readPcap(path, point):
+
+    f = open(path, "rb")
+    try:
+        hdr = f.read(PCAP_HDR_LEN)
+        (magic, _, _, _, _, _, linktype) = struct.unpack(PCAP_HDR, hdr)
+        if magic != PCAP_MAGIC or linktype not in LINKTYPES:
+            raise ConvergenceExc("%s: not a pcap of a supported link type" % path)
+        skip = LINKTYPES[linktype]
+
+        while 1:
+            rec = f.read(PCAP_REC_LEN)
+            if len(rec) < PCAP_REC_LEN: break
+            (secs, usecs, caplen, _) = struct.unpack(PCAP_REC, rec)
+            pkt = f.read(caplen)
+            if linktype == 1 and pkt[12:14] == "\x81\x00": off = skip + 4
+            else: off = skip
+            msg = ip6Payload(pkt, off)
+            if msg is None: continue
+            for o in observe(secs + usecs * 1e-6, point, lsupdLsas(msg)): yield o
+    finally:
+        f.close()
+
+def readMrt(path, point):
+
+    f = open(path, "rb")
+    try:
+        while 1:
+            hdr = f.read(MRT_HDR_LEN)
+            if len(hdr) < MRT_HDR_LEN: break
+            (secs, typ, subtype, l) = struct.unpack(MRT_HDR, hdr)
+            body = f.read(l)
+            if typ not in (MRT_OSPFV3, MRT_OSPFV3_ET): continue
+
+            ts = secs ; off = 0
+            if typ == MRT_OSPFV3_ET:
+                ts += struct.unpack_from(">L", body)[0] * 1e-6 ; off = 4
+            (af, ) = struct.unpack_from(">H", body, off)
+            off += 2 + 2 * (af == 2 and 16 or 4)         # remote, local address
+            for o in observe(ts, point, lsupdLsas(body[off:])): yield o
+    finally:
+        f.close()
+
+def readRecords(path, point):
+
+    ## the monitor's binary export, as a collector would store it; mapped,
+    ## not read, so a large file costs address space only
+    f = open(path, "rb")
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if not size: return
+        buf = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+
+    try:
+        for rec in decodeRecords(buf):
+            if rec["T"] == MSG_TYPES["LSUPD"]:
+                for o in observe(rec["TS"], point, rec["ITEMS"]): yield o
+    finally:
+        buf.close()
+
+def readJson(path, point):
+
+    ## the monitor's JSON export, one message per line; needs TS
+    for line in open(path):
+        if not line.strip(): continue
+        msg = fromJson(line)
+        if msg["T"] != MSG_TYPES["LSUPD"] or "TS" not in msg: continue
+        lsas = msg["V"]["V"]["LSAS"]
+        for k in sorted(lsas, key=int):
+            h = lsas[k]["H"]
+            yield (msg["TS"], point, (h["T"], h["LSID"], h["ADVRTR"]), h["LSSEQNO"], h["AGE"])
+
+READERS = { "pcap": readPcap,
+            "mrt" : readMrt,
+            "rec" : readRecords,
+            "json": readJson,
+            }
+
+def sniff(path):
+
+    head = open(path, "rb").read(8)
+    if len(head) >= 4 and struct.unpack("<L", head[:4])[0] == PCAP_MAGIC: return "pcap"
+    if head[:1] == "{": return "json"
+    ## MRT starts with a timestamp, a record with its (small) length
+    if len(head) >= 4 and struct.unpack(">L", head[:4])[0] > 0x10000000: return "mrt"
+    return "rec"
+
+def readFile(spec, fmt=None):
+
+    ## spec is path or point=path
+    if "=" in spec: (point, path) = spec.split("=", 1)
+    else: (point, path) = (os.path.basename(spec), spec)
+    return READERS[fmt or sniff(path)](path, point)
+
+def merge(sources):
+
+    ## one time ordered stream from per-point streams
+    return heapq.merge(*sources)
+
+################################################################################
+
+class Analyzer:
+
+    def __init__(self, gap=DEFAULT_GAP, failure=None, max_instances=MAX_INSTANCES):
+
+        self._gap     = gap
+        self._failure = failure     # failure time, if known
+        self._max     = max_instances
+        self._seqs    = {}          # (type, lsid, advrtr): (highest seqno, flushed)
+        self._points  = {}          # every point heard from: 1
+        self._event   = None
+
+        self.events   = 0
+
+    def __repr__(self):
+
+        return "convergence: %d LSAs, %d points, %d events, gap %.1fs" %(
+            len(self._seqs), len(self._points), self.events, self._gap)
+
+    def add(self, ts, point, key, seqno, age):
+
+        ## -> the event this closed, or None
+        self._points[point] = 1
+        done = self.tick(ts)
+
+        ## a flush of the held seqno sorts after it: (seq, 1) > (seq, 0)
+        iid  = (key, seqno, age >= MAX_AGE)
+        seq  = (signedSeq(seqno), int(age >= MAX_AGE))
+        last = self._seqs.get(key)
+        ev   = self._event
+
+        if last is None or seq > last:
+            self._seqs[key] = seq
+            if ev is None:
+                ev = self._event = { "START"     : ts,
+                                     "LAST"      : ts,
+                                     "INSTANCES" : {},
+                                     "OVERFLOW"  : 0,
+                                     }
+            if len(ev["INSTANCES"]) >= self._max:
+                ev["OVERFLOW"] += 1
+            else:
+                ev["INSTANCES"][iid] = { "FIRST": ts, "AGE": age, "POINTS": { point: ts } }
+            ev["LAST"] = ts
+
+        elif ev is not None and iid in ev["INSTANCES"]:
+            ## an instance of this event reaching another point
+            pts = ev["INSTANCES"][iid]["POINTS"]
+            if point not in pts:
+                pts[point] = ts
+                ev["LAST"] = ts
+
+        return done
+
+    def tick(self, now):
+
+        ## close the open event once gap seconds pass without news
+        if self._event is not None and now - self._event["LAST"] > self._gap:
+            return self.flush()
+        return None
+
+    def flush(self):
+
+        ev = self._event ; self._event = None
+        if ev is None: return None
+        self.events += 1
+        return self.summary(ev)
+
+    #---------------------------------------------------------------------------
+
+    def summary(self, ev):
+
+        ## the failure is taken to have caused the first event after it
+        start = ev["START"]
+        if self._failure is not None and self._failure <= start:
+            start = self._failure ; self._failure = None
+
+        routers = {} ; points = {} ; partial = 0 ; npoints = len(self._points)
+        for ((key, seqno, flush), inst) in ev["INSTANCES"].iteritems():
+            times = inst["POINTS"].values()
+            r = routers.setdefault(key[2], { "FIRST": inst["FIRST"], "FLOOD": 0.0, "LSAS": 0 })
+            r["FIRST"] = min(r["FIRST"], inst["FIRST"])
+            r["FLOOD"] = max(r["FLOOD"], max(times) - min(times))
+            r["LSAS"] += 1
+            if len(times) < npoints: partial += 1
+            for (p, t) in inst["POINTS"].iteritems():
+                points[p] = max(points.get(p, t), t)
+
+        return { "START"      : start,
+                 "END"        : ev["LAST"],
+                 "CONVERGED"  : ev["LAST"] - start,
+                 "INSTANCES"  : len(ev["INSTANCES"]) + ev["OVERFLOW"],
+                 "UNTIMED"    : ev["OVERFLOW"],
+                 "PARTIAL"    : partial,
+                 "ROUTERS"    : dict([ (id2str(rid), { "ORIGINATION" : r["FIRST"] - start,
+                                                       "FLOODING"    : r["FLOOD"],
+                                                       "LSAS"        : r["LSAS"],
+                                                       })
+                                       for (rid, r) in routers.iteritems() ]),
+                 "POINTS"     : dict([ (p, t - start) for (p, t) in points.iteritems() ]),
+                 }
+
+def prtEvent(n, ev, level=0):
+
+    rs = [ "%sevent %d: %s, %d instances (%d not at every point), converged in %.3fs" %(
+        level*INDENT, n, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ev["START"])),
+        ev["INSTANCES"], ev["PARTIAL"], ev["CONVERGED"]) ]
+    if ev["UNTIMED"]:
+        rs.append("%s%d instances over the limit, not timed" % ((level+1)*INDENT, ev["UNTIMED"]))
+
+    rs.append("%s%-16s %12s %10s %5s" % ((level+1)*INDENT, "router", "originated", "flooded", "lsas"))
+    for (rid, r) in sorted(ev["ROUTERS"].items(), key=lambda x: x[1]["ORIGINATION"]):
+        rs.append("%s%-16s %+11.3fs %9.3fs %5d" %(
+            (level+1)*INDENT, rid, r["ORIGINATION"], r["FLOODING"], r["LSAS"]))
+
+    rs.append("%s%-16s %12s" % ((level+1)*INDENT, "point", "converged"))
+    for (p, t) in sorted(ev["POINTS"].items(), key=lambda x: x[1]):
+        rs.append("%s%-16s %+11.3fs" % ((level+1)*INDENT, p, t))
+
+    return "\n".join(rs)
+
+#-------------------------------------------------------------------------------
+
+def analyze(stream, gap=DEFAULT_GAP, failure=None, max_instances=MAX_INSTANCES):
+
+    ## generator of event summaries over a merged observation stream
+    a = Analyzer(gap, failure, max_instances)
+    for obs in stream:
+        ev = a.add(*obs)
+        if ev is not None: yield ev
+    ev = a.flush()
+    if ev is not None: yield ev
+
+def recordObs(session, payload):
+
+    ## one streamed export payload -> observations, the session its point
+    point = "%08x" % session
+    if payload[:1] == "{":
+        msg = fromJson(payload)
+        if msg["T"] != MSG_TYPES["LSUPD"] or "TS" not in msg: return []
+        return [ (msg["TS"], point, (h["T"], h["LSID"], h["ADVRTR"]), h["LSSEQNO"], h["AGE"])
+                 for h in [ l["H"] for l in msg["V"]["V"]["LSAS"].values() ] ]
+
+    rv = []
+    for rec in decodeRecords(payload):
+        if rec["T"] == MSG_TYPES["LSUPD"]:
+            rv.extend(observe(rec["TS"], point, rec["ITEMS"]))
+    return rv
+
+################################################################################
+
+if __name__ == "__main__":
+
+    from stream import StreamCollector
+
+    def usage():
+
+        print """Usage: %s [ options ] [point=]file ...
+       %s [ options ] -l <addr>
+    -h|--help              : Help
+    -j|--json              : Print events as JSON
+    -f|--format <fmt>      : Input format, pcap|mrt|rec|json [def: by content]
+    -g|--gap <s>           : Quiet time that ends an event [def: %.1f]
+    -t|--failure <time>    : Time of the failure, as seconds since the epoch
+    -n|--max-instances <n> : Instances timed per event [def: %d]
+    -l|--listen <addr>     : Collect monitor streams live on tcp:host:port
+                             or unix:path, one point per monitor""" %\
+            (os.path.basename(sys.argv[0]), os.path.basename(sys.argv[0]),
+             DEFAULT_GAP, MAX_INSTANCES)
+        sys.exit(1)
+
+    JSON    = 0
+    FORMAT  = None
+    GAP     = DEFAULT_GAP
+    FAILURE = None
+    MAXI    = MAX_INSTANCES
+    LISTEN  = None
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hjf:g:t:n:l:",
+                                   ("help", "json", "format=", "gap=", "failure=",
+                                    "max-instances=", "listen=", ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-j', '--json'):
+            JSON = 1
+
+        elif x in ('-f', '--format'):
+            if y not in READERS: usage()
+            FORMAT = y
+
+        elif x in ('-g', '--gap'):
+            GAP = float(y)
+
+        elif x in ('-t', '--failure'):
+            FAILURE = float(y)
+
+        elif x in ('-n', '--max-instances'):
+            MAXI = int(y)
+
+        elif x in ('-l', '--listen'):
+            LISTEN = y
+
+    if not (LISTEN or args): usage()
+
+    nevents = [ 0 ]
+    def show(ev):
+        nevents[0] += 1
+        if JSON: print json.dumps(ev, sort_keys=True)
+        else: print prtEvent(nevents[0], ev)
+        sys.stdout.flush()
+
+    if not LISTEN:
+        for ev in analyze(merge([ readFile(a, FORMAT) for a in args ]), GAP, FAILURE, MAXI):
+            show(ev)
+        sys.exit(0)
+
+    ## live: the collector thread adds, this one closes events as time passes
+    a = Analyzer(GAP, FAILURE, MAXI) ; lock = threading.Lock()
+    def handle(session, seq, payload):
+        lock.acquire()
+        try:
+            for obs in recordObs(session, payload):
+                ev = a.add(*obs)
+                if ev is not None: show(ev)
+        finally:
+            lock.release()
+
+    collector = StreamCollector(LISTEN, handle)
+    t = threading.Thread(target=collector.serve)
+    t.setDaemon(True)
+    t.start()
+    print "collecting on %s" % (collector.name(), )
+    try:
+        while 1:
+            time.sleep(1)
+            lock.acquire()
+            try:
+                ev = a.tick(time.time())
+                if ev is not None: show(ev)
+            finally:
+                lock.release()
+    except (KeyboardInterrupt):
+        collector.stop()
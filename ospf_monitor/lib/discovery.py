@@ -0,0 +1,458 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     discovery: testbed addressing (net_info.sh) from what the monitor
+##     has heard, with a netlink dump per node to fill the gaps
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## net_info.sh gives, for every node N and every LAN x it is on, the
+## node's address there, its MAC and its device:
+##
+##      n2_a="2001::204:23ff:feb7:2046"
+##      n2_a_mac="00:04:23:b7:20:46"
+##      n2_a_dev="enp9s4f0"
+##
+## Most of it is already in the LSDB.  Router-LSAs give each router's
+## interfaces (by interface ID) and what is at the other end; Link-LSAs
+## give the interface's link-local address and the prefixes on the link;
+## router Intra-Area-Prefix LSAs give loopbacks (n2_lb); hellos give the
+## link-local of neighbours whose Link-LSA has not been heard.  The MAC is
+## read back out of the EUI-64 link-local, and the address is the
+## link-local's interface identifier under the link's prefix -- 2001::
+## when none is advertised, as get_info.sh does.  Both ends of a link get
+## the same LAN letter, kept from an existing net_info.sh where it has the
+## interface, otherwise handed out in node order.
+##
+## Device names, and anything OSPF does not reach, come from one netlink
+## dump per node (ip -o link/addr, run by fleet.py on all nodes at once),
+## matched to the LSDB by link-local address.  The dump also names the
+## node; without one, router ID a.b.c.d is taken to be node d.
+
+import os, re, sys, json, time, socket, urllib2
+
+from ospfv3 import *
+from fleet import Fleet, NetnsExecutor, SshExecutor, nodeNames, testbedDomain
+
+#-------------------------------------------------------------------------------
+
+DEFAULT_GLOBAL = "2001::"       # get_info.sh: fe80:: -> 2001::
+LOW64          = (1L << 64) - 1
+
+DUMP_CMD = "hostname; ip -o link show; ip -o -6 addr show scope link"
+
+IP_LINK  = re.compile(r"^(\d+):\s+([^:@\s]+)[^:]*:.*link/(\S+)\s+([0-9a-f:]+)")
+IP_ADDR  = re.compile(r"^(\d+):\s+(\S+)\s+inet6\s+([0-9a-f:]+)/")
+NET_INFO = re.compile(r'^n(\d+)_([a-z]+)(_mac|_dev)?="([^"]*)"')
+
+class DiscoveryExc(Exception): pass
+
+def addr2int(s):
+
+    return bytes2ipv6(socket.inet_pton(socket.AF_INET6, s.split("%")[0]))
+
+def ll2mac(ll):
+
+    ## modified EUI-64 interface identifier -> MAC, or None
+    iid = addr2int(ll) & LOW64
+    b = [ (iid >> (56 - 8*i)) & 0xff for i in xrange(8) ]
+    if b[3] != 0xff or b[4] != 0xfe: return None
+    return ":".join([ "%02x" % x for x in (b[0] ^ 0x02, b[1], b[2], b[5], b[6], b[7]) ])
+
+def globalAddr(ll, prefixes=()):
+
+    ## the link-local's interface identifier under the first prefix that
+    ## leaves room for it
+    iid = addr2int(ll) & LOW64
+    for p in prefixes:
+        (addr, plen) = str(p).split("/")
+        net = addr2int(addr)
+        if int(plen) <= 64 or not (net & LOW64):
+            return ipv62str((net & ~LOW64) | iid)
+    return ipv62str(addr2int(DEFAULT_GLOBAL) | iid)
+
+def letters(i):
+
+    ## 0 -> a, 25 -> z, 26 -> aa
+    s = ""
+    while 1:
+        s = chr(ord("a") + i % 26) + s
+        i = i / 26 - 1
+        if i < 0: return s
+
+def nodeNumber(name):
+
+    m = re.match(r"node(\d+)", name or "")
+    return m and int(m.group(1)) or None
+
+################################################################################
+
+def fromLsdb(entries, nbrs=()):
+
+    ## -> { router id: { "RID", "IFACES": { interface id: iface }, "LOOPBACKS" } }
+    ## entries as in a Snapshot (or its JSON), nbrs as Neighbours.values()
+    rtrs = {}
+    def iface(rid, ifid):
+        r = rtrs.setdefault(rid, { "RID": rid, "IFACES": {}, "LOOPBACKS": [], "PREFIXES": [] })
+        return r["IFACES"].setdefault(ifid, { "IFID": ifid, "LLADDR": None, "PREFIXES": [],
+                                              "NBR": None, "TYPE": None })
+
+    for e in entries:
+        t = e["T"] ; v = e["V"] or {} ; tlvs = v.get("TLVS", [])
+        adv = id2str(e["H"]["ADVRTR"]) ; lsid = e["H"]["LSID"]
+
+        if t in (0x2001, 0xA021):
+            if t == 0x2001: links = v.get("INTERFACES", [])
+            else: links = [ x["V"] for x in tlvs if x["T"] == ELSA_TLV_TYPES["ROUTER LINK"] ]
+            for l in links:
+                i = iface(adv, l["INTERFACEID"])
+                i["TYPE"] = RTR_LINK_TYPE.get(l["TYPE"], l["TYPE"])
+                i["NBR"]  = (id2str(l["NBROUTERID"]), l["NBINTERFACEID"])
+
+        elif t == 0x0008:
+            i = iface(adv, lsid)
+            i["LLADDR"]   = v.get("linklocaladdress")
+            i["PREFIXES"] = [ str(p) for p in v.get("prefixes", []) ]
+
+        elif t == 0x8028:
+            i = iface(adv, lsid)
+            for x in tlvs:
+                if x["T"] == ELSA_TLV_TYPES["IPV6 LINK LOCAL"]: i["LLADDR"] = x["V"]["ADDR"]
+                if x["T"] == ELSA_TLV_TYPES["INTRA AREA PREFIX"]:
+                    i["PREFIXES"].append(str(x["V"]["PREFIX"]))
+
+        elif t in (0x2009, 0xA029):
+            if t == 0x2009:
+                (reft, pfxs) = (v.get("reflstype"), v.get("prefixes", []))
+            else:
+                (reft, pfxs) = (v.get("REFLSTYPE"), [ x["V"]["PREFIX"] for x in tlvs
+                                                      if x["T"] == ELSA_TLV_TYPES["INTRA AREA PREFIX"] ])
+            if reft not in (0x2001, 0xA021): continue
+            r = rtrs.setdefault(adv, { "RID": adv, "IFACES": {}, "LOOPBACKS": [], "PREFIXES": [] })
+            for p in pfxs:
+                p = str(p)
+                if p.endswith("/128"): r["LOOPBACKS"].append(p.split("/")[0])
+                else: r["PREFIXES"].append(p)
+
+    for n in nbrs:
+        src = n.get("SRC")
+        if not src: continue
+        i = iface(id2str(n["RID"]), n["INTERFACEID"])
+        if i["LLADDR"] is None: i["LLADDR"] = src.split("%")[0]
+
+    return rtrs
+
+def parseDump(out):
+
+    ## `DUMP_CMD` output -> (hostname, { dev: { "IFINDEX", "MAC", "LLADDR" } })
+    lines = out.splitlines()
+    if not lines: raise DiscoveryExc("empty dump")
+    host = lines[0].strip() ; devs = {}
+    for l in lines[1:]:
+        m = IP_LINK.match(l)
+        if m:
+            (idx, dev, kind, mac) = m.groups()
+            if kind == "loopback": continue
+            d = devs.setdefault(dev, { "IFINDEX": int(idx), "MAC": None, "LLADDR": None })
+            d["MAC"] = mac
+            continue
+        m = IP_ADDR.match(l)
+        if m and m.group(2) in devs:
+            devs[m.group(2)]["LLADDR"] = m.group(3)
+    return (host, devs)
+
+def readNetInfo(path):
+
+    ## an existing net_info.sh -> { (node, mac or dev): LAN letter }
+    rv = {}
+    for l in open(path):
+        m = NET_INFO.match(l.strip())
+        if m and m.group(3) and m.group(4):
+            rv[(int(m.group(1)), m.group(4))] = m.group(2)
+    return rv
+
+################################################################################
+
+class Topology:
+
+    def __init__(self, rtrs, dumps=None, keep=None):
+
+        ## rtrs from fromLsdb(), dumps { name: (hostname, devs) } from
+        ## parseDump(), keep from readNetInfo()
+        self.nodes = {}         # node number: { "NAME", "RID", "IFACES": [], "LOOPBACKS" }
+        self.links = {}         # letter: [ (node, iface) ]
+        self._keep = keep or {}
+
+        lls = {}                # link-local: (node name, dev, dump entry)
+        for (name, (host, devs)) in (dumps or {}).items():
+            for (dev, d) in devs.items():
+                if d["LLADDR"]: lls[d["LLADDR"]] = (host.split(".")[0], dev, d)
+
+        seen = set()
+        for (rid, r) in sorted(rtrs.items()):
+            node = None ; ifaces = []
+            for (ifid, i) in sorted(r["IFACES"].items()):
+                if not i["LLADDR"]: continue
+                x = dict(i) ; x["DEV"] = None ; x["MAC"] = ll2mac(i["LLADDR"])
+                d = lls.get(i["LLADDR"])
+                if d is not None:
+                    node = node or nodeNumber(d[0])
+                    x["DEV"] = d[1] ; x["MAC"] = d[2]["MAC"] or x["MAC"]
+                    seen.add(i["LLADDR"])
+                x["ADDR"] = globalAddr(i["LLADDR"], i["PREFIXES"] + r["PREFIXES"])
+                ifaces.append(x)
+            if node is None: node = str2id(rid) & 0xff
+            n = self.nodes.setdefault(node, { "NAME": "node%d" % node, "RID": rid,
+                                              "IFACES": [], "LOOPBACKS": [] })
+            n["IFACES"] += ifaces ; n["LOOPBACKS"] += r["LOOPBACKS"]
+
+        ## interfaces the LSDB does not know of: from the dumps alone
+        for (ll, (host, dev, d)) in lls.items():
+            if ll in seen: continue
+            node = nodeNumber(host)
+            if node is None: continue
+            n = self.nodes.setdefault(node, { "NAME": host, "RID": None,
+                                              "IFACES": [], "LOOPBACKS": [] })
+            n["IFACES"].append({ "IFID": d["IFINDEX"], "LLADDR": ll, "PREFIXES": [],
+                                 "NBR": None, "TYPE": None, "DEV": dev, "MAC": d["MAC"],
+                                 "ADDR": globalAddr(ll) })
+
+        self.name()
+
+    def __repr__(self):
+
+        return "topology: %d nodes, %d interfaces, %d LANs" %(
+            len(self.nodes), sum([ len(n["IFACES"]) for n in self.nodes.values() ]),
+            len(self.links))
+
+    def name(self):
+
+        ## a letter per link, shared by its ends: a point-to-point link is
+        ## both ends, a transit link the DR's interface
+        byrid = dict([ (n["RID"], k) for (k, n) in self.nodes.items() if n["RID"] ])
+        links = {}
+        for (k, n) in sorted(self.nodes.items()):
+            for i in n["IFACES"]:
+                end = (n["RID"], i["IFID"])
+                if i["TYPE"] == "TRANSIT": lid = ("net", ) + tuple(i["NBR"])
+                elif i["NBR"] is not None: lid = tuple(sorted([ end, tuple(i["NBR"]) ]))
+                else: lid = (k, i["IFID"])
+                links.setdefault(lid, []).append((k, i))
+
+        used = set() ; todo = []
+        for ends in sorted(links.values(), key=lambda e: [ (k, i["IFID"]) for (k, i) in e ]):
+            kept = [ self._keep.get((k, i["MAC"])) or self._keep.get((k, i["DEV"]))
+                     for (k, i) in ends ]
+            kept = [ x for x in kept if x and x not in used ]
+            if kept:
+                used.add(kept[0]) ; self.links[kept[0]] = ends
+            else:
+                todo.append(ends)
+        n = 0
+        for ends in todo:
+            while letters(n) in used: n += 1
+            used.add(letters(n)) ; self.links[letters(n)] = ends
+
+        for (lan, ends) in self.links.items():
+            for (k, i) in ends: i["LAN"] = lan
+
+    #---------------------------------------------------------------------------
+
+    def netInfo(self):
+
+        out = [ "#!/bin/bash", "", "#IPv6 and MAC" ]
+        for (k, n) in sorted(self.nodes.items()):
+            out.append("#node%d" % k)
+            for i in sorted(n["IFACES"], key=lambda i: (len(i["LAN"]), i["LAN"])):
+                v = "n%d_%s" % (k, i["LAN"])
+                out.append('%s="%s"' % (v, i["ADDR"]))
+                if i["MAC"]: out.append('%s_mac="%s"' % (v, i["MAC"]))
+                if i["DEV"]: out.append('%s_dev="%s"' % (v, i["DEV"]))
+            for (j, lb) in enumerate(n["LOOPBACKS"]):
+                out.append('n%d_lb%s="%s"' % (k, j and str(j) or "", lb))
+            out.append("")
+        return "\n".join(out)
+
+    def model(self):
+
+        return { "NODES" : dict([ (n["NAME"], n) for n in self.nodes.values() ]),
+                 "LANS"  : dict([ (lan, [ self.nodes[k]["NAME"] for (k, i) in ends ])
+                                  for (lan, ends) in self.links.items() ]),
+                 }
+
+################################################################################
+
+def fetch(url):
+
+    ## the LSDB and neighbours of a running monitor, over its API
+    url = url.rstrip("/")
+    snap = json.load(urllib2.urlopen(url + "/snapshot", timeout=10))
+    try:
+        nbrs = json.load(urllib2.urlopen(url + "/neighbours", timeout=10))
+    except urllib2.HTTPError:
+        nbrs = []
+    return (snap["LSAS"], nbrs)
+
+def dump(fleet, nodes):
+
+    ## -> { node: (hostname, devs) } for the nodes that answered
+    rv = {}
+    for r in fleet.run(nodes, [ ("run", DUMP_CMD) ]):
+        if not r.ok: continue
+        try:
+            rv[r.node] = parseDump(r.out)
+        except DiscoveryExc:
+            pass
+    return rv
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import getopt
+
+    def usage():
+        print """Usage: %s [ options ]
+    -h|--help                   : Help
+    -q|--quiet                  : Be quiet
+    -a|--api <url>              : Monitor API, eg, http://127.0.0.1:8081
+    -c|--checkpoint <file>      : Or a monitor checkpoint (lib/checkpoint.py)
+    -n|--nodes <n,...>          : Dump these nodes' interfaces over ssh
+                                  (lib/fleet.py), for device names and what
+                                  the LSDB lacks
+    -N|--netns <root>           : Dump network namespaces instead of ssh
+    -w|--workers <n>            : Nodes dumped at once [def: 8]
+    -k|--keep <net_info.sh>     : Keep the LAN letters of an earlier file
+    -o|--output <file>          : net_info.sh to write [def: stdout]
+    -j|--json <file>            : Also write the model as JSON
+    -t|--test                   : Check a built-in LSDB and neighbours, and
+                                  exit""" %\
+            os.path.basename(sys.argv[0])
+        sys.exit(1)
+
+    VERBOSE = 1
+    API     = None
+    CKPT    = None
+    NODES   = None
+    NETNS   = None
+    WORKERS = 8
+    KEEP    = None
+    OUTPUT  = None
+    JSON    = None
+    TEST    = False
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hqa:c:n:N:w:k:o:j:t",
+                                   ("help", "quiet", "api=", "checkpoint=", "nodes=",
+                                    "netns=", "workers=", "keep=", "output=", "json=",
+                                    "test", ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-q', '--quiet'):
+            VERBOSE = 0
+
+        elif x in ('-a', '--api'):
+            API = y
+
+        elif x in ('-c', '--checkpoint'):
+            CKPT = y
+
+        elif x in ('-n', '--nodes'):
+            NODES = y
+
+        elif x in ('-N', '--netns'):
+            NETNS = y
+
+        elif x in ('-w', '--workers'):
+            WORKERS = int(y)
+
+        elif x in ('-k', '--keep'):
+            KEEP = y
+
+        elif x in ('-o', '--output'):
+            OUTPUT = y
+
+        elif x in ('-j', '--json'):
+            JSON = y
+
+        elif x in ('-t', '--test'):
+            TEST = True
+
+    if TEST:
+        ## router 1.1.1.1 advertises a point-to-point link to 2.2.2.2,
+        ## which is known only by its hellos, as Ospfv3.parseMsg tags them
+        from lsdb import Lsdb, Neighbours
+        lsdb = Lsdb() ; nb = Neighbours()
+        body = struct.pack(OSPFV3_LSARTR, 0, "\x00\x00\x13") +\
+               struct.pack(OSPFV3_LSARTR_INTERFACE, 1, 0, 10, 3, 4, str2id("2.2.2.2"))
+        raw = mkOspfMsg(MSG_TYPES["LSUPD"],
+                        mkLsUpd([ mkLsa(0x2001, 0, str2id("1.1.1.1"), 0x80000001, body) ]),
+                        str2id("1.1.1.1"))
+        lsdb.update(parseOspfMsg(raw, 0), raw)
+        raw = mkOspfMsg(MSG_TYPES["HELLO"], mkHello(4, 1, 0x13, 10, 40, 0, 0, []),
+                        str2id("2.2.2.2"))
+        msg = parseOspfMsg(raw, 0) ; msg["SRC"] = "fe80::4843:bcff:fe14:ef60%vb"
+        nb.hello(msg)
+
+        rtrs = fromLsdb(lsdb.snapshot().lsas.values(), nb.values())
+        assert rtrs["2.2.2.2"]["IFACES"][4]["LLADDR"] == "fe80::4843:bcff:fe14:ef60"
+        topo = Topology(rtrs)
+        assert topo.nodes[2]["IFACES"][0]["MAC"] == "4a:43:bc:14:ef:60"
+        print topo.netInfo()
+        sys.exit(0)
+
+    if not (API or CKPT or NODES): usage()
+    t = time.time()
+
+    entries = [] ; nbrs = []
+    if API:
+        (entries, nbrs) = fetch(API)
+    elif CKPT:
+        from lsdb import Lsdb, Neighbours
+        from checkpoint import load
+        lsdb = Lsdb() ; nb = Neighbours()
+        load(CKPT, lsdb, nb)
+        entries = lsdb.snapshot().lsas.values() ; nbrs = nb.values()
+
+    dumps = {}
+    if NODES:
+        exe = NETNS and NetnsExecutor(NETNS) or SshExecutor()
+        fleet = Fleet(exe, WORKERS, 0)
+        try:
+            dumps = dump(fleet, NETNS and nodeNames(NODES) or nodeNames(NODES, testbedDomain()))
+        finally:
+            exe.close()
+
+    topo = Topology(fromLsdb(entries, nbrs), dumps, KEEP and readNetInfo(KEEP))
+    text = topo.netInfo()
+    if OUTPUT:
+        f = open(OUTPUT, "w") ; f.write(text) ; f.close()
+    else:
+        print text
+    if JSON:
+        f = open(JSON, "w") ; json.dump(topo.model(), f, indent=1, sort_keys=True) ; f.close()
+
+    if VERBOSE > 0:
+        print >>sys.stderr, "%s from %d LSAs, %d neighbours, %d dumps in %.2fs" %(
+            topo, len(entries), len(nbrs), len(dumps), time.time() - t)
@@ -0,0 +1,420 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     fleet: run deployment steps on many testbed nodes at once
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## The start_all_* / kill_all_* / get_all_info scripts walk the nodes one
+## at a time, and every scp and ssh pays for its own TCP and SSH
+## handshake.  Here an operation is a list of steps -- ("copy", paths,
+## dest) or ("run", command) -- run on every node by a bounded pool of
+## worker threads, the steps of one node in order.  SshExecutor opens one
+## master connection per node (ControlMaster, ControlPersist) and every
+## scp and ssh after the first is multiplexed over it.
+##
+## NetnsExecutor stands in for ssh on a single machine: node N is network
+## namespace N, its home directory a directory under a root, so the same
+## operations can be tried without a testbed.
+##
+## Each node gets a Result: ok or not, exit status, output, and the time
+## of each step and of the whole.
+
+import os, sys, time, socket, shutil, threading, subprocess, Queue
+
+#-------------------------------------------------------------------------------
+
+DEFAULT_WORKERS = 8
+DEFAULT_TIMEOUT = 300           # seconds per step
+CONTROL_PERSIST = 60            # seconds a master connection outlives its use
+SSH_ARGS = [ "-o", "StrictHostKeyChecking=no", "-o", "UserKnownHostsFile=/dev/null",
+             "-o", "BatchMode=yes", "-o", "LogLevel=ERROR" ]
+
+class FleetExc(Exception): pass
+
+def testbedDomain(hostname=None):
+
+    ## node1.srv6.phantomnet.emulab.net -> srv6.phantomnet.emulab.net, as
+    ## the shell scripts work it out
+    hostname = hostname or socket.getfqdn()
+    return ".".join(hostname.split(".")[1:5])
+
+def nodeNames(nodes, domain=None):
+
+    ## "2,3,4,7" or "2-4,7" -> [ "node2.<domain>", ... ]; names are kept
+    rv = []
+    for n in nodes.split(","):
+        n = n.strip()
+        if not n: continue
+        if "-" in n and n.replace("-", "").isdigit():
+            (a, b) = n.split("-")
+            ns = [ "node%d" % i for i in xrange(int(a), int(b) + 1) ]
+        elif n.isdigit():
+            ns = [ "node%s" % n ]
+        else:
+            ns = [ n ]
+        rv += [ (domain and "." not in x) and "%s.%s" % (x, domain) or x for x in ns ]
+    return rv
+
+def execute(argv, timeout=DEFAULT_TIMEOUT, env=None):
+
+    ## -> (exit status, stdout, stderr); the process is killed at timeout
+    p = subprocess.Popen(argv, stdin=open(os.devnull), stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE, env=env, close_fds=True)
+    timer = threading.Timer(timeout, p.kill)
+    timer.setDaemon(True)
+    timer.start()
+    try:
+        (out, err) = p.communicate()
+    finally:
+        timer.cancel()
+    if p.returncode == -9: err += "killed after %ds\n" % timeout
+    return (p.returncode, out, err)
+
+################################################################################
+
+class SshExecutor:
+
+    def __init__(self, user=None, args=SSH_ARGS, controldir=None, timeout=DEFAULT_TIMEOUT):
+
+        self._user  = user
+        self._dir   = controldir or os.path.join("/tmp", "fleet-%d" % os.getuid())
+        if not os.path.isdir(self._dir): os.makedirs(self._dir, 0700)
+        self._args  = list(args) + [
+            "-o", "ControlMaster=auto",
+            "-o", "ControlPath=%s" % os.path.join(self._dir, "%r@%h:%p"),
+            "-o", "ControlPersist=%d" % CONTROL_PERSIST ]
+        self._nodes = set()
+        self.timeout = timeout
+
+    def __repr__(self):
+
+        return "ssh, multiplexed through %s" % self._dir
+
+    def target(self, node):
+
+        return self._user and "%s@%s" % (self._user, node) or node
+
+    def run(self, node, cmd):
+
+        self._nodes.add(node)
+        return execute([ "ssh" ] + self._args + [ self.target(node), cmd ], self.timeout)
+
+    def copy(self, node, paths, dest):
+
+        self._nodes.add(node)
+        return execute([ "scp", "-r", "-q" ] + self._args + list(paths) +
+                       [ "%s:%s" % (self.target(node), dest) ], self.timeout)
+
+    def close(self):
+
+        ## masters would go by themselves after CONTROL_PERSIST
+        for node in self._nodes:
+            execute([ "ssh" ] + self._args + [ "-O", "exit", self.target(node) ], 10)
+        self._nodes = set()
+
+class NetnsExecutor:
+
+    def __init__(self, root, timeout=DEFAULT_TIMEOUT):
+
+        self._root = root
+        self.timeout = timeout
+
+    def __repr__(self):
+
+        return "network namespaces, homes under %s" % self._root
+
+    def home(self, node):
+
+        path = os.path.join(self._root, node)
+        if not os.path.isdir(path): os.makedirs(path)
+        return path
+
+    def run(self, node, cmd):
+
+        home = self.home(node)
+        env = dict(os.environ) ; env["HOME"] = home
+        return execute([ "ip", "netns", "exec", node, "sh", "-c",
+                         "cd %s && %s" % (home, cmd) ], self.timeout, env)
+
+    def copy(self, node, paths, dest):
+
+        dest = os.path.join(self.home(node), dest.replace("~/", "").lstrip("~"))
+        try:
+            for p in paths:
+                d = os.path.join(dest, os.path.basename(p.rstrip("/")))
+                if os.path.isdir(p):
+                    if os.path.exists(d): shutil.rmtree(d)
+                    shutil.copytree(p, d, symlinks=True)
+                else:
+                    shutil.copy2(p, d)
+        except (IOError, OSError), e:
+            return (1, "", "%s\n" % e)
+        return (0, "", "")
+
+    def close(self):
+
+        pass
+
+################################################################################
+
+class Result:
+
+    def __init__(self, node):
+
+        self.node    = node
+        self.ok      = True
+        self.status  = 0
+        self.out     = ""
+        self.err     = ""
+        self.steps   = []       # (step name, seconds)
+        self.seconds = 0.0
+
+    def __repr__(self):
+
+        return "%-32s %-6s %6.2fs  %s" % (
+            self.node, self.ok and "ok" or "FAILED", self.seconds,
+            " ".join([ "%s:%.2f" % s for s in self.steps ]))
+
+class Fleet:
+
+    def __init__(self, executor, workers=DEFAULT_WORKERS, verbose=1):
+
+        self._exe     = executor
+        self._workers = workers
+        self._verbose = verbose
+        self._lock    = threading.Lock()
+
+    def __repr__(self):
+
+        return "fleet: %d workers over %s" % (self._workers, self._exe)
+
+    def node(self, node, steps):
+
+        ## the steps of one node, in order, up to the first that fails
+        r = Result(node) ; t0 = time.time()
+        for step in steps:
+            t = time.time()
+            if step[0] == "copy":
+                (status, out, err) = self._exe.copy(node, step[1], step[2])
+            elif step[0] == "run":
+                (status, out, err) = self._exe.run(node, step[1])
+            else:
+                raise FleetExc("unknown step %s" % (step, ))
+            r.steps.append((step[0], time.time() - t))
+            if step[0] == "run": r.out += out
+            r.err += err ; r.status = status
+            if status != 0:
+                r.ok = False
+                break
+        r.seconds = time.time() - t0
+        return r
+
+    def run(self, nodes, steps):
+
+        ## -> [ Result ] in the order of nodes; each is printed as it ends
+        jobs = Queue.Queue() ; results = {}
+        for n in nodes: jobs.put(n)
+
+        def worker():
+            while 1:
+                try:
+                    n = jobs.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    r = self.node(n, steps)
+                except Exception, e:
+                    r = Result(n) ; r.ok = False ; r.status = -1
+                    r.err = "%s: %s\n" % (e.__class__.__name__, e)
+                self._lock.acquire()
+                try:
+                    results[n] = r
+                    if self._verbose > 0:
+                        print r
+                        if not r.ok or self._verbose > 1:
+                            for l in r.err.splitlines(): print "    %s" % l
+                        sys.stdout.flush()
+                finally:
+                    self._lock.release()
+
+        threads = [ threading.Thread(target=worker)
+                    for i in xrange(min(self._workers, len(nodes))) ]
+        for t in threads:
+            t.setDaemon(True)
+            t.start()
+        for t in threads:
+            while t.isAlive(): t.join(1)
+
+        return [ results[n] for n in nodes ]
+
+def summary(results, seconds):
+
+    failed = [ r.node for r in results if not r.ok ]
+    return "%d nodes: %d ok, %d failed%s; %.2fs (%.2fs one after another)" %(
+        len(results), len(results) - len(failed), len(failed),
+        failed and " (%s)" % ", ".join(failed) or "", seconds,
+        sum([ r.seconds for r in results ]))
+
+#-------------------------------------------------------------------------------
+
+## the shell scripts' operations; paths relative to the repository
+MONITOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR    = os.path.dirname(MONITOR_DIR)
+
+def operation(name, args, frrdir=None):
+
+    if name == "start-monitor":
+        if len(args) != 2: raise FleetExc("start-monitor <collector host> <port>")
+        return [ ("copy", [ MONITOR_DIR ], "~/"),
+                 ("run", "cd ~/ospf_monitor/; sudo screen -S ospf_monitor -d -m "
+                         "./start_monitor.sh %s %s" % tuple(args)) ]
+    if name == "kill-monitor":
+        return [ ("run", "cd ~/ospf_monitor/; sudo ./kill_monitor.sh") ]
+    if name in ("start-frr", "kill-frr"):
+        d = frrdir or os.path.join(REPO_DIR, "frr")
+        return [ ("copy", [ os.path.join(d, "kill_frr.sh"), os.path.join(d, "start_frr.sh") ], "~/"),
+                 ("run", "sudo ./%s_frr.sh" % name.split("-")[0]) ]
+    if name == "info":
+        return [ ("copy", [ os.path.join(frrdir or REPO_DIR, "get_info.sh") ], "~/"),
+                 ("run", "./get_info.sh") ]
+    if name == "run":
+        if not args: raise FleetExc("run <command>")
+        return [ ("run", " ".join(args)) ]
+    raise FleetExc("unknown operation %s" % name)
+
+OPERATIONS = ( "start-monitor", "kill-monitor", "start-frr", "kill-frr", "info", "run" )
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import getopt
+
+    def usage():
+        print """Usage: %s [ options ] <operation> [ args ]
+    operations:
+        start-monitor <collector host> <port>  copy ospf_monitor and start it
+        kill-monitor                           stop the monitor
+        start-frr | kill-frr                   copy the FRR scripts and run one
+        info                                   run get_info.sh, write net_info.sh
+        run <command>                          run a command
+    -h|--help                   : Help
+    -q|--quiet                  : Be quiet
+    -v|--verbose                : Be verbose
+    -n|--nodes <n,...>          : Nodes, numbers, ranges or names [def: 2,3,4,7]
+    -d|--domain <domain>        : Testbed domain [def: from this host's name]
+    -u|--user <user>            : ssh user
+    -w|--workers <n>            : Nodes worked on at once [def: %d]
+    -f|--frr <dir>              : Where the FRR/get_info scripts are
+    -o|--output <file>          : info: where to write [def: net_info.sh]
+    -N|--netns <root>           : Stand-in: nodes are network namespaces,
+                                  their homes directories under root""" %(
+            os.path.basename(sys.argv[0]), DEFAULT_WORKERS)
+        sys.exit(1)
+
+    VERBOSE = 1
+    NODES   = "2,3,4,7"
+    DOMAIN  = None
+    USER    = None
+    WORKERS = DEFAULT_WORKERS
+    FRRDIR  = None
+    OUTPUT  = "net_info.sh"
+    NETNS   = None
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hqvn:d:u:w:f:o:N:",
+                                   ("help", "quiet", "verbose", "nodes=", "domain=",
+                                    "user=", "workers=", "frr=", "output=", "netns=", ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-q', '--quiet'):
+            VERBOSE = 0
+
+        elif x in ('-v', '--verbose'):
+            VERBOSE = 2
+
+        elif x in ('-n', '--nodes'):
+            NODES = y
+
+        elif x in ('-d', '--domain'):
+            DOMAIN = y
+
+        elif x in ('-u', '--user'):
+            USER = y
+
+        elif x in ('-w', '--workers'):
+            WORKERS = int(y)
+
+        elif x in ('-f', '--frr'):
+            FRRDIR = y
+
+        elif x in ('-o', '--output'):
+            OUTPUT = y
+
+        elif x in ('-N', '--netns'):
+            NETNS = y
+
+    if not args or args[0] not in OPERATIONS: usage()
+    try:
+        steps = operation(args[0], args[1:], FRRDIR)
+    except FleetExc, fe:
+        print "[ *** %s *** ]" % fe
+        usage()
+
+    if NETNS:
+        exe = NetnsExecutor(NETNS)
+        nodes = nodeNames(NODES)
+    else:
+        exe = SshExecutor(USER)
+        if DOMAIN is None: DOMAIN = testbedDomain()
+        nodes = nodeNames(NODES, DOMAIN)
+
+    fleet = Fleet(exe, WORKERS, VERBOSE)
+    if VERBOSE > 0: print fleet
+
+    t = time.time()
+    try:
+        results = fleet.run(nodes, steps)
+    finally:
+        exe.close()
+    t = time.time() - t
+
+    if args[0] == "info":
+        ## as get_all_info.sh: this node first, then the others in order
+        f = open(OUTPUT, "w")
+        f.write("#!/bin/bash\n")
+        if not NETNS:
+            (status, out, err) = execute([ os.path.join(FRRDIR or REPO_DIR, "get_info.sh") ])
+            f.write(out)
+        for r in results: f.write(r.out)
+        f.close()
+        if VERBOSE > 0: print "net_info to %s" % OUTPUT
+
+    elif VERBOSE > 1 or args[0] == "run":
+        for r in results:
+            for l in r.out.splitlines(): print "%s: %s" % (r.node.split(".")[0], l)
+
+    if VERBOSE > 0: print summary(results, t)
+    sys.exit(not [ r for r in results if not r.ok ] and 0 or 1)
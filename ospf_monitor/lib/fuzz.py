@@ -0,0 +1,263 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     fuzz: mutation fuzzer for the OSPFv3 message parser and the
+##     receive pipeline behind it
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## Well-formed messages of every type, carrying every LSA type the parser
+## decodes, are mutated -- truncated, bit flipped, length and count fields
+## overwritten, bytes inserted or dropped -- and put through what the
+## monitor does with a received message: parseOspfMsg(), the LSA checksum
+## check (badLsas/dropLsas; every other message skips it, as with -C),
+## the LSDB (update/learn, with churn subscribed) or the neighbour table,
+## both export encodings, and the collector's decode of the binary
+## record.  Whatever the input, the parser must either return or raise
+## ParseExc, and nothing after it may raise at all; anything else is a
+## bug, and the offending message is printed in hex so it can be
+## replayed.  A run exits non-zero if it found any.
+
+import sys, os, random, struct, socket, getopt, traceback
+
+from ospfv3 import *
+from lsdb import Lsdb, Neighbours, MAX_AGE
+from churn import Churn
+from codec import JsonCodec, BinCodec, decodeRecord, parseRecord
+
+#-------------------------------------------------------------------------------
+
+DEFAULT_ITERATIONS = 100000
+VERBOSE_EVERY      = 10         # every nth message is also parsed verbosely
+
+def tlv(t, v):
+
+    return struct.pack(OSPFV3_TLV, t, len(v)) + v + "\x00" * (-len(v) % 4)
+
+def addr(s):
+
+    return socket.inet_pton(socket.AF_INET6, s)
+
+def seeds():
+
+    ## one message of each type; the LSUPD carries one LSA of each type
+    rid = str2id("10.0.0.1") ; opts = opts2str(0x13)
+    pfx = struct.pack(OSPFV3_PREFIX, 64, 0, 10) + addr("2001:db8::")[:8]
+
+    endx = tlv(31, struct.pack(OSPFV3_SUBTLV_ENDXSID, 5, 0x80, 0, 0, 1, 0) +\
+               addr("fc00:0:1:e001::"))
+    lanx = tlv(32, struct.pack(OSPFV3_SUBTLV_LANENDXSID, 5, 0, 0, 0, 1, 0, 2) +\
+               addr("fc00:0:1:e002::"))
+    sids = tlv(1, struct.pack(OSPFV3_SUBTLV_ENDSID, 0, 0, 1) + addr("fc00:0:1::") +\
+               tlv(10, struct.pack(OSPFV3_SUBTLV_SIDSTRUCT, 32, 16, 16, 0)))
+    tpfx = struct.pack(OSPFV3_TLV_PREFIX, 10, 64, 0, 0) + addr("2001:db8::")[:8]
+
+    bodies = [
+        (0x2001, struct.pack(OSPFV3_LSARTR, 1, opts) +
+                 struct.pack(OSPFV3_LSARTR_INTERFACE, 1, 0, 10, 1, 2, 2) +
+                 struct.pack(OSPFV3_LSARTR_INTERFACE, 2, 0, 10, 3, 4, 3)),
+        (0x2002, struct.pack(OSPFV3_LSANET, 0, opts) + struct.pack(">LL", 1, 2)),
+        (0x2003, struct.pack(OSPFV3_LSAIAPREFIX, 10) + pfx),
+        (0x2004, struct.pack(OSPFV3_LSAIARTR, 0, opts, 10, 2)),
+        (0x4005, struct.pack(OSPFV3_LSAASEXT, 0x07000014) +
+                 struct.pack(OSPFV3_PREFIX, 64, 0, 0x2001) + addr("2001:db8::")[:8] +
+                 addr("2001:db8::1") + struct.pack(">LL", 7, 1)),
+        (0x0008, struct.pack(OSPFV3_LSALINK, 1, opts, 0xfe800000, 0, 0, 1, 2) + pfx + pfx),
+        (0x2009, struct.pack(OSPFV3_LSAINTRAPREFIX, 2, 0x2001, 0, rid) + pfx + pfx),
+        (0xA021, struct.pack(OSPFV3_LSARTR, 0, opts) +
+                 tlv(1, struct.pack(OSPFV3_LSARTR_INTERFACE, 1, 0, 10, 1, 2, 2) + endx + lanx)),
+        (0xA022, struct.pack(OSPFV3_LSANET, 0, opts) + tlv(2, struct.pack(">LL", 1, 2))),
+        (0xA023, tlv(3, tpfx)),
+        (0xA024, tlv(4, struct.pack(OSPFV3_LSAIARTR, 0, opts, 10, 2))),
+        (0xC025, tlv(5, tpfx + tlv(1, addr("2001:db8::1")) + tlv(3, struct.pack(">L", 7)))),
+        (0x8028, struct.pack(OSPFV3_ELSALINK, 1, opts) + tlv(6, tpfx) +
+                 tlv(7, addr("fe80::1")) + tlv(8, struct.pack(">L", 1))),
+        (0xA029, struct.pack(OSPFV3_LSAINTRAPREFIX, 0, 0xA021, 0, rid) + tlv(6, tpfx)),
+        (0xA02A, tlv(1, struct.pack(OSPFV3_TLV_LOCATOR, 1, 0, 48, 0x80, 10) +
+                        addr("fc00:0:1::") + sids)),
+        (0x2006, "\x00" * 8),
+        ]
+    lsas = [ mkLsa(t, 0, rid, 0x80000001, b) for (t, b) in bodies ]
+    hdrs = [ l[:OSPFV3_LSAHDR_LEN] for l in lsas ]
+
+    return [ mkOspfMsg(MSG_TYPES["HELLO"], mkHello(1, 1, 0x13, 10, 40, rid, 0, [2, 3]), rid),
+             mkOspfMsg(MSG_TYPES["DBDESC"], mkDesc(0x13, 1500, 7, 1234, hdrs), rid),
+             mkOspfMsg(MSG_TYPES["LSREQ"], mkLsReq([ (0x2001, 0, rid), (0xA02A, 0, rid) ]), rid),
+             mkOspfMsg(MSG_TYPES["LSUPD"], mkLsUpd(lsas), rid),
+             mkOspfMsg(MSG_TYPES["LSACK"], "".join(hdrs), rid),
+             ]
+
+#-------------------------------------------------------------------------------
+
+INTERESTING = (0, 1, 2, 3, 4, 0x7f, 0x80, 0xff, 0x100, 0x7fff, 0x8000, 0xffff)
+
+def mutate(rnd, msg):
+
+    msg = bytearray(msg)
+    for i in xrange(rnd.randint(1, 4)):
+        op = rnd.randint(0, 5)
+        if not msg: break
+        o = rnd.randrange(len(msg))
+
+        if op == 0:                         # truncate
+            del msg[o:]
+        elif op == 1:                       # flip a bit
+            msg[o] ^= 1 << rnd.randrange(8)
+        elif op == 2:                       # random byte
+            msg[o] = rnd.randrange(256)
+        elif op == 3 and o + 2 <= len(msg): # a 16 bit length, count or type
+            v = rnd.choice(INTERESTING + (len(msg) - o, rnd.randrange(0x10000)))
+            msg[o:o+2] = struct.pack(">H", v & 0xffff)
+        elif op == 4:                       # insert bytes
+            msg[o:o] = bytearray([ rnd.randrange(256) for j in xrange(rnd.randint(1, 24)) ])
+        else:                               # drop bytes
+            del msg[o:o+rnd.randint(1, 24)]
+
+    ## mostly keep the header length right, or little gets past it
+    if len(msg) >= OSPFV3_HDR_LEN and rnd.random() < 0.8:
+        msg[2:4] = struct.pack(">H", len(msg) & 0xffff)
+
+    return str(msg)
+
+class Pipeline:
+
+    ## main.py's handling of a received message, without the socket
+
+    def __init__(self):
+
+        self.lsdb  = Lsdb()
+        self.nbrs  = Neighbours()
+        self.lsdb.subscribe(Churn(verbose=0).changes)
+        self.json  = JsonCodec()
+        self.bin   = BinCodec()
+        self.ts    = 1000.0
+
+    def run(self, msg, verify, verbose=0):
+
+        ## -> the fault, "OK" if it got through; ParseExc only from the
+        ## parser, every other exception is passed up
+        try:
+            rv = parseOspfMsg(msg, verbose)
+        except ParseExc, pe:
+            return pe.fault
+
+        fault = "OK" ; typ = MSG_TYPES.get(rv["T"])
+        if verify and typ == "LSUPD" and "V" in rv["V"]:
+            bad = badLsas(rv, msg, self.lsdb.holds)
+            if bad:
+                fault = "BADCKSUM"
+                rv = dropLsas(rv, msg, bad)
+                if rv is None: return fault
+                (rv, msg) = rv
+
+        self.ts += 1
+        rv["IFINDEX"] = 1 ; rv["SRC"] = "fe80::1%1" ; rv["TS"] = self.ts
+
+        if typ == "LSUPD": self.lsdb.update(rv, msg, self.ts)
+        if typ == "HELLO": self.nbrs.hello(rv)
+        if typ in ("DBDESC", "LSACK"): self.lsdb.learn(rv["V"]["AID"], rv["V"]["V"]["LSAS"])
+        if typ in ("LSUPD", "HELLO"):
+            self.json.encode(rv, msg, self.ts)
+            (rec, _) = decodeRecord(self.bin.encode(rv, msg, self.ts))
+            parseRecord(rec)
+
+        return fault
+
+def fuzz(iterations, seed, quiet=0):
+
+    ## -> ({ fault: count }, [(message, traceback)])
+    rnd = random.Random(seed) ; corpus = seeds()
+    faults = { "OK": 0 } ; bugs = []
+    null = open(os.devnull, "w")
+    pipe = Pipeline()
+
+    for msg in corpus: pipe.run(msg, 1)         # the seeds themselves pass
+
+    for i in xrange(iterations):
+        msg = mutate(rnd, rnd.choice(corpus))
+        verbose = (i % VERBOSE_EVERY == 0) and 2 or 0
+        stdout = sys.stdout
+        if verbose: sys.stdout = null
+        try:
+            try:
+                fault = pipe.run(msg, i % 2, verbose)
+                faults[fault] = faults.get(fault, 0) + 1
+            except Exception:
+                bugs.append((msg, traceback.format_exc()))
+        finally:
+            sys.stdout = stdout
+
+        if not quiet and (i + 1) % 10000 == 0:
+            print "%d messages, %d bugs" % (i + 1, len(bugs))
+
+    try:
+        pipe.lsdb.expire(pipe.ts + 2 * MAX_AGE) ; pipe.nbrs.expire(pipe.ts + 2 * MAX_AGE)
+    except Exception:
+        bugs.append(("", traceback.format_exc()))
+
+    return (faults, bugs)
+
+################################################################################
+
+if __name__ == "__main__":
+
+    def usage():
+
+        print """Usage: %s [ options ]
+    -h|--help           : Help
+    -q|--quiet          : Be quiet
+    -n|--iterations <n> : Messages to try [def: %d]
+    -s|--seed <n>       : Random seed [def: random]""" %\
+            (os.path.basename(sys.argv[0]), DEFAULT_ITERATIONS)
+        sys.exit(1)
+
+    ITERATIONS = DEFAULT_ITERATIONS
+    SEED       = None
+    QUIET      = 0
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hqn:s:",
+                                   ("help", "quiet", "iterations=", "seed="))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-q', '--quiet'):
+            QUIET = 1
+
+        elif x in ('-n', '--iterations'):
+            ITERATIONS = int(y)
+
+        elif x in ('-s', '--seed'):
+            SEED = int(y)
+
+    if SEED is None: SEED = struct.unpack(">L", os.urandom(4))[0]
+    print "seed %d, %d messages" % (SEED, ITERATIONS)
+
+    (faults, bugs) = fuzz(ITERATIONS, SEED, QUIET)
+    for (fault, n) in sorted(faults.items()):
+        print INDENT + "%-10s %d" % (fault, n)
+
+    for (msg, tb) in bugs[:10]:
+        print "*** %s%s" % (tb, prthex(INDENT, msg))
+    print "%d bugs" % len(bugs)
+    sys.exit(bugs and 1 or 0)
@@ -0,0 +1,251 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     hamt: persistent (immutable, structurally shared) hash array mapped
+##     trie
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## assoc() and dissoc() return a new map and leave the old one untouched;
+## only the nodes on the path to the changed key are copied (at most 7 for
+## a 32 bit hash), the rest is shared.  Holding on to an old map is
+## therefore cheap, and a reader holding one can never see a later change.
+##
+## Each trie node is a (bitmap, array) pair; array entries are child
+## nodes, leaves (hash, key, value), or collision buckets for keys whose
+## whole 32 bit hash is equal.
+
+BITS  = 5
+MASK  = (1 << BITS) - 1
+HMASK = 0xffffffff
+
+#-------------------------------------------------------------------------------
+
+def popcount(x):
+
+    return bin(x).count("1")
+
+class Node(object):
+
+    __slots__ = ("bitmap", "array")
+
+    def __init__(self, bitmap, array):
+
+        self.bitmap = bitmap
+        self.array  = array
+
+class Collision(object):
+
+    __slots__ = ("h", "pairs")
+
+    def __init__(self, h, pairs):
+
+        self.h     = h
+        self.pairs = pairs
+
+EMPTY_NODE = Node(0, [])
+
+#-------------------------------------------------------------------------------
+
+def merge(shift, l1, l2):
+
+    ## smallest subtrie holding two leaves with different hashes
+    b1 = (l1[0] >> shift) & MASK ; b2 = (l2[0] >> shift) & MASK
+    if b1 == b2:
+        return Node(1 << b1, [ merge(shift + BITS, l1, l2) ])
+    if b1 < b2:
+        return Node((1 << b1) | (1 << b2), [ l1, l2 ])
+    return Node((1 << b1) | (1 << b2), [ l2, l1 ])
+
+def assoc(node, shift, h, key, val):
+
+    ## -> (new node, 1 if key was added else 0)
+    bit = 1 << ((h >> shift) & MASK)
+    idx = popcount(node.bitmap & (bit - 1))
+
+    if not node.bitmap & bit:
+        arr = node.array[:idx] + [ (h, key, val) ] + node.array[idx:]
+        return (Node(node.bitmap | bit, arr), 1)
+
+    child = node.array[idx]
+    if isinstance(child, Node):
+        (new, added) = assoc(child, shift + BITS, h, key, val)
+
+    elif isinstance(child, Collision):
+        if child.h == h:
+            pairs = [ p for p in child.pairs if p[0] != key ]
+            added = len(pairs) == len(child.pairs) and 1 or 0
+            new = Collision(h, pairs + [ (key, val) ])
+        else:
+            sub = Node(1 << ((child.h >> (shift + BITS)) & MASK), [ child ])
+            (new, added) = assoc(sub, shift + BITS, h, key, val)
+
+    else:
+        (h2, k2, v2) = child
+        if h2 == h and k2 == key:
+            if v2 is val: return (node, 0)
+            (new, added) = ((h, key, val), 0)
+        elif h2 == h:
+            (new, added) = (Collision(h, [ (k2, v2), (key, val) ]), 1)
+        else:
+            (new, added) = (merge(shift + BITS, child, (h, key, val)), 1)
+
+    arr = list(node.array) ; arr[idx] = new
+    return (Node(node.bitmap, arr), added)
+
+def dissoc(node, shift, h, key):
+
+    ## -> new node (None once empty), or the same node if key is absent
+    bit = 1 << ((h >> shift) & MASK)
+    if not node.bitmap & bit: return node
+    idx = popcount(node.bitmap & (bit - 1))
+
+    child = node.array[idx]
+    if isinstance(child, Node):
+        new = dissoc(child, shift + BITS, h, key)
+        if new is child: return node
+        if new is not None and len(new.array) == 1 and isinstance(new.array[0], tuple):
+            new = new.array[0]          # pull a lone leaf back up
+
+    elif isinstance(child, Collision):
+        if child.h != h: return node
+        pairs = [ p for p in child.pairs if p[0] != key ]
+        if len(pairs) == len(child.pairs): return node
+        new = len(pairs) == 1 and (h, pairs[0][0], pairs[0][1]) or Collision(h, pairs)
+
+    else:
+        if child[0] != h or child[1] != key: return node
+        new = None
+
+    if new is None:
+        if node.bitmap == bit: return None
+        return Node(node.bitmap & ~bit, node.array[:idx] + node.array[idx+1:])
+
+    arr = list(node.array) ; arr[idx] = new
+    return Node(node.bitmap, arr)
+
+def lookup(node, h, key, default):
+
+    shift = 0
+    while 1:
+        bit = 1 << ((h >> shift) & MASK)
+        if not node.bitmap & bit: return default
+        child = node.array[popcount(node.bitmap & (bit - 1))]
+
+        if isinstance(child, Node):
+            node = child ; shift += BITS
+        elif isinstance(child, Collision):
+            for (k, v) in child.pairs:
+                if k == key: return v
+            return default
+        else:
+            if child[1] == key: return child[2]
+            return default
+
+def walk(node):
+
+    for child in node.array:
+        if isinstance(child, Node):
+            for kv in walk(child): yield kv
+        elif isinstance(child, Collision):
+            for kv in child.pairs: yield kv
+        else:
+            yield (child[1], child[2])
+
+################################################################################
+
+class Hamt(object):
+
+    __slots__ = ("_root", "_len")
+
+    def __init__(self, root=EMPTY_NODE, length=0):
+
+        self._root = root
+        self._len  = length
+
+    def __len__(self):
+
+        return self._len
+
+    def __contains__(self, key):
+
+        return lookup(self._root, hash(key) & HMASK, key, self) is not self
+
+    def __getitem__(self, key):
+
+        rv = lookup(self._root, hash(key) & HMASK, key, self)
+        if rv is self: raise KeyError(key)
+        return rv
+
+    def __repr__(self):
+
+        return "Hamt(%d)" % self._len
+
+    def get(self, key, default=None):
+
+        return lookup(self._root, hash(key) & HMASK, key, default)
+
+    def assoc(self, key, val):
+
+        (root, added) = assoc(self._root, 0, hash(key) & HMASK, key, val)
+        if root is self._root: return self
+        return Hamt(root, self._len + added)
+
+    def dissoc(self, key):
+
+        root = dissoc(self._root, 0, hash(key) & HMASK, key)
+        if root is self._root: return self
+        return Hamt(root or EMPTY_NODE, self._len - 1)
+
+    def iteritems(self):
+
+        return walk(self._root)
+
+    def itervalues(self):
+
+        for (k, v) in walk(self._root): yield v
+
+    def values(self):
+
+        return list(self.itervalues())
+
+    def keys(self):
+
+        return [ k for (k, v) in walk(self._root) ]
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import random
+
+    ## randomised check against a dict, keeping every version alive
+    d = {} ; m = Hamt() ; versions = []
+    for i in xrange(20000):
+        k = random.randint(0, 5000)
+        if random.random() < 0.3:
+            d.pop(k, None) ; m = m.dissoc(k)
+        else:
+            d[k] = i ; m = m.assoc(k, i)
+        if i % 1000 == 0: versions.append((dict(d), m))
+
+    assert len(m) == len(d) and dict(m.iteritems()) == d
+    for (dv, mv) in versions:
+        assert dict(mv.iteritems()) == dv
+    print "ok: %d keys, %d versions intact" % (len(m), len(versions))
@@ -0,0 +1,297 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     metrics: latency histograms, counters and gauges, in Prometheus
+##     text format
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## Histograms are HDR-style: each power of two from 2**MIN_EXP seconds
+## (about 1us) up is split into SUB_BUCKETS equal buckets, so a value is
+## recorded to within 1/SUB_BUCKETS of itself in a fixed array, and
+## observe() is one frexp() and a list increment.  Prometheus is given
+## the power-of-two boundaries as cumulative "le" buckets -- exact sums of
+## the fine ones -- and the fine buckets also back the <name>_quantile
+## gauges, so percentiles are readable without a Prometheus server.
+##
+## Everything is updated by the receive loop and read by the API thread
+## that renders /metrics; no locks are taken, a scrape may just be one
+## message behind in places.
+##
+##   ospf_monitor_stage_seconds{stage}      queue (kernel stamp to read),
+##                                          recv, parse, lsdb, encode, post
+##   ospf_monitor_export_latency_seconds{type}
+##                                          kernel stamp to hand-off to the
+##                                          collector, by message type
+##   ospf_monitor_messages_total{type}      by OSPF message type
+##   ospf_monitor_lsas_total{type}          LSAs in LSUPDs, by LS type
+##   ospf_monitor_*                         gauges and counters registered
+##                                          with callback() by main.py and
+##                                          Churn.register()
+
+import math, os, time
+
+#-------------------------------------------------------------------------------
+
+PREFIX      = "ospf_monitor_"
+
+SUB_BUCKETS = 8
+MIN_EXP     = -20               # 2**-20 s, ~1us
+MAX_EXP     = 6                 # 64 s
+OCTAVES     = MAX_EXP - MIN_EXP
+NBUCKETS    = OCTAVES * SUB_BUCKETS + 2     # plus underflow and overflow
+
+QUANTILES   = (0.5, 0.9, 0.99, 0.999)
+
+STAGES      = ("queue", "recv", "parse", "lsdb", "encode", "post")
+
+def labels(**kw):
+
+    return "{%s}" % ",".join([ '%s="%s"' % (k, v) for (k, v) in sorted(kw.items()) ])
+
+def bucketUpper(i):
+
+    ## upper bound of fine bucket i, in seconds
+    if i == 0: return 2.0 ** MIN_EXP
+    if i == NBUCKETS - 1: return float("inf")
+    (k, s) = divmod(i - 1, SUB_BUCKETS)
+    return 2.0 ** (MIN_EXP + k) * (1 + float(s + 1) / SUB_BUCKETS)
+
+################################################################################
+
+class Histogram:
+
+    def __init__(self):
+
+        self.counts = [0] * NBUCKETS
+        self.sum    = 0.0
+        self.count  = 0
+
+    def observe(self, v):
+
+        self.count += 1
+        self.sum   += v
+        if v <= 0:
+            self.counts[0] += 1
+            return
+
+        (m, e) = math.frexp(v)              # v = m * 2**e, 0.5 <= m < 1
+        k = e - 1 - MIN_EXP
+        if k < 0: i = 0
+        elif k >= OCTAVES: i = NBUCKETS - 1
+        else: i = 1 + k * SUB_BUCKETS + int((m - 0.5) * 2 * SUB_BUCKETS)
+        self.counts[i] += 1
+
+    def quantile(self, q):
+
+        if not self.count: return 0.0
+        want = q * self.count ; seen = 0
+        for i in xrange(NBUCKETS):
+            seen += self.counts[i]
+            if seen >= want: return bucketUpper(i)
+        return bucketUpper(NBUCKETS - 1)
+
+    def cumulative(self):
+
+        ## -> [(le, count)] at the power of two boundaries
+        counts = self.counts ; rv = [] ; seen = counts[0]
+        for k in xrange(OCTAVES):
+            rv.append((2.0 ** (MIN_EXP + k), seen))
+            seen += sum(counts[1 + k*SUB_BUCKETS:1 + (k+1)*SUB_BUCKETS])
+        rv.append((2.0 ** MAX_EXP, seen))
+        return rv
+
+#-------------------------------------------------------------------------------
+
+class Family:
+
+    ## one metric name; children by the value of its one label (or None)
+    def __init__(self, name, help, kind, label=None, fn=None):
+
+        self.name  = PREFIX + name
+        self.help  = help
+        self.kind  = kind
+        self.label = label
+        self.fn    = fn
+        self.children = {}
+
+    def values(self):
+
+        ## {label value: number}, from the callback if there is one
+        if self.fn is None: return self.children
+        v = self.fn()
+        if isinstance(v, dict): return v
+        return { None: v }
+
+    def render(self, out):
+
+        out.append("# HELP %s %s" % (self.name, self.help))
+        out.append("# TYPE %s %s" % (self.name, self.kind))
+
+        if self.kind != "histogram":
+            for (k, v) in sorted(self.values().items()):
+                l = k is not None and labels(**{ self.label: k }) or ""
+                out.append("%s%s %s" % (self.name, l, fmt(v)))
+            return
+
+        for (k, h) in sorted(self.children.items()):
+            kw = k is not None and { self.label: k } or {}
+            for (le, n) in h.cumulative():
+                out.append("%s_bucket%s %d" % (self.name, labels(le="%g" % le, **kw), n))
+            out.append("%s_bucket%s %d" % (self.name, labels(le="+Inf", **kw), h.count))
+            out.append("%s_sum%s %s" % (self.name, kw and labels(**kw) or "", fmt(h.sum)))
+            out.append("%s_count%s %d" % (self.name, kw and labels(**kw) or "", h.count))
+
+        out.append("# HELP %s_quantile %s, from the fine buckets" % (self.name, self.help))
+        out.append("# TYPE %s_quantile gauge" % self.name)
+        for (k, h) in sorted(self.children.items()):
+            kw = k is not None and { self.label: k } or {}
+            for q in QUANTILES:
+                out.append("%s_quantile%s %s" %(
+                    self.name, labels(quantile="%g" % q, **kw), fmt(h.quantile(q))))
+
+def fmt(v):
+
+    if isinstance(v, float): return "%.9g" % v
+    return str(v)
+
+################################################################################
+
+class Metrics:
+
+    def __init__(self):
+
+        self._families = []
+        self.started   = time.time()
+
+        self.stages   = self.family("stage_seconds", "time spent per pipeline stage",
+                                    "histogram", "stage")
+        self.messages = self.family("messages_total", "OSPF messages received",
+                                    "counter", "type")
+        self.lsas     = self.family("lsas_total", "LSAs received in LSUPDs",
+                                    "counter", "type")
+        self.exports  = self.family("export_latency_seconds",
+                                    "wire to collector: kernel receive to export",
+                                    "histogram", "type")
+        for s in STAGES: self.stages.children[s] = Histogram()
+
+        self.callback("uptime_seconds", "seconds since start", "gauge",
+                      fn=lambda: time.time() - self.started)
+
+    def __repr__(self):
+
+        return "metrics: %d families" % len(self._families)
+
+    def family(self, name, help, kind, label=None, fn=None):
+
+        f = Family(name, help, kind, label, fn)
+        self._families.append(f)
+        return f
+
+    def callback(self, name, help, kind="gauge", label=None, fn=None):
+
+        ## fn() -> a number, or {label value: number}; called per scrape
+        return self.family(name, help, kind, label, fn)
+
+    #---------------------------------------------------------------------------
+
+    def observe(self, stage, v):
+
+        self.stages.children[stage].observe(v)
+
+    def latency(self, typ, v):
+
+        c = self.exports.children
+        try:
+            h = c[typ]
+        except KeyError:
+            h = c[typ] = Histogram()
+        h.observe(v)
+
+    def count(self, family, key, n=1):
+
+        c = family.children
+        try:
+            c[key] += n
+        except KeyError:
+            c[key] = n
+
+    def render(self):
+
+        out = []
+        for f in self._families:
+            try:
+                f.render(out)
+            except Exception, e:
+                out.append("# %s: %s" % (f.name, e))
+        return "\n".join(out) + "\n"
+
+    def handle(self, h, qs):
+
+        ## API route handler: GET /metrics
+        data = self.render()
+        h.send_response(200)
+        h.send_header("Content-Type", "text/plain; version=0.0.4")
+        h.send_header("Content-Length", str(len(data)))
+        h.end_headers()
+        h.wfile.write(data)
+
+#-------------------------------------------------------------------------------
+
+def sockStats(sock):
+
+    ## (bytes queued for us, packets dropped) for a raw IPv6 socket, from
+    ## /proc/net/raw6; sk_drops counts receive buffer overruns
+    ino = str(os.fstat(sock.fileno()).st_ino)
+    for line in open("/proc/net/raw6").readlines()[1:]:
+        f = line.split()
+        if len(f) > 12 and f[9] == ino:
+            return (int(f[4].split(":")[1], 16), int(f[12]))
+    return (0, 0)
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import sys, random
+
+    ## cost of observe(), and a sample rendering
+
+    m = Metrics() ; n = 200000
+    vals = [ random.lognormvariate(-9, 1.5) for i in xrange(n) ]
+
+    t = time.time()
+    for v in vals: m.observe("parse", v)
+    t = time.time() - t
+    print "observe: %.0f ns" % (t / n * 1e9)
+
+    t = time.time()
+    for v in vals: m.count(m.messages, "LSUPD")
+    t = time.time() - t
+    print "count:   %.0f ns" % (t / n * 1e9)
+
+    vals.sort()
+    h = m.stages.children["parse"]
+    for q in QUANTILES:
+        print "p%g: exact %.2f us, histogram %.2f us" %(
+            q * 100, vals[int(q * n)] * 1e6, h.quantile(q) * 1e6)
+
+    t = time.time() ; data = m.render() ; t = time.time() - t
+    print "render: %d bytes, %.2f ms" % (len(data), t * 1e3)
+    if len(sys.argv) > 1: print data
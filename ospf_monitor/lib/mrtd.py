@@ -22,7 +22,7 @@
 ##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
 ##     02111-1307 USA
 
-import os, time, struct, getopt, sys, math, pprint, traceback
+import os, time, struct, getopt, sys, math, pprint, traceback, socket
 
 try:
     import bgp
@@ -69,6 +69,7 @@ ISIS_SUBTYPE_HDR_LEN   = 0
 ISIS2_SUBTYPE_HDR_LEN  = 4
 
 OSPF2_SUBTYPE_HDR_LEN  = 4
+OSPF3_SUBTYPE_HDR_LEN  = 4 + 2 + 16 + 16    # usecs, AF, remote, local
 
 ################################################################################
 
@@ -98,6 +99,9 @@ MSG_TYPES = { 0L:  "NULL",
               32L: "PROTOCOL_ISIS",        # ISIS
               33L: "PROTOCOL_ISIS2",       # ISIS + ext. time stamp
 
+              48L: "PROTOCOL_OSPF3",       # RFC 6396 OSPFv3
+              49L: "PROTOCOL_OSPF3_ET",    # RFC 6396 OSPFv3, ext. time stamp
+
               64L: "PROTOCOL_OSPF2",       # OSPF v2
               }
 DLIST = DLIST + [MSG_TYPES]
@@ -412,9 +416,10 @@ class Mrtd:
 
         return rv
 
-    def mkHdr(self, subtype, msg_len):
+    def mkHdr(self, subtype, msg_len, ts=None):
 
-        ts = time.time()
+        ## ts: when the message was received, if known
+        if ts is None: ts = time.time()
         hdr = struct.pack(">LHHL", int(ts), self._mrt_type, subtype, msg_len)
         return (ts, hdr)
 
@@ -717,14 +722,25 @@ class Mrtd:
 
     #---------------------------------------------------------------------------
 
-    def writeOspfMsg(self, ptype, plen, pkt):
+    def writeOspfMsg(self, ptype, plen, pkt, ts=None):
 
-        (ts, hdr) = self.mkHdr(ptype, plen+OSPF2_SUBTYPE_HDR_LEN)
+        (ts, hdr) = self.mkHdr(ptype, plen+OSPF2_SUBTYPE_HDR_LEN, ts)
         (ts_frac, ts_int) = math.modf(ts)
         msg = struct.pack(">%ds L %ds" %(
             COMMON_HDR_LEN, len(pkt)), hdr, ts_frac*1000000, pkt)
         self.write(msg)
 
+    def writeOspfv3Msg(self, pkt, remote, local, ts=None):
+
+        ## RFC 6396 OSPFv3_ET: the OSPF message with the addresses it came
+        ## from and to, stamped with ts, when it was received
+        (ts, hdr) = self.mkHdr(0, len(pkt)+OSPF3_SUBTYPE_HDR_LEN, ts)
+        (ts_frac, ts_int) = math.modf(ts)
+        msg = hdr + struct.pack(">LH", int(ts_frac*1000000), 2) +\
+              socket.inet_pton(socket.AF_INET6, remote.split("%")[0]) +\
+              socket.inet_pton(socket.AF_INET6, local.split("%")[0]) + pkt
+        self.write(msg)
+
     def parseOspfMsg(self, plen, pdata, verbose=1, level=0):
 
         rv = { "T": MSG_TYPES["PROTOCOL_OSPF2"],
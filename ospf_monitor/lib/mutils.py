@@ -28,6 +28,11 @@ import string, struct, sys, ipaddress
 
 #-------------------------------------------------------------------------------
 
+IPV6_ZEROS  = "\x00" * 16
+IPV6_LOMASK = 0xffffffffffffffffL
+
+#-------------------------------------------------------------------------------
+
 def error(message):
 
     sys.stderr.write(message)
@@ -122,7 +127,7 @@ def id2pfx(id):
 
 #-------------------------------------------------------------------------------
 
-def id2str(id):
+def _id2str(id):
 
     return "%d.%d.%d.%d" %\
            (int( ((id & 0xff000000L) >> 24) & 0xff),
@@ -272,9 +277,144 @@ def int2hex(i):
 def str2ipv6(s):
     return ipaddress.IPv6Address(s)
 
+#-------------------------------------------------------------------------------
+
+def bytes2ipv6(b):
+
+    ## network-order bytes (up to 16, zero padded on the right) -> 128 bit int
+    if len(b) < 16:
+        b = b + IPV6_ZEROS[len(b):]
+    (hi, lo) = struct.unpack(">QQ", b)
+    return (hi << 64) | lo
+
+#-------------------------------------------------------------------------------
+
+def _ipv62str(addr):
+
+    ## RFC 5952 text form of a 128 bit int, without an ipaddress round-trip
+    h = struct.unpack(">8H", struct.pack(">QQ", addr >> 64, addr & IPV6_LOMASK))
+
+    best = 0 ; bestlen = 0 ; i = 0
+    while i < 8:
+        if h[i] == 0:
+            j = i + 1
+            while j < 8 and h[j] == 0: j += 1
+            if j - i > bestlen: best, bestlen = i, j - i
+            i = j
+        else:
+            i += 1
+
+    if bestlen < 2:
+        return "%x:%x:%x:%x:%x:%x:%x:%x" % h
+
+    return string.join(["%x" % x for x in h[:best]], ':') + "::" +\
+           string.join(["%x" % x for x in h[best+bestlen:]], ':')
+
+################################################################################
+
+class StrCache:
+
+    ## bounded intern table mapping an int (router ID, IPv6 address) to its
+    ## canonical string; a repeated conversion is a single dict lookup.  When
+    ## full the table is simply emptied, which keeps insertion O(1) and lets
+    ## the live working set (a few hundred routers) refill it immediately.
+
+    def __init__(self, fn, size):
+
+        self._fn     = fn
+        self._size   = size
+        self._strs   = {}
+        self.hits    = 0
+        self.misses  = 0
+        self.flushes = 0
+
+    def __call__(self, i):
+
+        try:
+            s = self._strs[i]
+            self.hits += 1
+            return s
+
+        except KeyError:
+            self.misses += 1
+            if len(self._strs) >= self._size:
+                self._strs.clear()
+                self.flushes += 1
+            s = self._strs[i] = self._fn(i)
+            return s
+
+    def stats(self):
+
+        total = self.hits + self.misses
+        return { "SIZE"    : len(self._strs),
+                 "MAX"     : self._size,
+                 "HITS"    : self.hits,
+                 "MISSES"  : self.misses,
+                 "FLUSHES" : self.flushes,
+                 "HITRATE" : total and float(self.hits) / total or 0.0,
+                 }
+
+ID_STR_CACHE_SZ   = 4096
+ADDR_STR_CACHE_SZ = 65536
+
+id2str   = StrCache(_id2str, ID_STR_CACHE_SZ)
+ipv62str = StrCache(_ipv62str, ADDR_STR_CACHE_SZ)
+
+def cacheStats():
+
+    return { "ID"   : id2str.stats(),
+             "ADDR" : ipv62str.stats(),
+             }
+
+#-------------------------------------------------------------------------------
+
 def int2ipv6(i1, i2, i3, i4):
-	s = u"%02X:%04X:%04X:%04X:%02X:%02X:%02X:%02X" % ((i1&(0XFFFF<<(8*2)))>>(8*2), i1&0XFFFF, (i2&(0XFFFF<<(8*2)))>>(8*2), i2&0XFFFF, (i3&(0XFFFF<<(8*2)))>>(8*2), i3&0XFFFF, (i4&(0XFFFF<<(8*2)))>>(8*2), i4&0XFFFF)
-	return str(ipaddress.IPv6Address(s))
+
+    return ipv62str((i1 << 96) | (i2 << 64) | (i3 << 32) | i4)
+
+#-------------------------------------------------------------------------------
+
+class Prefix6(object):
+
+    ## compact OSPFv3 prefix: (int, plen) plus the PrefixOptions and the
+    ## 16 bit field that follows them (metric, or reserved in Link-LSAs);
+    ## the text form is built on first use and then cached
+
+    __slots__ = ("addr", "plen", "opts", "metric", "_str")
+
+    def __init__(self, addr, plen, opts=0, metric=0):
+
+        if plen < 128:
+            addr = addr & ~((1L << (128 - plen)) - 1)
+
+        self.addr   = addr
+        self.plen   = plen
+        self.opts   = opts
+        self.metric = metric
+        self._str   = None
+
+    def __str__(self):
+
+        if self._str is None:
+            self._str = "%s/%d" % (ipv62str(self.addr), self.plen)
+        return self._str
+
+    def __repr__(self):
+
+        return "Prefix6(%s, opts:%s, metric:%s)" % (self, self.opts, self.metric)
+
+    def __eq__(self, other):
+
+        return isinstance(other, Prefix6) and \
+               self.addr == other.addr and self.plen == other.plen
+
+    def __ne__(self, other):
+
+        return not self.__eq__(other)
+
+    def __hash__(self):
+
+        return hash((self.addr, self.plen))
 
 ################################################################################
 
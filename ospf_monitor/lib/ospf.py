@@ -715,6 +715,7 @@ class Ospf:
 
         self._adjs = {}
         self._rcvd = ""
+        self._rcvtime = 0.0
         self._mrtd = None
 	
 
@@ -749,7 +750,8 @@ class Ospf:
         if iph["PROTO"] == OSPF_LISTEN_PORT:
             parseIpHdr(msg[:IP_HDR_LEN], 0)
             ospfh = parseOspfHdr(msg[IP_HDR_LEN:IP_HDR_LEN+OSPF_HDR_LEN], 0)
-            if DUMP_MRTD == 1: self._mrtd.writeOspfMsg(ospfh["TYPE"], msg_len, msg)
+            if DUMP_MRTD == 1:
+                self._mrtd.writeOspfMsg(ospfh["TYPE"], msg_len, msg, self._rcvtime)
 
             if verbose > 2:
                 print "%sparseMsg: len=%d%s" %\
@@ -767,6 +769,7 @@ class Ospf:
 
     def recvMsg(self, verbose=1, level=0):
         self._rcvd = self._sock.recv(RECV_BUF_SZ)
+        self._rcvtime = time.time()
         if verbose > 2:
             print "%srecvMsg: recv: len=%d%s" %\
                   (level*INDENT,
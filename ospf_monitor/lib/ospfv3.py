@@ -60,8 +60,10 @@
 #    created by ASBR and flooded into area; type 3 report cost to
 #    prefix outside area, type 4 report cost to ASBR
 
-import struct, socket, sys, math, getopt, string, os.path, time, select, traceback
+import struct, socket, sys, math, getopt, string, os.path, time, select, traceback, errno
+from binascii import hexlify
 from mutils import *
+import tstamp
 
 import logging
 LOG = logging.getLogger(__name__)
@@ -74,6 +76,7 @@ INDENT          = "    "
 VERSION         = "2.9"
 
 RECV_BUF_SZ      = 8192
+SO_BINDTODEVICE  = getattr(socket, "SO_BINDTODEVICE", 25)
 OSPF_LISTEN_PORT = 89
 LS_INFINITY      = 0xffff
 LS_STUB_RTR      = 0xffffff
@@ -164,6 +167,61 @@ OSPFV3_LSALINK_LEN = struct.calcsize(OSPFV3_LSALINK)
 OSPFV3_LSAINTRAPREFIX = "> HH L L "
 OSPFV3_LSAINTRAPREFIX_LEN = struct.calcsize(OSPFV3_LSAINTRAPREFIX)
 
+#V3 prefix (RFC 5340 A.4.1): PrefixLength, PrefixOptions, metric/reserved,
+#followed by ((PrefixLength + 31) / 32) 32 bit words of address prefix
+OSPFV3_PREFIX     = "> BBH"
+OSPFV3_PREFIX_LEN = struct.calcsize(OSPFV3_PREFIX)
+
+#V3 inter area prefix (A.4.5): 0, metric(24), then one prefix
+OSPFV3_LSAIAPREFIX     = "> L"
+OSPFV3_LSAIAPREFIX_LEN = struct.calcsize(OSPFV3_LSAIAPREFIX)
+
+#V3 inter area router (A.4.6): 0, options, 0, metric(24), destination rtr id
+OSPFV3_LSAIARTR     = "> B3s L L"
+OSPFV3_LSAIARTR_LEN = struct.calcsize(OSPFV3_LSAIARTR)
+
+#V3 AS external and NSSA (A.4.7, A.4.8): EFT flags, metric(24), then one
+#prefix, whose third field is the referenced LS type
+OSPFV3_LSAASEXT     = "> L"
+OSPFV3_LSAASEXT_LEN = struct.calcsize(OSPFV3_LSAASEXT)
+
+#V3 extended LSAs (RFC 8362): after any fixed part the body is a list of
+#TLVs, type(16), length(16), then the value padded to 32 bits; a TLV may
+#carry sub-TLVs the same way.  E-Router, E-Network and E-Intra-Area-Prefix
+#keep the fixed part of their RFC 5340 forms
+OSPFV3_TLV     = "> HH"
+OSPFV3_TLV_LEN = struct.calcsize(OSPFV3_TLV)
+
+#V3 E-Link (3.8): prio, options, then TLVs
+OSPFV3_ELSALINK     = "> B3s"
+OSPFV3_ELSALINK_LEN = struct.calcsize(OSPFV3_ELSALINK)
+
+#V3 prefix TLVs (3.4, 3.6, 3.7): flags, metric(24), PrefixLength,
+#PrefixOptions, 0, then the address prefix and sub-TLVs
+OSPFV3_TLV_PREFIX     = "> L BBH"
+OSPFV3_TLV_PREFIX_LEN = struct.calcsize(OSPFV3_TLV_PREFIX)
+
+#SRv6 (RFC 9513) Locator TLV: route type, algorithm, locator length,
+#flags, metric, locator(128), then sub-TLVs
+OSPFV3_TLV_LOCATOR     = "> BBBB L"
+OSPFV3_TLV_LOCATOR_LEN = struct.calcsize(OSPFV3_TLV_LOCATOR)
+
+#SRv6 End SID sub-TLV: flags, 0, endpoint behavior, SID(128)
+OSPFV3_SUBTLV_ENDSID     = "> BBH"
+OSPFV3_SUBTLV_ENDSID_LEN = struct.calcsize(OSPFV3_SUBTLV_ENDSID)
+
+#SRv6 End.X SID sub-TLV: endpoint behavior, flags, 0, algorithm, weight, 0,
+#SID(128); the LAN form has the neighbour's router id before the SID
+OSPFV3_SUBTLV_ENDXSID        = "> HBB BBH"
+OSPFV3_SUBTLV_ENDXSID_LEN    = struct.calcsize(OSPFV3_SUBTLV_ENDXSID)
+OSPFV3_SUBTLV_LANENDXSID     = "> HBB BBH L"
+OSPFV3_SUBTLV_LANENDXSID_LEN = struct.calcsize(OSPFV3_SUBTLV_LANENDXSID)
+
+#SRv6 SID structure sub-TLV: locator block, locator node, function and
+#argument lengths, in bits
+OSPFV3_SUBTLV_SIDSTRUCT     = "> BBBB"
+OSPFV3_SUBTLV_SIDSTRUCT_LEN = struct.calcsize(OSPFV3_SUBTLV_SIDSTRUCT)
+
 #TODO
 OSPF_METRIC     = "> BBH"
 OSPF_METRIC_LEN = struct.calcsize(OSPF_METRIC)
@@ -229,6 +287,16 @@ LSAV3_TYPES = { 8193: "ROUTER",             # links between routers in the area,
               8199: "NSSA",
 	      8: "LINK LSA", #0X0008
               8201: "INTRA AREA PREFIX", #0X2009
+
+              0xA021: "E-ROUTER",       # RFC 8362
+              0xA022: "E-NETWORK",
+              0xA023: "E-INTER AREA PREFIX",
+              0xA024: "E-INTER AREA ROUTER",
+              0xC025: "E-EXTERNAL AS",
+              0xA027: "E-NSSA",
+              0x8028: "E-LINK",
+              0xA029: "E-INTRA AREA PREFIX",
+              0xA02A: "SRV6 LOCATOR",   # RFC 9513
               }
 
 DLIST += [LSA_TYPES]
@@ -296,10 +364,94 @@ RTR_LINK_TYPE = { 1L: "P2P",
 
 DLIST += [RTR_LINK_TYPE]
 
+ELSA_TLV_TYPES = { 1L: "ROUTER LINK",
+                   2L: "ATTACHED ROUTERS",
+                   3L: "INTER AREA PREFIX",
+                   4L: "INTER AREA ROUTER",
+                   5L: "EXTERNAL PREFIX",
+                   6L: "INTRA AREA PREFIX",
+                   7L: "IPV6 LINK LOCAL",
+                   8L: "IPV4 LINK LOCAL",
+                   }
+DLIST += [ELSA_TLV_TYPES]
+
+ELSA_SUBTLV_TYPES = { 1L: "IPV6 FWD ADDR",
+                      2L: "IPV4 FWD ADDR",
+                      3L: "ROUTE TAG",
+                      30L: "SRV6 SID STRUCTURE",
+                      31L: "SRV6 END.X SID",
+                      32L: "SRV6 LAN END.X SID",
+                      }
+DLIST += [ELSA_SUBTLV_TYPES]
+
+## the SRv6 Locator LSA has TLV and sub-TLV registries of its own
+LOCATOR_TLV_TYPES = { 1L: "SRV6 LOCATOR",
+                      }
+DLIST += [LOCATOR_TLV_TYPES]
+
+LOCATOR_SUBTLV_TYPES = { 1L: "SRV6 END SID",
+                         2L: "IPV6 FWD ADDR",
+                         3L: "ROUTE TAG",
+                         10L: "SRV6 SID STRUCTURE",
+                         }
+DLIST += [LOCATOR_SUBTLV_TYPES]
+
+LOCATOR_ROUTE_TYPES = { 1L: "INTRA AREA",
+                        2L: "INTER AREA",
+                        3L: "EXTERNAL 1",
+                        4L: "EXTERNAL 2",
+                        5L: "NSSA 1",
+                        6L: "NSSA 2",
+                        }
+DLIST += [LOCATOR_ROUTE_TYPES]
+
+## RFC 8986 endpoint behaviors, the usual ones
+SRV6_BEHAVIORS = { 1L: "End",
+                   2L: "End PSP",
+                   3L: "End USP",
+                   4L: "End PSP/USP",
+                   5L: "End.X",
+                   6L: "End.X PSP",
+                   7L: "End.X USP",
+                   8L: "End.X PSP/USP",
+                   9L: "End.T",
+                   16L: "End.DX6",
+                   17L: "End.DX4",
+                   18L: "End.DT6",
+                   19L: "End.DT4",
+                   20L: "End.DT46",
+                   }
+DLIST += [SRV6_BEHAVIORS]
+
+## what can be wrong with a received message, as counted by
+## Ospfv3.fault() and recorded in the quarantine file
+PARSE_FAULTS = { 1L: "SHORT",           # truncated message or field
+                 2L: "BADVER",          # not OSPFv3
+                 3L: "BADTYPE",         # unknown message type
+                 4L: "BADLEN",          # a declared length disagrees with the data
+                 5L: "BADCOUNT",        # a declared count disagrees with the data
+                 6L: "BADTLV",          # a TLV runs past its container
+                 7L: "INTERNAL",        # anything else, ie. a parser bug
+                 8L: "BADCKSUM",        # an LSA's Fletcher checksum is wrong
+                 }
+DLIST += [PARSE_FAULTS]
+
 for d in DLIST:
     for k in d.keys():
         d[ d[k] ] = k
 
+class ParseExc(Exception):
+
+    ## a malformed message; fault is a PARSE_FAULTS name
+    def __init__(self, fault, msg):
+        Exception.__init__(self, msg)
+        self.fault = fault
+
+def checkLen(end, off, n, what):
+
+    if off + n > end:
+        raise ParseExc("SHORT", "%s: %d bytes at %d, only %d" % (what, n, off, end))
+
 ################################################################################
 
 def parseIpHdr(msg, verbose=1, level=0):
@@ -340,7 +492,7 @@ def parseOspfHdr(msg, verbose=1, level=0):
     if verbose > 1:
         print level*INDENT +\
               "OSPF: ver:%s, type:%s, len:%s, rtr id:%s, area id:%s, cksum:%x, instanceid:%s" %\
-              (ver, MSG_TYPES[typ], len, id2str(rid), id2str(aid), cksum, instanceid,)
+              (ver, MSG_TYPES.get(typ, typ), len, id2str(rid), id2str(aid), cksum, instanceid,)
 
     return { "VER"    : ver,
              "TYPE"   : typ,
@@ -378,15 +530,18 @@ def parseOspfOpts(opts, verbose=1, level=0):
              "O"  : obit,
              }
 
-def parseOspfLsaHdr(hdr, verbose=1, level=0):
+def parseOspfLsaHdr(hdr, verbose=1, level=0, off=0):
 
-    if verbose > 1: print prtbin(level*INDENT, hdr)
-    (age, typ, lsid, advrtr, lsseqno, cksum, length) = struct.unpack(OSPFV3_LSAHDR, hdr)
+    ## the header at off, read in place
+    if verbose > 1: print prtbin(level*INDENT, hdr[off:off+OSPFV3_LSAHDR_LEN])
+    (age, typ, lsid, advrtr, lsseqno, cksum, length) =\
+          struct.unpack_from(OSPFV3_LSAHDR, hdr, off)
 
     if verbose > 0:
         print level*INDENT +\
               "age:%s, type:%s, lsid:%s, advrtr:%s, lsseqno:%s, cksum:%x, len:%s" %(
-                  age, LSAV3_TYPES[typ], id2str(lsid), id2str(advrtr), lsseqno, cksum, length)
+                  age, LSAV3_TYPES.get(typ, typ), id2str(lsid), id2str(advrtr),
+                  lsseqno, cksum, length)
 
     return { "AGE"     : age,
              "T"       : typ,
@@ -397,6 +552,18 @@ def parseOspfLsaHdr(hdr, verbose=1, level=0):
              "L"       : length,
              }
 
+def parseOspfLsaHdrs(msg, off, verbose=1, level=0):
+
+    ## the list of LSA headers that ends a DBDesc or makes up an LSAck;
+    ## a trailing partial header is ignored
+    lsas = {} ; cnt = 0
+    for o in xrange(off, len(msg) - OSPFV3_LSAHDR_LEN + 1, OSPFV3_LSAHDR_LEN):
+        cnt += 1
+        if verbose > 0: print level*INDENT + "LSA %s" % cnt
+        lsas[cnt] = parseOspfLsaHdr(msg, verbose, level+1, o)
+
+    return lsas
+
 def parseOspfLsaRtr(lsa, verbose=1, level=0):
 
     if verbose > 1: print prtbin(level*INDENT, lsa[:OSPFV3_LSARTR_LEN])
@@ -415,7 +582,7 @@ def parseOspfLsaRtr(lsa, verbose=1, level=0):
         if verbose > 0:
             print (level+1)*INDENT +\
                   "type:%s, metric:%s, interfaceid:%s, nbinterfaceid:%s, nbrouterid:%s" %(
-                      type, metric, interfaceid, nbinterfaceid, nbrouterid)
+                      type, metric, interfaceid, nbinterfaceid, id2str(nbrouterid))
 
         lsa = lsa[OSPFV3_LSARTR_INTERFACE_LEN:] 
 
@@ -453,6 +620,22 @@ def parseOspfLsaNet(lsa, verbose=1, level=0):
              "RTRS" : rtrs
              }
 
+def parseOspfPrefix(lsa, off, verbose=1, level=0):
+
+    checkLen(len(lsa), off, OSPFV3_PREFIX_LEN, "prefix")
+    (pl, popts, metric) = struct.unpack_from(OSPFV3_PREFIX, lsa, off)
+    off += OSPFV3_PREFIX_LEN
+    if pl > 128: raise ParseExc("BADLEN", "prefix length %d" % pl)
+    nb = ((pl + 31) >> 5) << 2
+    checkLen(len(lsa), off, nb, "prefix")
+    if verbose > 1: print prtbin(level*INDENT, lsa[off-OSPFV3_PREFIX_LEN:off+nb])
+
+    prefix = Prefix6(bytes2ipv6(lsa[off:off+nb]), pl, popts, metric)
+    if verbose > 0:
+        print level*INDENT + "prefix:%s, opts:%s, metric:%s" % (prefix, popts, metric)
+
+    return (prefix, off+nb)
+
 def parseOspfLsaLink(lsa, verbose=1, level=0):
 
     if verbose > 1: print prtbin(level*INDENT, lsa[:OSPFV3_LSALINK_LEN])
@@ -460,59 +643,34 @@ def parseOspfLsaLink(lsa, verbose=1, level=0):
     llprefix = int2ipv6(lcp1, lcp2, lcp3, lcp4)
     if verbose > 0: print (level+1)*INDENT + "link local prefix: %s" % (llprefix)
 
-    lsa = lsa[OSPFV3_LSALINK_LEN:] ; cnt = 0; pr_len = struct.calcsize(">BBH LLL") ; prefixes = []
-    while cnt < int(nprefix):
-        if verbose > 1: print prtbin((level+1)*INDENT, lsa[:pr_len])
-        (pl, popts, _, p1, p2, p3) = struct.unpack('>BBH LLL', lsa[:pr_len])
-	prefix = int2ipv6(p1, p2, p3, 0)
-        if verbose > 0:
-            print (level+1)*INDENT + "prefix:%s" % prefix
-
+    off = OSPFV3_LSALINK_LEN ; prefixes = []
+    for cnt in xrange(nprefix):
+        (prefix, off) = parseOspfPrefix(lsa, off, verbose, level+1)
         prefixes.append(prefix)
-        lsa = lsa[pr_len:]
-	cnt += 1
 
     return { "options" : options,
              "linklocaladdress" : llprefix,
-	     "prefixes" : prefixes
+             "prefixes" : prefixes
              }
 
 def parseOspfLsaIntraAreaPrefix(lsa, verbose=1, level=0):
+
     if verbose > 1: print prtbin(level*INDENT, lsa[:OSPFV3_LSAINTRAPREFIX_LEN])
     (nprefixes, reflstype, reflsid, refadvrouter) = struct.unpack(OSPFV3_LSAINTRAPREFIX, lsa[:OSPFV3_LSAINTRAPREFIX_LEN])
     if verbose > 1: print (level+1)*INDENT + "nprefixes:%s, reflstype:%s, reflsid:%s, refadvrouter:%s" % (nprefixes, reflstype, reflsid, refadvrouter)
 
-    lsa = lsa[OSPFV3_LSAINTRAPREFIX_LEN:] ; cnt = 0; 
-    prefixes = []
-    while cnt < int(nprefixes):
-    	(pr_len_bit,) = struct.unpack('>B', lsa[:struct.calcsize('>B')])
-	pr_len = pr_len_bit/8
-        if verbose > 1: print prtbin((level+1)*INDENT, lsa[:pr_len])
-	prefix_cnt = pr_len/struct.calcsize('>L')
-        (pl, popts, _) = struct.unpack('>BBH', lsa[:struct.calcsize('>BBH')])
-	lsa = lsa[struct.calcsize('>BBH'):]
-	p = [0,0,0,0]
-	for i in range(0, prefix_cnt):
-		(p[i],) = struct.unpack('>L', lsa[:struct.calcsize('>L')])
-		lsa = lsa[struct.calcsize('>L'):]
-	prefix = int2ipv6(p[0], p[1], p[2], p[3])
-        if verbose > 0:
-            print (level+1)*INDENT + "prefix:%s" % prefix
-
+    off = OSPFV3_LSAINTRAPREFIX_LEN ; prefixes = []
+    for cnt in xrange(nprefixes):
+        (prefix, off) = parseOspfPrefix(lsa, off, verbose, level+1)
         prefixes.append(prefix)
-	cnt += 1
 
-    return { 
-	     "nprefix": nprefixes,
-	     "reflstype" : reflstype,
-	     "reflsid" : reflsid,
-	     "refadvrouter" : refadvrouter,
-	     "prefixes" : prefixes
+    return { "nprefix": nprefixes,
+             "reflstype" : reflstype,
+             "reflsid" : reflsid,
+             "refadvrouter" : refadvrouter,
+             "prefixes" : prefixes
              }
 
-
-    return None 
-
 def parseOspfLsaSummary(lsa, verbose=1, level=0):
 
     if verbose > 1: print prtbin(level*INDENT, lsa[:OSPF_LSASUMMARY_LEN])
@@ -586,36 +744,463 @@ def parseOspfLsaExt(lsa, verbose=1, level=0):
              "METRICS": metrics,
              }
 
-def parseOspfLsas(lsas, verbose=1, level=0):
+def opts2int(opts):
 
-    rv = {}
+    ## 24 bit options field, as unpacked by "3s"
+    return struct.unpack(">L", "\x00" + opts)[0]
 
-    cnt = 0
-    while len(lsas) > 0:
-        cnt += 1
-        rv[cnt] = {}
+def parseOspfLsaInterAreaPrefix(lsa, verbose=1, level=0):
 
-        if verbose > 0: print level*INDENT + "LSA %s" % cnt
-        rv[cnt]["H"] = parseOspfLsaHdr(lsas[:OSPFV3_LSAHDR_LEN], verbose, level+1)
-        t = rv[cnt]["H"]["T"]
-        l = rv[cnt]["H"]["L"]
-        rv[cnt]["T"] = t
-        rv[cnt]["L"] = l
-
-        if LSAV3_TYPES[t] == "ROUTER":
-            rv[cnt]["V"] = parseOspfLsaRtr(lsas[OSPFV3_LSAHDR_LEN:l], verbose, level+1)
-        elif LSAV3_TYPES[t] == "NETWORK":
-            rv[cnt]["V"] = parseOspfLsaNet(lsas[OSPFV3_LSAHDR_LEN:l], verbose, level+1)
-        elif LSAV3_TYPES[t] == "LINK LSA":
-            rv[cnt]["V"] = parseOspfLsaLink(lsas[OSPFV3_LSAHDR_LEN:l], verbose, level+1)
-        elif LSAV3_TYPES[t] == "INTRA AREA PREFIX":
-            rv[cnt]["V"] = parseOspfLsaIntraAreaPrefix(lsas[OSPFV3_LSAHDR_LEN:l], verbose, level+1)
+    (metric, ) = struct.unpack_from(OSPFV3_LSAIAPREFIX, lsa)
+    metric &= 0xffffff
+    if verbose > 0: print level*INDENT + "metric:%s" % metric
+
+    (prefix, off) = parseOspfPrefix(lsa, OSPFV3_LSAIAPREFIX_LEN, verbose, level+1)
+    prefix.metric = metric
+
+    return { "METRIC" : metric,
+             "PREFIX" : prefix,
+             }
+
+def parseOspfLsaInterAreaRtr(lsa, verbose=1, level=0):
+
+    if verbose > 1: print prtbin(level*INDENT, lsa[:OSPFV3_LSAIARTR_LEN])
+    (_, options, metric, destrtr) = struct.unpack_from(OSPFV3_LSAIARTR, lsa)
+    metric &= 0xffffff
+    if verbose > 0:
+        print level*INDENT + "destination rtr:%s, metric:%s" % (id2str(destrtr), metric)
+
+    return { "OPTIONS" : opts2int(options),
+             "METRIC"  : metric,
+             "DESTRTR" : destrtr,
+             }
+
+def parseOspfLsaAsExternal(lsa, verbose=1, level=0):
+
+    ## AS-External and NSSA share a format
+    (metric, ) = struct.unpack_from(OSPFV3_LSAASEXT, lsa)
+    e = (metric >> 26) & 0x01
+    f = (metric >> 25) & 0x01
+    t = (metric >> 24) & 0x01
+    metric &= 0xffffff
+    if verbose > 0:
+        print level*INDENT + "ext: %s%s%s, metric:%s" % (e*"E", f*" F", t*" T", metric)
+
+    (prefix, off) = parseOspfPrefix(lsa, OSPFV3_LSAASEXT_LEN, verbose, level+1)
+    reflstype = prefix.metric ; prefix.metric = metric
+
+    fwd = tag = reflsid = None
+    checkLen(len(lsa), off, 16*f + 4*t + 4*(reflstype != 0), "AS external")
+    if f:
+        fwd = ipv62str(bytes2ipv6(lsa[off:off+16])) ; off += 16
+    if t:
+        (tag, ) = struct.unpack_from(">L", lsa, off) ; off += 4
+    if reflstype:
+        (reflsid, ) = struct.unpack_from(">L", lsa, off) ; off += 4
+    if verbose > 0 and (f or t or reflstype):
+        print (level+1)*INDENT + "fwd:%s, tag:%s, reflstype:%s, reflsid:%s" %(
+            fwd, tag, reflstype, reflsid)
+
+    return { "E"         : e,
+             "F"         : f,
+             "T"         : t,
+             "METRIC"    : metric,
+             "PREFIX"    : prefix,
+             "FWD"       : fwd,
+             "TAG"       : tag,
+             "REFLSTYPE" : reflstype,
+             "REFLSID"   : reflsid,
+             }
+
+def parseOspfLsaOpaque(lsa, verbose=1, level=0):
+
+    ## any LS type without a decoder: the body is passed through as is
+    if verbose > 1: print prtbin(level*INDENT, lsa)
+    if verbose > 0: print level*INDENT + "opaque, len:%s" % len(lsa)
 
+    return { "DATA" : str2hex(lsa),
+             }
+
+#-------------------------------------------------------------------------------
+# extended LSAs and SRv6: TLVs are walked by offset over one memoryview of
+# the LSA body, so nested sub-TLVs never copy the bytes beneath them
+
+def walkTlvs(buf, off, end):
+
+    ## (type, value offset, value length) for each TLV in buf[off:end]
+    while off + OSPFV3_TLV_LEN <= end:
+        (t, l) = struct.unpack_from(OSPFV3_TLV, buf, off)
+        off += OSPFV3_TLV_LEN
+        if off + l > end:
+            raise ParseExc("BADTLV", "TLV %d: %d bytes at %d, only %d" % (t, l, off, end))
+        yield (t, off, l)
+        off += (l + 3) & ~3
+
+def parseOspfTlvs(buf, off, end, decoders, names, verbose=1, level=0):
+
+    ## decoders is keyed by TLV type; unknown TLVs are passed through
+    tlvs = []
+    for (t, voff, l) in walkTlvs(buf, off, end):
+        if verbose > 0:
+            print level*INDENT + "tlv %s, len:%s" % (names.get(t, t), l)
+
+        decode = decoders.get(t)
+        if decode is None:
+            data = buf[voff:voff+l].tobytes()
+            if verbose > 1: print prtbin((level+1)*INDENT, data)
+            v = { "DATA" : str2hex(data) }
         else:
-            error("[ *** unknown LSA type %d*** ]\n" % (t, ))
-            error("%s\n" % prtbin(level*INDENT, msg))
+            v = decode(buf, voff, voff+l, verbose, level+1)
+
+        tlvs.append({ "T" : t,
+                      "L" : l,
+                      "V" : v,
+                      })
+
+    return tlvs
+
+def unpackIpv6(buf, off):
+
+    (hi, lo) = struct.unpack_from(">QQ", buf, off)
+    return (hi << 64) | lo
+
+def parseTlvRtrLink(buf, off, end, verbose=1, level=0):
+
+    checkLen(end, off, OSPFV3_LSARTR_INTERFACE_LEN, "router link TLV")
+    (type, _, metric, interfaceid, nbinterfaceid, nbrouterid) =\
+           struct.unpack_from(OSPFV3_LSARTR_INTERFACE, buf, off)
+    if verbose > 0:
+        print level*INDENT +\
+              "type:%s, metric:%s, interfaceid:%s, nbinterfaceid:%s, nbrouterid:%s" %(
+                  type, metric, interfaceid, nbinterfaceid, id2str(nbrouterid))
+
+    return { "TYPE"          : type,
+             "METRIC"        : metric,
+             "INTERFACEID"   : interfaceid,
+             "NBINTERFACEID" : nbinterfaceid,
+             "NBROUTERID"    : nbrouterid,
+             "SUBTLVS"       : parseOspfTlvs(buf, off+OSPFV3_LSARTR_INTERFACE_LEN, end,
+                                             ELSA_SUBTLVS, ELSA_SUBTLV_TYPES,
+                                             verbose, level+1),
+             }
+
+def parseTlvAttachedRtrs(buf, off, end, verbose=1, level=0):
+
+    rtrs = list(struct.unpack_from(">%dL" % ((end - off) >> 2), buf, off))
+    if verbose > 0:
+        for rtr in rtrs: print level*INDENT + "attached rtr:%s" % id2str(rtr)
+
+    return { "RTRS" : rtrs,
+             }
+
+def parseTlvPrefix(buf, off, end, verbose=1, level=0):
+
+    ## Inter-Area-Prefix, External-Prefix (E, F, T flags) and
+    ## Intra-Area-Prefix (no flags, 16 bit metric) TLVs
+    checkLen(end, off, OSPFV3_TLV_PREFIX_LEN, "prefix TLV")
+    (metric, pl, popts, _) = struct.unpack_from(OSPFV3_TLV_PREFIX, buf, off)
+    flags = metric >> 24 ; metric &= 0xffffff
+    off += OSPFV3_TLV_PREFIX_LEN
+    if pl > 128: raise ParseExc("BADLEN", "prefix length %d" % pl)
+    nb = ((pl + 31) >> 5) << 2
+    checkLen(end, off, nb, "prefix TLV")
+
+    prefix = Prefix6(bytes2ipv6(buf[off:off+nb].tobytes()), pl, popts, metric)
+    if verbose > 0:
+        print level*INDENT + "prefix:%s, opts:%s, metric:%s, flags:%s" %(
+            prefix, popts, metric, int2bin(flags))
+
+    return { "PREFIX"  : prefix,
+             "METRIC"  : metric,
+             "FLAGS"   : flags,
+             "SUBTLVS" : parseOspfTlvs(buf, off+nb, end,
+                                       ELSA_SUBTLVS, ELSA_SUBTLV_TYPES,
+                                       verbose, level+1),
+             }
+
+def parseTlvIARtr(buf, off, end, verbose=1, level=0):
+
+    checkLen(end, off, OSPFV3_LSAIARTR_LEN, "inter area router TLV")
+    (_, options, metric, destrtr) = struct.unpack_from(OSPFV3_LSAIARTR, buf, off)
+    metric &= 0xffffff
+    if verbose > 0:
+        print level*INDENT + "destination rtr:%s, metric:%s" % (id2str(destrtr), metric)
+
+    return { "OPTIONS" : opts2int(options),
+             "METRIC"  : metric,
+             "DESTRTR" : destrtr,
+             "SUBTLVS" : parseOspfTlvs(buf, off+OSPFV3_LSAIARTR_LEN, end,
+                                       ELSA_SUBTLVS, ELSA_SUBTLV_TYPES,
+                                       verbose, level+1),
+             }
+
+def parseTlvIpv6Addr(buf, off, end, verbose=1, level=0):
+
+    ## link-local address TLV, forwarding address sub-TLV
+    checkLen(end, off, 16, "IPv6 address")
+    addr = ipv62str(unpackIpv6(buf, off))
+    if verbose > 0: print level*INDENT + "addr:%s" % addr
+
+    return { "ADDR" : addr,
+             }
+
+def parseTlvIpv4Addr(buf, off, end, verbose=1, level=0):
+
+    checkLen(end, off, 4, "IPv4 address")
+    (addr, ) = struct.unpack_from(">L", buf, off)
+    if verbose > 0: print level*INDENT + "addr:%s" % id2str(addr)
+
+    return { "ADDR" : id2str(addr),
+             }
+
+def parseSubTlvRouteTag(buf, off, end, verbose=1, level=0):
+
+    checkLen(end, off, 4, "route tag")
+    (tag, ) = struct.unpack_from(">L", buf, off)
+    if verbose > 0: print level*INDENT + "tag:0x%x" % tag
+
+    return { "TAG" : tag,
+             }
+
+def parseSubTlvSidStruct(buf, off, end, verbose=1, level=0):
+
+    checkLen(end, off, OSPFV3_SUBTLV_SIDSTRUCT_LEN, "SID structure")
+    (lb, ln, fun, arg) = struct.unpack_from(OSPFV3_SUBTLV_SIDSTRUCT, buf, off)
+    if verbose > 0:
+        print level*INDENT + "sid structure: lb:%s, ln:%s, fun:%s, arg:%s" % (lb, ln, fun, arg)
+
+    return { "LB"  : lb,
+             "LN"  : ln,
+             "FUN" : fun,
+             "ARG" : arg,
+             }
+
+def parseSubTlvEndSid(buf, off, end, verbose=1, level=0):
+
+    checkLen(end, off, OSPFV3_SUBTLV_ENDSID_LEN + 16, "End SID")
+    (flags, _, behavior) = struct.unpack_from(OSPFV3_SUBTLV_ENDSID, buf, off)
+    off += OSPFV3_SUBTLV_ENDSID_LEN
+    sid = ipv62str(unpackIpv6(buf, off))
+    if verbose > 0:
+        print level*INDENT + "end sid:%s, behavior:%s, flags:%s" %(
+            sid, SRV6_BEHAVIORS.get(behavior, behavior), int2bin(flags))
+
+    return { "SID"      : sid,
+             "BEHAVIOR" : behavior,
+             "FLAGS"    : flags,
+             "SUBTLVS"  : parseOspfTlvs(buf, off+16, end,
+                                        LOCATOR_SUBTLVS, LOCATOR_SUBTLV_TYPES,
+                                        verbose, level+1),
+             }
+
+def parseSubTlvEndXSid(buf, off, end, verbose=1, level=0, lan=0):
+
+    checkLen(end, off, (lan and OSPFV3_SUBTLV_LANENDXSID_LEN or OSPFV3_SUBTLV_ENDXSID_LEN) + 16,
+             "End.X SID")
+    if lan:
+        (behavior, flags, _, algo, weight, _, nbrouterid) =\
+                   struct.unpack_from(OSPFV3_SUBTLV_LANENDXSID, buf, off)
+        off += OSPFV3_SUBTLV_LANENDXSID_LEN
+    else:
+        (behavior, flags, _, algo, weight, _) =\
+                   struct.unpack_from(OSPFV3_SUBTLV_ENDXSID, buf, off)
+        off += OSPFV3_SUBTLV_ENDXSID_LEN
+        nbrouterid = None
+
+    b = (flags & 0x80) >> 7             # protected by a backup
+    s = (flags & 0x40) >> 6             # one of a set
+    p = (flags & 0x20) >> 5             # persistent
+    sid = ipv62str(unpackIpv6(buf, off))
+    if verbose > 0:
+        print level*INDENT + "end.x sid:%s, behavior:%s, algo:%s, weight:%s, flags:%s%s%s%s" %(
+            sid, SRV6_BEHAVIORS.get(behavior, behavior), algo, weight,
+            b*"B", s*"S", p*"P", lan and ", nbrouterid:%s" % id2str(nbrouterid) or "")
+
+    return { "SID"        : sid,
+             "BEHAVIOR"   : behavior,
+             "ALGO"       : algo,
+             "WEIGHT"     : weight,
+             "B"          : b,
+             "S"          : s,
+             "P"          : p,
+             "NBROUTERID" : nbrouterid,
+             "SUBTLVS"    : parseOspfTlvs(buf, off+16, end,
+                                          ELSA_SUBTLVS, ELSA_SUBTLV_TYPES,
+                                          verbose, level+1),
+             }
+
+def parseSubTlvLanEndXSid(buf, off, end, verbose=1, level=0):
+
+    return parseSubTlvEndXSid(buf, off, end, verbose, level, 1)
+
+def parseTlvLocator(buf, off, end, verbose=1, level=0):
+
+    checkLen(end, off, OSPFV3_TLV_LOCATOR_LEN + 16, "locator TLV")
+    (rtype, algo, plen, flags, metric) = struct.unpack_from(OSPFV3_TLV_LOCATOR, buf, off)
+    off += OSPFV3_TLV_LOCATOR_LEN
+    if plen > 128: raise ParseExc("BADLEN", "locator length %d" % plen)
+    n = (flags & 0x80) >> 7             # node: the locator identifies the router
+    a = (flags & 0x40) >> 6             # anycast
+    locator = Prefix6(unpackIpv6(buf, off), plen, 0, metric)
+    if verbose > 0:
+        print level*INDENT + "locator:%s, type:%s, algo:%s, metric:%s, flags:%s%s" %(
+            locator, LOCATOR_ROUTE_TYPES.get(rtype, rtype), algo, metric, n*"N", a*"A")
+
+    return { "LOCATOR"   : locator,
+             "ROUTETYPE" : rtype,
+             "ALGO"      : algo,
+             "METRIC"    : metric,
+             "N"         : n,
+             "A"         : a,
+             "SUBTLVS"   : parseOspfTlvs(buf, off+16, end,
+                                         LOCATOR_SUBTLVS, LOCATOR_SUBTLV_TYPES,
+                                         verbose, level+1),
+             }
+
+ELSA_TLVS = { 1: parseTlvRtrLink,
+              2: parseTlvAttachedRtrs,
+              3: parseTlvPrefix,
+              4: parseTlvIARtr,
+              5: parseTlvPrefix,
+              6: parseTlvPrefix,
+              7: parseTlvIpv6Addr,
+              8: parseTlvIpv4Addr,
+              }
+
+ELSA_SUBTLVS = { 1: parseTlvIpv6Addr,
+                 2: parseTlvIpv4Addr,
+                 3: parseSubTlvRouteTag,
+                 30: parseSubTlvSidStruct,
+                 31: parseSubTlvEndXSid,
+                 32: parseSubTlvLanEndXSid,
+                 }
+
+LOCATOR_TLVS = { 1: parseTlvLocator,
+                 }
+
+LOCATOR_SUBTLVS = { 1: parseSubTlvEndSid,
+                    2: parseTlvIpv6Addr,
+                    3: parseSubTlvRouteTag,
+                    10: parseSubTlvSidStruct,
+                    }
+
+def parseOspfLsaERtr(lsa, verbose=1, level=0):
+
+    buf = memoryview(lsa)
+    (veb, options) = struct.unpack_from(OSPFV3_LSARTR, buf)
+    v = (veb & 0x01)
+    e = (veb & 0x02) >> 1
+    b = (veb & 0x04) >> 2
+    if verbose > 0:
+        print level*INDENT + "rtr desc: %s %s %s" %(
+            v*"VIRTUAL", e*"EXTERNAL", b*"BORDER")
+
+    return { "VIRTUAL"  : v,
+             "EXTERNAL" : e,
+             "BORDER"   : b,
+             "OPTIONS"  : opts2int(options),
+             "TLVS"     : parseOspfTlvs(buf, OSPFV3_LSARTR_LEN, len(buf),
+                                        ELSA_TLVS, ELSA_TLV_TYPES, verbose, level),
+             }
+
+def parseOspfLsaENet(lsa, verbose=1, level=0):
+
+    buf = memoryview(lsa)
+    (_, options) = struct.unpack_from(OSPFV3_LSANET, buf)
+
+    return { "OPTIONS" : opts2int(options),
+             "TLVS"    : parseOspfTlvs(buf, OSPFV3_LSANET_LEN, len(buf),
+                                       ELSA_TLVS, ELSA_TLV_TYPES, verbose, level),
+             }
+
+def parseOspfLsaELink(lsa, verbose=1, level=0):
 
-        lsas = lsas[l:]
+    buf = memoryview(lsa)
+    (prio, options) = struct.unpack_from(OSPFV3_ELSALINK, buf)
+    if verbose > 0: print level*INDENT + "prio:%s" % prio
+
+    return { "PRIO"    : prio,
+             "OPTIONS" : opts2int(options),
+             "TLVS"    : parseOspfTlvs(buf, OSPFV3_ELSALINK_LEN, len(buf),
+                                       ELSA_TLVS, ELSA_TLV_TYPES, verbose, level),
+             }
+
+def parseOspfLsaEIntraAreaPrefix(lsa, verbose=1, level=0):
+
+    buf = memoryview(lsa)
+    (_, reflstype, reflsid, refadvrtr) = struct.unpack_from(OSPFV3_LSAINTRAPREFIX, buf)
+    if verbose > 0:
+        print level*INDENT + "reflstype:%s, reflsid:%s, refadvrtr:%s" %(
+            LSAV3_TYPES.get(reflstype, reflstype), reflsid, id2str(refadvrtr))
+
+    return { "REFLSTYPE" : reflstype,
+             "REFLSID"   : reflsid,
+             "REFADVRTR" : refadvrtr,
+             "TLVS"      : parseOspfTlvs(buf, OSPFV3_LSAINTRAPREFIX_LEN, len(buf),
+                                         ELSA_TLVS, ELSA_TLV_TYPES, verbose, level),
+             }
+
+def parseOspfLsaETlvs(lsa, verbose=1, level=0):
+
+    ## E-Inter-Area-Prefix, E-Inter-Area-Router, E-AS-External, E-NSSA:
+    ## nothing but TLVs
+    buf = memoryview(lsa)
+
+    return { "TLVS" : parseOspfTlvs(buf, 0, len(buf),
+                                    ELSA_TLVS, ELSA_TLV_TYPES, verbose, level),
+             }
+
+def parseOspfLsaSrv6Locator(lsa, verbose=1, level=0):
+
+    buf = memoryview(lsa)
+
+    return { "TLVS" : parseOspfTlvs(buf, 0, len(buf),
+                                    LOCATOR_TLVS, LOCATOR_TLV_TYPES, verbose, level),
+             }
+
+## keyed by the whole 16 bit LS type; anything else is opaque
+LSA_DECODERS = { 0x2001: parseOspfLsaRtr,
+                 0x2002: parseOspfLsaNet,
+                 0x2003: parseOspfLsaInterAreaPrefix,
+                 0x2004: parseOspfLsaInterAreaRtr,
+                 0x4005: parseOspfLsaAsExternal,
+                 0x2006: parseOspfLsaOpaque,        # group membership, unused
+                 0x2007: parseOspfLsaAsExternal,    # NSSA
+                 0x0008: parseOspfLsaLink,
+                 0x2009: parseOspfLsaIntraAreaPrefix,
+
+                 0xA021: parseOspfLsaERtr,
+                 0xA022: parseOspfLsaENet,
+                 0xA023: parseOspfLsaETlvs,
+                 0xA024: parseOspfLsaETlvs,
+                 0xC025: parseOspfLsaETlvs,
+                 0xA027: parseOspfLsaETlvs,
+                 0x8028: parseOspfLsaELink,
+                 0xA029: parseOspfLsaEIntraAreaPrefix,
+                 0xA02A: parseOspfLsaSrv6Locator,
+                 }
+
+def parseOspfLsas(lsas, verbose=1, level=0):
+
+    rv = {}
+
+    cnt = 0 ; off = 0
+    while off + OSPFV3_LSAHDR_LEN <= len(lsas):
+        if verbose > 0: print level*INDENT + "LSA %s" % (cnt + 1)
+        hdr = parseOspfLsaHdr(lsas, verbose, level+1, off)
+        t = hdr["T"] ; l = hdr["L"]
+        if l < OSPFV3_LSAHDR_LEN or off + l > len(lsas):
+            raise ParseExc("BADLEN", "LSA %d: length %d at %d, only %d" %(
+                cnt + 1, l, off, len(lsas)))
+
+        cnt += 1
+        decode = LSA_DECODERS.get(t, parseOspfLsaOpaque)
+        rv[cnt] = { "H" : hdr,
+                    "T" : t,
+                    "L" : l,
+                    "V" : decode(lsas[off+OSPFV3_LSAHDR_LEN:off+l], verbose, level+1),
+                    }
+        off += l
 
     return rv
 
@@ -659,7 +1244,7 @@ def parseOspfHello(msg, verbose=1, level=0):
 def parseOspfDesc(msg, verbose=1, level=0):
 
     if verbose > 1: print prtbin(level*INDENT, msg)
-    (zero, opts, mtu, aopts, imms, ddseqno) = struct.unpack(OSPFV3_DESC, msg[:OSPFV3_DESC_LEN])
+    (zero, opts, mtu, aopts, imms, ddseqno) = struct.unpack_from(OSPFV3_DESC, msg)
     init        = (imms & 0x04) >> 2
     more        = (imms & 0x02) >> 1
     masterslave = (imms & 0x01)
@@ -670,17 +1255,32 @@ def parseOspfDesc(msg, verbose=1, level=0):
                masterslave*" MASTER" ,(1-masterslave)*" SLAVE",
                ddseqno)
 
+    lsas = parseOspfLsaHdrs(msg, OSPFV3_DESC_LEN, verbose, level+1)
+
     return { "MTU"         : mtu,
              "OPTS"        : parseOspfOpts(opts, verbose, level),
              "INIT"        : init,
              "MORE"        : more,
              "MASTERSLAVE" : masterslave,
+             "DDSEQNO"     : ddseqno,
+             "LSAS"        : lsas,
              }
 
 def parseOspfLSReq(msg, verbose=1, level=0):
 
-    error("### LSREQ UNIMPLEMENTED ###\n")
-    return None
+    if verbose > 0: print level*INDENT + "LSREQ"
+
+    reqs = []
+    for off in xrange(0, len(msg) - OSPFV3_LSREQ_LEN + 1, OSPFV3_LSREQ_LEN):
+        if verbose > 1: print prtbin((level+1)*INDENT, msg[off:off+OSPFV3_LSREQ_LEN])
+        (zero, typ, lsid, advrtr) = struct.unpack_from(OSPFV3_LSREQ, msg, off)
+        if verbose > 0:
+            print (level+1)*INDENT + "type:%s, lsid:%s, advrtr:%s" %(
+                LSAV3_TYPES.get(typ, typ), id2str(lsid), id2str(advrtr))
+        reqs.append({ "T": typ, "LSID": lsid, "ADVRTR": advrtr })
+
+    return { "REQS" : reqs,
+             }
 
 def parseOspfLsUpd(msg, verbose=1, level=0):
 
@@ -689,53 +1289,175 @@ def parseOspfLsUpd(msg, verbose=1, level=0):
     if verbose > 0:
         print level*INDENT + "LSUPD: nlsas:%s" % (nlsas)
 
+    lsas = parseOspfLsas(msg[OSPFV3_LSUPD_LEN:], verbose, level+1)
+    if len(lsas) != nlsas:
+        raise ParseExc("BADCOUNT", "LSUPD: %d LSAs declared, %d present" % (nlsas, len(lsas)))
+
     return { "NLSAS" : nlsas,
-             "LSAS"  : parseOspfLsas(msg[OSPFV3_LSUPD_LEN:], verbose, level+1),
+             "LSAS"  : lsas,
              }
 
 def parseOspfLsAck(msg, verbose=1, level=0):
 
     if verbose > 0: print level*INDENT + "LSACK"
 
-    cnt = 0 ; lsas = {}
-    while len(msg) > 0:
-        cnt += 1
-        if verbose > 0: print (level+1)*INDENT + "LSA %s" % cnt
-        lsas[cnt] = parseOspfLsaHdr(msg[:OSPF_LSAHDR_LEN], verbose, level+1)
-        msg = msg[OSPF_LSAHDR_LEN:]
-
-    return { "LSAS"  : lsas
+    return { "LSAS"  : parseOspfLsaHdrs(msg, 0, verbose, level+1),
              }
 
+MSG_PARSERS = { 1: parseOspfHello,
+                2: parseOspfDesc,
+                3: parseOspfLSReq,
+                4: parseOspfLsUpd,
+                5: parseOspfLsAck,
+                }
+
 def parseOspfMsg(msg, verbose=1, level=0):
 
+    ## raises ParseExc for anything malformed.  The body is bounded by the
+    ## length in the header, so trailing bytes (an authentication trailer)
+    ## are ignored
+    checkLen(len(msg), 0, OSPFV3_HDR_LEN, "OSPF header")
     ospfh = parseOspfHdr(msg[:OSPFV3_HDR_LEN], verbose, level)
+    if ospfh["VER"] != 3:
+        raise ParseExc("BADVER", "version %d" % ospfh["VER"])
+    if ospfh["LEN"] < OSPFV3_HDR_LEN or ospfh["LEN"] > len(msg):
+        raise ParseExc("BADLEN", "message length %d, received %d" % (ospfh["LEN"], len(msg)))
+
+    parse = MSG_PARSERS.get(ospfh["TYPE"])
+    if parse is None:
+        raise ParseExc("BADTYPE", "message type %d" % ospfh["TYPE"])
+
     rv = { "T": ospfh["TYPE"],
            "L": len(msg),
            "V": ospfh,
            }
 
-    if MSG_TYPES[ospfh["TYPE"]] == "HELLO" and (PARSE[0] == 1):
-        rv["V"]["V"] = parseOspfHello(msg[OSPFV3_HDR_LEN:], verbose, level+1)
+    if PARSE[ospfh["TYPE"]-1] == 1:
+        try:
+            rv["V"]["V"] = parse(msg[OSPFV3_HDR_LEN:ospfh["LEN"]], verbose, level+1)
+        except struct.error, se:
+            raise ParseExc("SHORT", "%s: %s" % (MSG_TYPES[ospfh["TYPE"]], se))
+
+    return rv
 
-    elif MSG_TYPES[ospfh["TYPE"]] == "DBDESC" and (PARSE[1] == 1):
-        rv["V"]["V"] = parseOspfDesc(msg[OSPFV3_HDR_LEN:], verbose, level+1)
+#-------------------------------------------------------------------------------
 
-    elif MSG_TYPES[ospfh["TYPE"]] == "LSREQ" and (PARSE[2] == 1):
-        rv["V"]["V"] = parseOspfLSReq(msg[OSPFV3_HDR_LEN:], verbose, level)
+## LSA checksums: the ISO 8473 Fletcher checksum of everything but the
+## age (RFC 5340 4.4.2), which is valid when both running sums come to
+## zero over the LSA as received.  There is no byte loop: c0 is the sum
+## of the bytes, and c1, the sum of the running c0s, is the sum of every
+## prefix of the bytes; as 256 = 1 mod 255, a prefix's sum is its value
+## as a big-endian integer, mod 255.  Summing the prefixes of N, with
+## digit sum s, gives (256 N - s) / 255, so c1 is long arithmetic in C.
+
+LSA_CKSUM_OFF = 16              # in the LSA header, 14 past the age
+
+def fletcher(buf, off, end):
+
+    ## -> (c0, c1) over buf[off:end]
+    b = buf[off:end] ; s = sum(bytearray(b)) ; n = int(hexlify(b) or "0", 16)
+    return (s % 255, ((n << 8) - s) % 65025 // 255)
+
+def lsaCksum(lsa):
+
+    ## the checksum field for an LSA whose checksum field is zero
+    (c0, c1) = fletcher(lsa, 2, len(lsa))
+    x = ((len(lsa) - LSA_CKSUM_OFF - 1) * c0 - c1) % 255
+    if x == 0: x = 255
+    y = 510 - c0 - x
+    if y > 255: y -= 255
+    return (x << 8) | y
+
+def lsaCksumOk(buf, off, length):
+
+    return fletcher(buf, off + 2, off + length) == (0, 0)
+
+def badLsas(msg, raw, seen=None):
+
+    ## the numbers of the LSAs in a parsed LSUPD whose checksums are
+    ## wrong; seen(aid, hdr) true skips an LSA already known good, eg.
+    ## one the LSDB holds with the same sequence number and checksum
+    aid = msg["V"]["AID"] ; lsas = msg["V"]["V"]["LSAS"]
+    off = OSPFV3_HDR_LEN + OSPFV3_LSUPD_LEN ; bad = []
+    for cnt in xrange(1, len(lsas) + 1):
+        hdr = lsas[cnt]["H"]
+        if not (seen and seen(aid, hdr)) and not lsaCksumOk(raw, off, hdr["L"]):
+            bad.append(cnt)
+        off += hdr["L"]
+    return bad
+
+def dropLsas(msg, raw, bad):
+
+    ## the LSUPD without the LSAs numbered in bad, renumbered and
+    ## re-encoded: (msg, raw), or None if nothing is left
+    lsas = msg["V"]["V"]["LSAS"] ; keep = [] ; raws = []
+    off = OSPFV3_HDR_LEN + OSPFV3_LSUPD_LEN
+    for cnt in xrange(1, len(lsas) + 1):
+        l = lsas[cnt]["L"]
+        if cnt not in bad:
+            keep.append(lsas[cnt]) ; raws.append(raw[off:off+l])
+        off += l
+    if not keep: return None
+
+    h = msg["V"]
+    raw = mkOspfMsg(MSG_TYPES["LSUPD"], mkLsUpd(raws), h["RID"], h["AID"], h["INSTANCEID"])
+    rv = dict(msg) ; rv["L"] = len(raw)
+    rv["V"] = dict(h) ; rv["V"]["LEN"] = len(raw)
+    rv["V"]["V"] = { "NLSAS" : len(keep),
+                     "LSAS"  : dict(zip(xrange(1, len(keep) + 1), keep)),
+                     }
+    return (rv, raw)
 
-    elif MSG_TYPES[ospfh["TYPE"]] == "LSUPD" and (PARSE[3] == 1):
-        rv["V"]["V"] = parseOspfLsUpd(msg[OSPFV3_HDR_LEN:], verbose, level+1)
+################################################################################
 
-    elif MSG_TYPES[ospfh["TYPE"]] == "LSACK" and (PARSE[4] == 1):
-        rv["V"]["V"] = parseOspfLsAck(msg[OSPFV3_HDR_LEN:], verbose, level+1)
+def mkOspfMsg(typ, body, rid, aid=0, instanceid=0):
 
-    return rv
+    ## OSPFv3 header + body; the checksum is left to the kernel (IPV6_CHECKSUM)
+    return struct.pack(OSPFV3_HDR, 3, typ, OSPFV3_HDR_LEN + len(body),
+                       rid, aid, 0, instanceid, 0) + body
+
+def mkLsa(typ, lsid, advrtr, seqno, body, age=0):
+
+    lsa = struct.pack(OSPFV3_LSAHDR, age, typ, lsid, advrtr, seqno, 0,
+                      OSPFV3_LSAHDR_LEN + len(body)) + body
+    return lsa[:LSA_CKSUM_OFF] + struct.pack(">H", lsaCksum(lsa)) + lsa[LSA_CKSUM_OFF+2:]
+
+def opts2str(opts):
+
+    return struct.pack(">L", opts)[1:]
+
+def mkHello(ifid, prio, opts, hello, dead, desig, bdesig, nbrs):
+
+    return struct.pack(OSPFV3_HELLO, ifid, prio, opts2str(opts), hello, dead,
+                       desig, bdesig) +\
+           "".join([ struct.pack(">L", n) for n in nbrs ])
+
+def mkDesc(opts, mtu, flags, ddseqno, hdrs=()):
+
+    ## hdrs: raw 20 byte LSA headers
+    return struct.pack(OSPFV3_DESC, 0, opts2str(opts), mtu, 0, flags, ddseqno) +\
+           "".join(hdrs)
+
+def mkLsReq(reqs):
+
+    ## reqs: (type, lsid, advrtr)
+    return "".join([ struct.pack(OSPFV3_LSREQ, 0, t, l, a) for (t, l, a) in reqs ])
+
+def mkLsUpd(lsas):
+
+    ## lsas: raw LSAs
+    return struct.pack(OSPFV3_LSUPD, len(lsas)) + "".join(lsas)
 
 ################################################################################
 
 class OspfExc(Exception): pass
 
+def ifIndex(ifname):
+
+    return int(open("/sys/class/net/%s/ifindex" % ifname).read())
+
+################################################################################
+
 class Ospfv3:
 
     _version   = 2
@@ -743,14 +1465,62 @@ class Ospfv3:
 
     #---------------------------------------------------------------------------
 
-    class Adj:
+    def __init__(self, ADDRESS, ifnames=None):
 
-        def __init__(self): pass
-        def __repr__(self): pass
+        ## with ifnames, one socket per interface, bound to it with
+        ## SO_BINDTODEVICE and multiplexed with epoll; every message is
+        ## then attributed to the interface it arrived on, whatever its
+        ## source address.  Without, one socket for all interfaces, and
+        ## only link-local sources carry an interface (their scope id)
 
-    #---------------------------------------------------------------------------
+        self._addr   = (ADDRESS, 0)
+        self._socks  = {}       # ifindex: socket
+        self._fds    = {}       # fileno: (ifindex, socket)
+        self._poll   = None
+        self._ready  = []
+        self._rx     = {}       # fileno: tstamp.Receiver, if the kernel stamps
+
+        if not ifnames:
+            self._sock = self.open()
+        else:
+            self._poll = select.epoll()
+            for ifname in ifnames:
+                ifindex = ifIndex(ifname)
+                sock = self.open(ifname)
+                self._socks[ifindex] = sock
+                self._fds[sock.fileno()] = (ifindex, sock)
+                self._poll.register(sock.fileno(), select.EPOLLIN)
+            self._sock = self._socks[ifIndex(ifnames[0])]
+        self._name = self._sock.getsockname()
+
+        self._adjs    = {}
+        self._rcvd    = ""
+        self._src     = None
+        self._ifindex = 0
+        self._rcvtime = 0.0
+        self._mrtd    = None
+
+        self.faults     = dict.fromkeys([ f for f in PARSE_FAULTS if isinstance(f, str) ], 0)
+        self.quarantine = None
+        self.metrics    = None
+        self.filter     = None      # bpf.MsgFilter, checked here as well
+        self.filtered   = 0
+        self.verify     = True      # check LSA checksums ...
+        self.seen       = None      # ... but not where seen(aid, hdr)
+	
+
+    def __repr__(self):
+
+        rs = """OSPF listener, version %s:
+        %s
+        socket:  %s
+        address: %s, name: %s, interfaces: %s""" %\
+            (self._version, self._mrtd, self._sock, self._addr, self._name,
+             self._socks and sorted(self._socks.keys()) or "all")
+
+        return rs
 
-    def __init__(self, ADDRESS):
+    def open(self, ifname=None):
 
         ## XXX raw sockets are broken in Windows Python (some madness
         ## about linking against winsock1, etc); applied "patch" from
@@ -758,46 +1528,63 @@ class Ospfv3:
         ## http://www.rs.fromadia.com/newsread.php?newsid=254,
         ## http://www.rs.fromadia.com/files/pyraw.exe to fix this
 
-        #self._sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_IP)
-        #self._sock = socket.socket(socket.AF_INET6, socket.SOCK_RAW, socket.IPPROTO_IPV6)
-        #self._sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-	self._sock = socket.socket(socket.AF_INET6, socket.SOCK_RAW, 89)
-	#res = socket.getaddrinfo("localhost", 2000, socket.AF_INET6, socket.SOCK_RAW, socket.IPPROTO_IPV6)
-	#af, socktype, proto, canonname, sa = res[1]
+        #sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_IP)
+        #sock = socket.socket(socket.AF_INET6, socket.SOCK_RAW, socket.IPPROTO_IPV6)
+        #sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        sock = socket.socket(socket.AF_INET6, socket.SOCK_RAW, 89)
+        if ifname is not None:
+            sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, ifname + "\0")
+        sock.bind(self._addr)
 
-        #self._sock = socket.socket(af, socktype, proto)
-        self._addr = (ADDRESS, 0)
-        self._sock.bind(self._addr)
-        self._name = self._sock.getsockname()
+        #sock.setsockopt(89, socket.IP_HDRINCL, 1)
+        #sock.ioctl(socket.SIO_RCVALL, 1)
 
-        #self._sock.setsockopt(89, socket.IP_HDRINCL, 1)
-	#self._sock.listen(1)
-        #self._sock.ioctl(socket.SIO_RCVALL, 1)
+        ## the kernel computes and verifies the OSPFv3 checksum, which
+        ## covers an IPv6 pseudo-header (RFC 5340 A.3.1)
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_CHECKSUM, 12)
 
-        self._adjs = {}
-        self._rcvd = ""
-        self._mrtd = None
-	
+        ## receive time as stamped by the kernel, not when we got round
+        ## to reading the message
+        try:
+            self._rx[sock.fileno()] = tstamp.Receiver(sock, RECV_BUF_SZ)
+        except tstamp.TstampExc:
+            pass
 
-    def __repr__(self):
+        return sock
 
-        rs = """OSPF listener, version %s:
-        %s
-        socket:  %s
-        address: %s, name: %s""" %\
-            (self._version, self._mrtd, self._sock, self._addr, self._name)
+    def close(self):
 
-        return rs
+        for sock in self.socks(): sock.close()
+        if self._poll is not None: self._poll.close()
+        if self._mrtd: self._mrtd.close()
 
-    def close(self):
+    def fileno(self):
+
+        ## for select(): the epoll set is readable when any socket is
+        if self._poll is not None: return self._poll.fileno()
+        return self._sock.fileno()
+
+    def socks(self):
+
+        return self._socks.values() or [ self._sock ]
+
+    def ifsocks(self):
+
+        ## [(interface index, socket)]; 0 for the one wildcard socket
+        return self._socks.items() or [ (0, self._sock) ]
 
-        self._sock.close()
-        self._mrtd.close()
+    def sock(self, ifindex):
+
+        ## the socket to send on, or join groups on, for an interface
+        return self._socks.get(ifindex, self._sock)
 
     #---------------------------------------------------------------------------
 
     def parseMsg(self, verbose=1, level=0):
-	rv = None
+
+        ## None for anything that does not parse; it is counted and
+        ## quarantined instead
+        t0 = time.time()
         try:
             (msg_len, msg) = self.recvMsg(verbose, level)
 
@@ -805,31 +1592,105 @@ class Ospfv3:
             if verbose > 1: print "[ *** Non OSPF packet received *** ]"
             return
 
-	if 1:
-            ospfh = parseOspfHdr(msg[:OSPFV3_HDR_LEN], 0)
+        ## normally done by the kernel; this catches what was queued
+        ## before the filter went on, or a kernel that would not take it
+        if self.filter is not None and not self.filter.match(msg):
+            self.filtered += 1
+            return
 
-            if verbose > 2:
-                print "%sparseMsg: len=%d%s" %\
-                      (level*INDENT, msg_len, prthex((level+1)*INDENT, msg))
+        ## MRT dump (mrtd.Mrtd of PROTOCOL_OSPF3_ET), at the receive stamp
+        if self._mrtd is not None:
+            self._mrtd.writeOspfv3Msg(msg, self._src[0], self._name[0], self._rcvtime)
 
+        if verbose > 2:
+            print "%sparseMsg: len=%d%s" %\
+                  (level*INDENT, msg_len, prthex((level+1)*INDENT, msg))
+
+        t1 = time.time()
+        try:
             rv = parseOspfMsg(msg, verbose, level)
-		
 
-            return rv
+        except ParseExc, pe:
+            self.fault(pe.fault, pe, verbose)
+            return
+
+        ## LSAs that fail their checksum are dropped, as a router would,
+        ## and the rest of the LSUPD goes on
+        if self.verify and rv["T"] == MSG_TYPES["LSUPD"] and "V" in rv["V"]:
+            bad = badLsas(rv, msg, self.seen)
+            if bad:
+                self.fault("BADCKSUM", "LSA %s of %d" %(
+                    ",".join(map(str, bad)), len(rv["V"]["V"]["LSAS"])), verbose)
+                rv = dropLsas(rv, msg, bad)
+                if rv is None: return
+                (rv, self._rcvd) = rv
+
+        rv["IFINDEX"] = self._ifindex
+        rv["SRC"]     = self._src[0]
+        rv["TS"]      = self._rcvtime
+
+        m = self.metrics
+        if m is not None:
+            if self._rx: m.observe("queue", t0 - self._rcvtime)
+            m.observe("recv", t1 - t0)
+            m.observe("parse", time.time() - t1)
+            m.count(m.messages, MSG_TYPES[rv["T"]])
+            if rv["T"] == MSG_TYPES["LSUPD"] and "V" in rv["V"]:
+                for lsa in rv["V"]["V"]["LSAS"].itervalues():
+                    m.count(m.lsas, LSAV3_TYPES.get(lsa["T"], "0x%04x" % lsa["T"]))
+
+        return rv
+
+    def fault(self, fault, exc, verbose=1):
+
+        ## count a message that could not be handled, and keep a copy
+        self.faults[fault] = self.faults.get(fault, 0) + 1
+        if verbose > 0:
+            print "[ *** %s from %s: %s *** ]" %(
+                fault, self._src and self._src[0], exc)
+        if self.quarantine is not None:
+            self.quarantine.write(self._rcvd, self._src, fault)
 
     def recvMsg(self, verbose=1, level=0):
-        self._rcvd = self._sock.recv(RECV_BUF_SZ)
+
+        ## the source is returned with its scope id set to the receiving
+        ## interface, so link-local and global sources look alike;
+        ## _rcvtime is the kernel's receive stamp where there is one
+        sock = self._sock ; ifindex = 0
+        if self._poll is not None:
+            while not self._ready:
+                try:
+                    self._ready = [ fd for (fd, ev) in self._poll.poll() ]
+                except IOError, e:
+                    if e.errno != errno.EINTR: raise
+            (ifindex, sock) = self._fds[self._ready.pop()]
+
+        rx = self._rx.get(sock.fileno())
+        if rx is not None:
+            (self._rcvd, src, ts) = rx.recvfrom()
+            self._rcvtime = ts or time.time()
+        else:
+            (self._rcvd, src) = sock.recvfrom(RECV_BUF_SZ)
+            self._rcvtime = time.time()
+        self._ifindex = ifindex or src[3]
+        self._src     = src[:3] + (self._ifindex, )
         if verbose > 2:
-            print "%srecvMsg: recv: len=%d%s" %\
-                  (level*INDENT,
-                   len(self._rcvd), prthex((level+1)*INDENT, self._rcvd))
+            print "%srecvMsg: recv: len=%d from %s%%%d%s" %\
+                  (level*INDENT, len(self._rcvd), self._src[0], self._ifindex,
+                   prthex((level+1)*INDENT, self._rcvd))
 
         return (len(self._rcvd), self._rcvd)
 
 
-    def sendMsg(self, verbose=1, level=0):
+    def sendMsg(self, msg, dst, ifindex=0, verbose=1, level=0):
+
+        ## msg from mkOspfMsg(); the kernel fills in the checksum
+        if verbose > 2:
+            print "%ssendMsg: dst=%s%%%d len=%d%s" %\
+                  (level*INDENT, dst, ifindex, len(msg),
+                   prthex((level+1)*INDENT, msg))
 
-        pass
+        self.sock(ifindex).sendto(msg, (dst, 0, 0, ifindex))
 
     #---------------------------------------------------------------------------
 
@@ -0,0 +1,254 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     profiler: on-demand sampling profiler for the monitor process
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## While a profile runs, ITIMER_PROF raises SIGPROF every INTERVAL seconds
+## of CPU time and the handler records the main thread's stack, as a
+## tuple of code objects, in a dict of counts.  Names are only worked out
+## when the profile is rendered.  When no profile runs the timer is off
+## and nothing at all is done, so the profiler can stay installed in
+## production.  A profile is started either by SIGUSR2, which writes the
+## result to a file, or over the API (GET /profile?seconds=n), which
+## returns it.
+##
+## Output is collapsed stacks -- "file:func;file:func count" per line, as
+## taken by flamegraph.pl or speedscope -- or a flat report of samples
+## per function, self and total, and per file.
+##
+## Samples are of CPU time, and land wherever the main thread is when the
+## signal is handled; time spent blocked (select, recvfrom) is not seen.
+
+import os, sys, time, signal, threading
+
+#-------------------------------------------------------------------------------
+
+INTERVAL        = 0.005         # seconds of CPU time between samples
+DEFAULT_SECONDS = 10
+MAX_SECONDS     = 300
+
+class ProfilerExc(Exception): pass
+
+def codeName(code):
+
+    return "%s:%s" % (os.path.basename(code.co_filename), code.co_name)
+
+################################################################################
+
+class Profiler:
+
+    ## must be created in the main thread, which is the one sampled
+    def __init__(self, outdir=None, interval=INTERVAL, verbose=1):
+
+        self._outdir   = outdir
+        self._interval = interval
+        self._verbose  = verbose
+        self._lock     = threading.Lock()
+        self._running  = False
+        self._done     = threading.Event()
+        self._timer    = None
+
+        self.samples   = {}
+        self.started   = 0
+        self.duration  = 0.0
+        self.profiles  = 0
+
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.siginterrupt(signal.SIGPROF, False)
+        if outdir is not None:
+            signal.signal(signal.SIGUSR2, self._signalled)
+            signal.siginterrupt(signal.SIGUSR2, False)
+
+    def __repr__(self):
+
+        return "profiler: every %.1fms of CPU, %s, profiles:%d%s" %(
+            self._interval * 1e3, self._running and "running" or "idle",
+            self.profiles, self._outdir and ", SIGUSR2 writes to %s" % self._outdir or "")
+
+    #---------------------------------------------------------------------------
+
+    def _sample(self, signum, frame):
+
+        if not self._running: return
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        key = tuple(stack)
+        try:
+            self.samples[key] += 1
+        except KeyError:
+            self.samples[key] = 1
+
+    def _signalled(self, signum, frame):
+
+        try:
+            self.start(DEFAULT_SECONDS, self.write)
+        except ProfilerExc, pe:
+            if self._verbose > 0: print "[ *** %s *** ]" % pe
+
+    #---------------------------------------------------------------------------
+
+    def start(self, seconds=DEFAULT_SECONDS, done=None):
+
+        ## done() is called from a timer thread when the profile ends
+        seconds = min(seconds, MAX_SECONDS)
+        self._lock.acquire()
+        try:
+            if self._running: raise ProfilerExc("a profile is already running")
+            self.samples  = {}
+            self.started  = time.time()
+            self._running = True
+            self._done.clear()
+        finally:
+            self._lock.release()
+
+        signal.setitimer(signal.ITIMER_PROF, self._interval, self._interval)
+        self._timer = threading.Timer(seconds, self.stop, (done, ))
+        self._timer.setDaemon(True)
+        self._timer.start()
+
+    def stop(self, done=None):
+
+        self._lock.acquire()
+        try:
+            if not self._running: return
+            self._running = False
+        finally:
+            self._lock.release()
+
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        self._timer.cancel()
+        self.duration = time.time() - self.started
+        self.profiles += 1
+        if done is not None: done()
+        self._done.set()
+
+    def profile(self, seconds=DEFAULT_SECONDS):
+
+        ## blocking: run a profile and return its samples
+        self.start(seconds)
+        self._done.wait(seconds + 5)
+        return self.samples
+
+    def write(self):
+
+        path = os.path.join(self._outdir, "profile-%s.collapsed" %
+                            time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started)))
+        f = open(path, "w")
+        try:
+            f.write(collapsed(self.samples))
+        finally:
+            f.close()
+        if self._verbose > 0:
+            print "profile: %d samples in %.1fs to %s" %(
+                sum(self.samples.values()), self.duration, path)
+
+    #---------------------------------------------------------------------------
+
+    def handle(self, h, qs):
+
+        ## API route handler: GET /profile?seconds=n[&format=collapsed|top]
+        seconds = float(qs.get("seconds", [DEFAULT_SECONDS])[0])
+        fmt     = qs.get("format", ["collapsed"])[0]
+        if fmt not in ("collapsed", "top"): raise ValueError("format %s" % fmt)
+
+        try:
+            samples = self.profile(seconds)
+        except ProfilerExc, pe:
+            h.reply(409, { "ERROR": str(pe) })
+            return
+
+        if fmt == "top": data = report(samples)
+        else: data = collapsed(samples)
+
+        h.send_response(200)
+        h.send_header("Content-Type", "text/plain")
+        h.send_header("Content-Length", str(len(data)))
+        h.end_headers()
+        h.wfile.write(data)
+
+################################################################################
+
+def collapsed(samples):
+
+    ## one "root;...;leaf count" line per distinct stack
+    names = {} ; out = []
+    for (stack, n) in samples.iteritems():
+        for c in stack:
+            if c not in names: names[c] = codeName(c)
+        out.append("%s %d" % (";".join([ names[c] for c in reversed(stack) ]), n))
+    out.sort()
+    return "\n".join(out) + "\n"
+
+def report(samples, top=40):
+
+    ## samples per function (self: on top of the stack, total: anywhere
+    ## on it) and self samples per file
+    selfs = {} ; totals = {} ; files = {} ; nsamples = 0
+    for (stack, n) in samples.iteritems():
+        nsamples += n
+        leaf = stack[0]
+        selfs[leaf] = selfs.get(leaf, 0) + n
+        f = os.path.basename(leaf.co_filename)
+        files[f] = files.get(f, 0) + n
+        for c in set(stack):
+            totals[c] = totals.get(c, 0) + n
+
+    if not nsamples: return "no samples\n"
+    pc = lambda n: 100.0 * n / nsamples
+
+    out = [ "%d samples" % nsamples, "",
+            "%6s %6s  %s" % ("self%", "total%", "function") ]
+    for c in sorted(totals, key=lambda c: (-selfs.get(c, 0), -totals[c]))[:top]:
+        out.append("%6.1f %6.1f  %s:%d" %(
+            pc(selfs.get(c, 0)), pc(totals[c]), codeName(c), c.co_firstlineno))
+
+    out += [ "", "%6s  %s" % ("self%", "file") ]
+    for (f, n) in sorted(files.items(), key=lambda x: -x[1]):
+        out.append("%6.1f  %s" % (pc(n), f))
+
+    return "\n".join(out) + "\n"
+
+################################################################################
+
+if __name__ == "__main__":
+
+    ## parse a synthetic LSUPD with the profiler off, then on, and show
+    ## the profile
+    from ospfv3 import *
+
+    body = struct.pack(OSPFV3_LSARTR, 0, "\x00\x00\x13") +\
+           struct.pack(OSPFV3_LSARTR_INTERFACE, 1, 0, 10, 1, 1, 1)
+    lsas = [ mkLsa(0x2001, 0, r, 0x80000001, body) for r in xrange(1, 101) ]
+    raw  = mkOspfMsg(MSG_TYPES["LSUPD"], mkLsUpd(lsas), 1)
+    n    = len(sys.argv) > 1 and int(sys.argv[1]) or 5000
+
+    p = Profiler()
+    for on in (0, 1):
+        if on: p.start(MAX_SECONDS)
+        t = time.time()
+        for i in xrange(n): parseOspfMsg(raw, 0)
+        t = time.time() - t
+        print "profiler %s: %.1f us per LSUPD" % (on and "on" or "off", t / n * 1e6)
+    p.stop()
+
+    print report(p.samples, 15)
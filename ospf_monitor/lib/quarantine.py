@@ -0,0 +1,172 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     quarantine: bounded capture file of the messages the monitor could
+##     not handle
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## The file is a pcap (LINKTYPE_RAW).  The raw socket only hands us the
+## OSPF message, so each one is written behind a made-up IPv6 header --
+## source as received, destination unspecified, next header 89 -- which
+## is enough for tcpdump or wireshark to dissect it.  The fault class
+## (PARSE_FAULTS) is carried in the flow label.
+##
+## When a record would take the file past its size limit, the file is
+## moved aside to <path>.1 (replacing the previous one) and a new one
+## started, so at most twice the limit is kept on disk.
+
+import os, socket, struct, time
+
+from ospfv3 import *
+
+#-------------------------------------------------------------------------------
+
+PCAP_MAGIC    = 0xa1b2c3d4
+PCAP_HDR      = "< L HH l L L L"    # magic, ver major/minor, tz, sigfigs, snaplen, linktype
+PCAP_HDR_LEN  = struct.calcsize(PCAP_HDR)
+PCAP_REC      = "< L L L L"         # secs, usecs, captured, original length
+PCAP_REC_LEN  = struct.calcsize(PCAP_REC)
+LINKTYPE_RAW  = 101
+
+IP6_HDR       = "> L H B B 16s 16s" # ver/class/flow label, len, next hdr, hop limit, src, dst
+IP6_HDR_LEN   = struct.calcsize(IP6_HDR)
+IPPROTO_OSPF  = 89
+
+SNAPLEN       = 65535
+DEFAULT_SIZE  = 4*1024*1024
+
+################################################################################
+
+class Quarantine:
+
+    def __init__(self, path, size=DEFAULT_SIZE):
+
+        self._path = path
+        self._size = size
+        self._f    = None
+
+        self.written = 0
+        self.rotated = 0
+
+        self.open()
+
+    def __repr__(self):
+
+        return "quarantine %s: %d bytes max, written:%d, rotated:%d" %(
+            self._path, self._size, self.written, self.rotated)
+
+    def open(self):
+
+        self._f = open(self._path, "ab")
+        self._f.seek(0, 2)
+        if self._f.tell() == 0:
+            self._f.write(struct.pack(PCAP_HDR, PCAP_MAGIC, 2, 4, 0, 0,
+                                      SNAPLEN, LINKTYPE_RAW))
+            self._f.flush()
+
+    def close(self):
+
+        if self._f is not None: self._f.close()
+        self._f = None
+
+    def write(self, msg, src, fault, now=None):
+
+        if now is None: now = time.time()
+
+        saddr = "\x00" * 16
+        if src:
+            try:
+                saddr = socket.inet_pton(socket.AF_INET6, src[0].split("%")[0])
+            except socket.error:
+                pass
+
+        msg = msg[:SNAPLEN - IP6_HDR_LEN]
+        pkt = struct.pack(IP6_HDR, (6 << 28) | (PARSE_FAULTS.get(fault, 0) & 0xfffff),
+                          len(msg), IPPROTO_OSPF, 1, saddr, "\x00" * 16) + msg
+        rec = struct.pack(PCAP_REC, int(now), int((now % 1) * 1000000),
+                          len(pkt), len(pkt)) + pkt
+
+        if self._f.tell() + len(rec) > self._size and self._f.tell() > PCAP_HDR_LEN:
+            self.close()
+            os.rename(self._path, self._path + ".1")
+            self.rotated += 1
+            self.open()
+
+        self._f.write(rec)
+        self._f.flush()
+        self.written += 1
+
+#-------------------------------------------------------------------------------
+
+def read(path):
+
+    ## -> [(time, source, fault, OSPF message)]
+    data = open(path, "rb").read()
+    if len(data) < PCAP_HDR_LEN or struct.unpack_from(PCAP_HDR, data)[0] != PCAP_MAGIC:
+        raise ValueError("%s: not a quarantine file" % path)
+
+    rv = [] ; off = PCAP_HDR_LEN
+    while off + PCAP_REC_LEN + IP6_HDR_LEN <= len(data):
+        (secs, usecs, caplen, _) = struct.unpack_from(PCAP_REC, data, off)
+        off += PCAP_REC_LEN
+        (vfl, _, _, _, saddr, _) = struct.unpack_from(IP6_HDR, data, off)
+        rv.append((secs + usecs / 1000000.0,
+                   socket.inet_ntop(socket.AF_INET6, saddr),
+                   PARSE_FAULTS.get(vfl & 0xfffff, "?"),
+                   data[off+IP6_HDR_LEN:off+caplen]))
+        off += caplen
+
+    return rv
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import sys
+
+    ## list a quarantine file, with what the parser makes of each message
+    ## now; -c gives per-fault counts only
+
+    counts = len(sys.argv) > 1 and sys.argv[1] == "-c"
+    for path in sys.argv[1 + counts:]:
+        recs = read(path)
+        print "%s: %d messages" % (path, len(recs))
+
+        if counts:
+            byfault = {}
+            for (_, _, fault, _) in recs:
+                byfault[fault] = byfault.get(fault, 0) + 1
+            for (fault, n) in sorted(byfault.items()):
+                print INDENT + "%-10s %d" % (fault, n)
+            continue
+
+        for (ts, src, fault, msg) in recs:
+            try:
+                rv = parseOspfMsg(msg, 0) ; now = "parses"
+                if rv["T"] == MSG_TYPES["LSUPD"] and "V" in rv["V"]:
+                    bad = badLsas(rv, msg)
+                    if bad: now = "BADCKSUM: LSA %s" % ",".join(map(str, bad))
+            except ParseExc, pe:
+                now = "%s: %s" % (pe.fault, pe)
+            except Exception, e:
+                now = "%s: %s" % (e.__class__.__name__, e)
+            print INDENT + "%s %s, %d bytes, %s (now %s)" %(
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)), src,
+                len(msg), fault, now)
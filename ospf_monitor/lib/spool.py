@@ -0,0 +1,255 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     spool: bounded on-disk FIFO of encoded export records, used while
+##     the collector is unreachable
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## Layout of a spool directory:
+##
+##   index           INDEX_SZ bytes, mmap'd: head and tail positions
+##   %08d.seg        append-only segments of  len:L data  records
+##
+## Records are appended at the tail and consumed from the head, so memory
+## use stays flat however long the outage.  The index is only advanced
+## after the record bytes are written; on reopen anything in the tail
+## segment past the recorded tail offset (a torn write) is cut off.  When
+## the spool would grow past its byte bound the oldest segment is dropped
+## and its records counted in "dropped".
+
+import os, mmap, struct, time
+
+#-------------------------------------------------------------------------------
+
+SPOOL_MAGIC   = 0x53504f4f          # "SPOO"
+SPOOL_VERSION = 1
+
+INDEX       = "> L L L L L L Q Q"   # magic, ver, head seg/off, tail seg/off, records, dropped
+INDEX_LEN   = struct.calcsize(INDEX)
+INDEX_SZ    = mmap.PAGESIZE
+
+REC_HDR     = "> L"
+REC_HDR_LEN = struct.calcsize(REC_HDR)
+
+DEFAULT_SEG_SIZE = 8*1024*1024
+DEFAULT_MAX_SIZE = 512*1024*1024
+
+class SpoolExc(Exception): pass
+
+################################################################################
+
+class Spool:
+
+    def __init__(self, path, seg_size=DEFAULT_SEG_SIZE, max_size=DEFAULT_MAX_SIZE):
+
+        self._path     = path
+        self._seg_size = seg_size
+        self._max_segs = max(2, max_size / seg_size)
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        ipath = os.path.join(path, "index")
+        fd = os.open(ipath, os.O_RDWR | os.O_CREAT, 0644)
+        if os.fstat(fd).st_size < INDEX_SZ:
+            os.ftruncate(fd, INDEX_SZ)
+        self._idx = mmap.mmap(fd, INDEX_SZ)
+        os.close(fd)
+
+        (magic, ver, self._hseg, self._hoff, self._tseg, self._toff,
+         self.records, self.dropped) = struct.unpack_from(INDEX, self._idx)
+
+        if magic == 0:
+            (self._hseg, self._hoff, self._tseg, self._toff) = (0, 0, 0, 0)
+            self.records = self.dropped = 0
+            self.sync()
+        elif magic != SPOOL_MAGIC or ver != SPOOL_VERSION:
+            raise SpoolExc("%s: not a spool index" % ipath)
+
+        self._tf = open(self.segName(self._tseg), "ab")
+        if self._tf.tell() > self._toff:
+            self._tf.truncate(self._toff)
+        self._tf.seek(self._toff)
+
+        self._hf = None
+        self._hf_seg = None
+
+    def __repr__(self):
+
+        return "spool %s: head %d/%d, tail %d/%d, records:%d, dropped:%d" %(
+            self._path, self._hseg, self._hoff, self._tseg, self._toff,
+            self.records, self.dropped)
+
+    def __len__(self):
+
+        return self.records
+
+    #---------------------------------------------------------------------------
+
+    def segName(self, seg):
+
+        return os.path.join(self._path, "%08d.seg" % seg)
+
+    def sync(self):
+
+        struct.pack_into(INDEX, self._idx, 0, SPOOL_MAGIC, SPOOL_VERSION,
+                         self._hseg, self._hoff, self._tseg, self._toff,
+                         self.records, self.dropped)
+
+    def close(self):
+
+        self.sync()
+        self._idx.flush()
+        self._idx.close()
+        self._tf.close()
+        if self._hf: self._hf.close()
+
+    #---------------------------------------------------------------------------
+
+    def append(self, data):
+
+        if self._toff and self._toff + REC_HDR_LEN + len(data) > self._seg_size:
+            self._tf.close()
+            self._tseg += 1 ; self._toff = 0
+            self._tf = open(self.segName(self._tseg), "wb")
+            if self._tseg - self._hseg >= self._max_segs:
+                self.dropHead()
+
+        self._tf.write(struct.pack(REC_HDR, len(data)))
+        self._tf.write(data)
+        self._tf.flush()
+
+        self._toff += REC_HDR_LEN + len(data)
+        self.records += 1
+        self.sync()
+
+    def dropHead(self):
+
+        ## discard the oldest segment, counting the records it still held
+        f = self.headFile() ; f.seek(self._hoff) ; n = 0
+        while 1:
+            hdr = f.read(REC_HDR_LEN)
+            if len(hdr) < REC_HDR_LEN: break
+            (l, ) = struct.unpack(REC_HDR, hdr)
+            f.seek(l, 1) ; n += 1
+
+        self.records -= n
+        self.dropped += n
+        self.nextSeg()
+
+    #---------------------------------------------------------------------------
+
+    def headFile(self):
+
+        if self._hf_seg != self._hseg:
+            if self._hf: self._hf.close()
+            self._hf = open(self.segName(self._hseg), "rb")
+            self._hf_seg = self._hseg
+        return self._hf
+
+    def nextSeg(self):
+
+        if self._hf:
+            self._hf.close()
+            self._hf = self._hf_seg = None
+        os.unlink(self.segName(self._hseg))
+        self._hseg += 1 ; self._hoff = 0
+        self.sync()
+
+    def peek(self):
+
+        ## oldest record, or None when empty; stays queued until pop()
+        while self.records:
+            if self._hseg == self._tseg and self._hoff >= self._toff:
+                return None
+
+            f = self.headFile() ; f.seek(self._hoff)
+            hdr = f.read(REC_HDR_LEN)
+            if len(hdr) < REC_HDR_LEN:
+                if self._hseg == self._tseg: return None
+                self.nextSeg()
+                continue
+
+            (l, ) = struct.unpack(REC_HDR, hdr)
+            return f.read(l)
+
+        return None
+
+    def pop(self):
+
+        f = self.headFile() ; f.seek(self._hoff)
+        (l, ) = struct.unpack(REC_HDR, f.read(REC_HDR_LEN))
+        self._hoff += REC_HDR_LEN + l
+        self.records -= 1
+
+        if self._hseg < self._tseg and self._hoff >= os.path.getsize(self.segName(self._hseg)):
+            self.nextSeg()
+        elif self.records == 0 and self._hseg == self._tseg:
+            ## empty: rewind the tail segment rather than let it grow forever
+            self._hoff = self._toff = 0
+            self._tf.seek(0) ; self._tf.truncate(0)
+        self.sync()
+
+################################################################################
+
+class Drain:
+
+    ## token bucket limiting how fast a spool is replayed once the collector
+    ## is back, and how often a failed collector is retried
+
+    def __init__(self, rate, retry=5.0):
+
+        self._rate   = float(rate)
+        self._retry  = retry
+        self._tokens = 0.0
+        self._last   = time.time()
+        self._next   = 0
+
+    def run(self, spool, send):
+
+        ## send(data) -> bool; returns the number of records drained
+        now = time.time()
+        if now < self._next: return 0
+
+        ## a burst of at least one, or a rate under 1/s never sends
+        self._tokens = min(max(self._rate, 1), self._tokens + (now - self._last) * self._rate)
+        self._last   = now
+
+        n = 0
+        while self._tokens >= 1:
+            data = spool.peek()
+            if data is None: break
+            if not send(data):
+                self._next = now + self._retry
+                break
+            spool.pop()
+            self._tokens -= 1 ; n += 1
+
+        return n
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import sys
+
+    ## print the state of a spool directory
+    for path in sys.argv[1:]:
+        print Spool(path)
@@ -0,0 +1,444 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     stream: persistent framed export stream to the collector over TCP
+##     or a Unix-domain socket, with acknowledgements and a bounded replay
+##     buffer; also a stand-in collector for offline testing
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## Wire protocol (all fields network order):
+##
+##   monitor -> collector, once per connection:  magic:L session:L
+##   collector -> monitor, in reply:             seq:L
+##        (highest seq the collector holds for that session, 0 if none)
+##   monitor -> collector, per record:           len:L seq:L payload
+##   collector -> monitor, at any time:          seq:L
+##        (cumulative ack: everything up to and including seq is held)
+##
+## The session ID is picked once per monitor process, so a restarted
+## monitor starts a fresh sequence space.  After a reconnect the monitor
+## resends every record in its replay buffer above the collector's seq.
+
+import socket, struct, select, time, errno, os, sys, random, collections
+
+#-------------------------------------------------------------------------------
+
+STREAM_MAGIC = 0x4f535033       # "OSP3"
+
+GREET     = "> L L"
+GREET_LEN = struct.calcsize(GREET)
+
+FRAME_HDR     = "> L L"
+FRAME_HDR_LEN = struct.calcsize(FRAME_HDR)
+
+ACK     = "> L"
+ACK_LEN = struct.calcsize(ACK)
+
+DEFAULT_REPLAY  = 4096          # records held until acked
+DEFAULT_TIMEOUT = 2.0           # seconds, connect and send
+RETRY_MIN       = 0.5           # seconds, reconnect backoff
+RETRY_MAX       = 30.0
+
+class StreamExc(Exception): pass
+
+#-------------------------------------------------------------------------------
+
+def parseAddr(addr):
+
+    ## "unix:/path", "tcp:host:port" or "host:port" -> (family, sockaddr)
+    if addr.startswith("unix:"):
+        return (socket.AF_UNIX, addr[len("unix:"):])
+
+    if addr.startswith("tcp:"):
+        addr = addr[len("tcp:"):]
+    (host, port) = addr.rsplit(":", 1)
+    host = host.strip("[]")
+    family = ":" in host and socket.AF_INET6 or socket.AF_INET
+    return (family, (host, int(port)))
+
+def recvExact(sock, n):
+
+    buf = ""
+    while len(buf) < n:
+        data = sock.recv(n - len(buf))
+        if not data:
+            raise StreamExc("connection closed")
+        buf += data
+    return buf
+
+################################################################################
+
+class StreamExporter:
+
+    def __init__(self, addr, replay=DEFAULT_REPLAY, timeout=DEFAULT_TIMEOUT):
+
+        (self._family, self._addr) = parseAddr(addr)
+        self._name    = addr
+        self._timeout = timeout
+
+        self._session = random.SystemRandom().getrandbits(32)
+        self._seq     = 0
+        self._acked   = 0
+        self._replay  = collections.deque()
+        self._maxlen  = replay
+        self._acks    = ""
+
+        self._sock    = None
+        self._retry   = RETRY_MIN
+        self._next    = 0
+
+        self.sent     = 0
+        self.resent   = 0
+        self.dropped  = 0
+        self.connects = 0
+
+    def __repr__(self):
+
+        return "stream exporter %s: session:%08x seq:%d acked:%d pending:%d" %(
+            self._name, self._session, self._seq, self._acked, len(self._replay))
+
+    #---------------------------------------------------------------------------
+
+    def connected(self):
+
+        return self._sock is not None
+
+    def pending(self):
+
+        return len(self._replay)
+
+    def close(self):
+
+        if self._sock:
+            try: self._sock.close()
+            except socket.error: pass
+        self._sock = None
+
+    def connect(self):
+
+        ## (re)connect if the backoff allows; returns True once connected
+        if self._sock: return True
+
+        now = time.time()
+        if now < self._next: return False
+
+        sock = socket.socket(self._family, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout)
+        try:
+            sock.connect(self._addr)
+            sock.sendall(struct.pack(GREET, STREAM_MAGIC, self._session))
+            (seq, ) = struct.unpack(ACK, recvExact(sock, ACK_LEN))
+
+        except (socket.error, StreamExc):
+            sock.close()
+            self._next  = now + self._retry
+            self._retry = min(self._retry * 2, RETRY_MAX)
+            return False
+
+        self._sock  = sock
+        self._retry = RETRY_MIN
+        self._acks  = ""
+        self.connects += 1
+        self.ack(seq)
+
+        ## resend whatever the collector does not hold yet
+        try:
+            for (seq, frame) in self._replay:
+                sock.sendall(frame)
+                self.resent += 1
+        except socket.error:
+            self.close()
+            return False
+
+        return True
+
+    def ack(self, seq):
+
+        if seq <= self._acked: return
+        self._acked = seq
+        while self._replay and self._replay[0][0] <= seq:
+            self._replay.popleft()
+
+    def pollAcks(self):
+
+        ## drain whatever acks are waiting without blocking
+        while self._sock:
+            (r, _, _) = select.select([self._sock], [], [], 0)
+            if not r: break
+            try:
+                data = self._sock.recv(4096)
+            except socket.error:
+                data = ""
+            if not data:
+                self.close()
+                break
+
+            self._acks += data
+            n = len(self._acks) - len(self._acks) % ACK_LEN
+            if n:
+                (seq, ) = struct.unpack_from(ACK, self._acks, n - ACK_LEN)
+                self._acks = self._acks[n:]
+                self.ack(seq)
+
+    #---------------------------------------------------------------------------
+
+    def send(self, data):
+
+        ## queue one record and push it (plus any backlog) if connected;
+        ## returns True when the record went out on a live connection
+        self._seq += 1
+        frame = struct.pack(FRAME_HDR, len(data), self._seq) + data
+
+        if len(self._replay) >= self._maxlen:
+            self._replay.popleft()
+            self.dropped += 1
+        self._replay.append((self._seq, frame))
+
+        if not self._sock:
+            return self.connect()
+
+        try:
+            self._sock.sendall(frame)
+            self.sent += 1
+        except socket.error:
+            self.close()
+            return False
+
+        self.pollAcks()
+        return True
+
+################################################################################
+
+class StreamCollector:
+
+    ## stand-in collector: accepts any number of monitor streams, hands each
+    ## record to handler(session, seq, payload) and acks cumulatively after
+    ## every batch read from a connection
+
+    def __init__(self, addr, handler=None):
+
+        (family, self._addr) = parseAddr(addr)
+        if family == socket.AF_UNIX and os.path.exists(self._addr):
+            os.unlink(self._addr)
+
+        self._lsock = socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            self._lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._lsock.bind(self._addr)
+        self._lsock.listen(16)
+
+        self._handler  = handler
+        self._conns    = {}     # sock -> [session, rxbuf]
+        self._sessions = {}     # session -> highest seq held
+        self._running  = True
+
+        self.records   = 0
+        self.dups      = 0
+
+    def name(self):
+
+        return self._lsock.getsockname()
+
+    def stop(self):
+
+        self._running = False
+
+    def close(self):
+
+        for s in self._conns.keys(): s.close()
+        self._conns = {}
+        self._lsock.close()
+
+    #---------------------------------------------------------------------------
+
+    def serve(self, timeout=0.5):
+
+        while self._running:
+            socks = [ self._lsock ] + self._conns.keys()
+            (r, _, _) = select.select(socks, [], [], timeout)
+            for s in r:
+                if s is self._lsock:
+                    (conn, _) = self._lsock.accept()
+                    self._conns[conn] = [ None, "" ]
+                else:
+                    self.service(s)
+
+        self.close()
+
+    def service(self, s):
+
+        try:
+            data = s.recv(65536)
+        except socket.error:
+            data = ""
+        if not data:
+            s.close()
+            del self._conns[s]
+            return
+
+        state = self._conns[s] ; state[1] += data ; buf = state[1]
+
+        if state[0] is None:
+            if len(buf) < GREET_LEN: return
+            (magic, session) = struct.unpack_from(GREET, buf)
+            if magic != STREAM_MAGIC:
+                s.close()
+                del self._conns[s]
+                return
+            state[0] = session
+            try:
+                s.sendall(struct.pack(ACK, self._sessions.get(session, 0)))
+            except socket.error:
+                s.close()
+                del self._conns[s]
+                return
+            buf = buf[GREET_LEN:]
+
+        session = state[0] ; last = self._sessions.get(session, 0) ; off = 0
+        while len(buf) - off >= FRAME_HDR_LEN:
+            (plen, seq) = struct.unpack_from(FRAME_HDR, buf, off)
+            if len(buf) - off - FRAME_HDR_LEN < plen: break
+            payload = buf[off+FRAME_HDR_LEN:off+FRAME_HDR_LEN+plen]
+            off += FRAME_HDR_LEN + plen
+
+            if seq <= last:
+                self.dups += 1
+                continue
+            last = seq
+            self.records += 1
+            if self._handler: self._handler(session, seq, payload)
+
+        state[1] = buf[off:]
+        if last != self._sessions.get(session, 0):
+            self._sessions[session] = last
+            try:
+                s.sendall(struct.pack(ACK, last))
+            except socket.error:
+                pass
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import getopt, threading
+
+    VERBOSE = 1
+    ADDRESS = "tcp:127.0.0.1:8081"
+    BENCH   = 0
+
+    def usage():
+
+        print """Usage: %s [ options ]:
+        -h|--help           : Help
+        -q|--quiet          : Be quiet
+        -v|--verbose        : Be verbose (decode binary records)
+        -a|--addr <addr>    : Listen address, tcp:host:port or unix:path [def: %s]
+        -b|--bench <n>      : Offline check: push n records through a local
+                              collector, restarting it half way""" %\
+            (os.path.basename(sys.argv[0]), ADDRESS)
+        sys.exit(0)
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hqva:b:",
+                                   ("help", "quiet", "verbose", "addr=", "bench=", ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-q', '--quiet'):
+            VERBOSE = 0
+
+        elif x in ('-v', '--verbose'):
+            VERBOSE = 2
+
+        elif x in ('-a', '--addr'):
+            ADDRESS = y
+
+        elif x in ('-b', '--bench'):
+            BENCH = int(y)
+
+        else:
+            usage()
+
+    #---------------------------------------------------------------------------
+
+    if not BENCH:
+
+        def show(session, seq, payload):
+            if VERBOSE > 1 and payload[:1] != "{":
+                import codec
+                print "%08x/%d: %s" % (session, seq, codec.BinCodec().show(payload))
+            elif VERBOSE > 0:
+                print "%08x/%d: %d bytes" % (session, seq, len(payload))
+
+        collector = StreamCollector(ADDRESS, show)
+        print "collector listening on %s" % (collector.name(), )
+        try:
+            collector.serve()
+        except (KeyboardInterrupt):
+            collector.close()
+        sys.exit(0)
+
+    #---------------------------------------------------------------------------
+
+    seen = {}
+    def count(session, seq, payload):
+        seen[seq] = 1
+
+    def start(sessions={}):
+        c = StreamCollector(ADDRESS, count)
+        c._sessions = sessions
+        t = threading.Thread(target=c.serve, args=(0.05, ))
+        t.setDaemon(True)
+        t.start()
+        return (c, t)
+
+    (collector, thread) = start()
+    exporter = StreamExporter(ADDRESS)
+    payload  = "x" * 512
+
+    before = time.time()
+    for i in xrange(BENCH / 2):
+        exporter.send(payload)
+    elapsed = time.time() - before
+
+    ## drop the collector: records sent meanwhile stay in the replay buffer
+    ## and go out again once it is back (with its session table intact)
+    collector.stop() ; thread.join()
+    for i in xrange(BENCH - BENCH / 2):
+        exporter.send(payload)
+    (collector, thread) = start(collector._sessions)
+
+    deadline = time.time() + 10
+    while exporter.pending() and time.time() < deadline:
+        exporter._next = 0
+        if exporter.connect(): exporter.pollAcks()
+        time.sleep(0.01)
+
+    collector.stop() ; thread.join()
+
+    print "%d records x %d bytes: %.0f records/s before restart" %(
+        BENCH / 2, len(payload), (BENCH / 2) / max(elapsed, 1e-9))
+    print "%s" % (exporter, )
+    print "received %d distinct of %d, resent:%d, dropped:%d, connects:%d" %(
+        len(seen), BENCH, exporter.resent, exporter.dropped, exporter.connects)
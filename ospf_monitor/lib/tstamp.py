@@ -0,0 +1,212 @@
+#! /usr/bin/env python2.5
+
+##     OSPFv3 monitor
+
+##     tstamp: kernel receive timestamps (SO_TIMESTAMPNS) through recvmsg()
+
+##     Copyright (C) 2017 Binh Nguyen <binh@cs.utah.edu> University of Utah
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+## With SO_TIMESTAMPNS set, Linux stamps each packet as the stack takes
+## it in and hands the stamp back as an SCM_TIMESTAMPNS control message.
+## Python 2 sockets have no recvmsg(), so it is called through ctypes.  A
+## Receiver keeps the message header, buffers and control buffer of one
+## socket and reuses them for every message, and sources are unpacked
+## once per neighbour, so a receive costs a few microseconds more than
+## recvfrom().
+##
+## Where recvmsg() or the socket option is missing, available() is false
+## and the caller falls back to recvfrom() and time.time().
+
+import os, socket, struct, ctypes, ctypes.util
+
+#-------------------------------------------------------------------------------
+
+SO_TIMESTAMPNS   = 35
+SCM_TIMESTAMPNS  = SO_TIMESTAMPNS
+
+SOCKADDR_LEN     = 28               # sockaddr_in6: family, port, flow, addr, scope
+CONTROL_LEN      = 64
+
+CMSG_HDR         = "@Lii"           # cmsg_len (size_t), cmsg_level, cmsg_type
+CMSG_HDR_LEN     = struct.calcsize(CMSG_HDR)
+TIMESPEC         = "@ll"
+CMSG_STAMP       = CMSG_HDR + "ll"  # the usual case: the stamp is the only cmsg
+CMSG_STAMP_LEN   = struct.calcsize(CMSG_STAMP)
+MAX_SOURCES      = 1024
+
+class TstampExc(Exception): pass
+
+class iovec(ctypes.Structure):
+
+    _fields_ = [ ("iov_base", ctypes.c_void_p),
+                 ("iov_len", ctypes.c_size_t),
+                 ]
+
+class msghdr(ctypes.Structure):
+
+    _fields_ = [ ("msg_name", ctypes.c_void_p),
+                 ("msg_namelen", ctypes.c_uint32),
+                 ("msg_iov", ctypes.POINTER(iovec)),
+                 ("msg_iovlen", ctypes.c_size_t),
+                 ("msg_control", ctypes.c_void_p),
+                 ("msg_controllen", ctypes.c_size_t),
+                 ("msg_flags", ctypes.c_int),
+                 ]
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    _recvmsg = _libc.recvmsg
+    _recvmsg.argtypes = [ ctypes.c_int, ctypes.POINTER(msghdr), ctypes.c_int ]
+    _recvmsg.restype  = ctypes.c_ssize_t
+    _indextoname = _libc.if_indextoname
+    _indextoname.argtypes = [ ctypes.c_uint, ctypes.c_char_p ]
+    _indextoname.restype  = ctypes.c_char_p
+except (OSError, AttributeError):
+    _libc = None
+
+def available():
+
+    return _libc is not None and hasattr(socket, "AF_INET6")
+
+_ifnames = {}
+
+def ifName(ifindex):
+
+    ## as recvfrom() formats a scoped address: fe80::1%eth0
+    try:
+        return _ifnames[ifindex]
+    except KeyError:
+        buf = ctypes.create_string_buffer(16)
+        name = _indextoname(ifindex, buf) or str(ifindex)
+        _ifnames[ifindex] = name
+        return name
+
+def sockaddr(name):
+
+    ## sockaddr_in6 -> (host, port, flowinfo, scope id)
+    (port, flow) = struct.unpack_from(">HL", name, 2)
+    (scope, ) = struct.unpack_from("=L", name, 24)
+    host = socket.inet_ntop(socket.AF_INET6, name[8:24])
+    if scope and host.startswith("fe80:"): host = "%s%%%s" % (host, ifName(scope))
+    return (host, port, flow, scope)
+
+def cmsgStamp(ctl):
+
+    ## the SCM_TIMESTAMPNS stamp among the control messages, or None
+    off = 0
+    while off + CMSG_HDR_LEN <= len(ctl):
+        (clen, level, typ) = struct.unpack_from(CMSG_HDR, ctl, off)
+        if clen < CMSG_HDR_LEN: break
+        if level == socket.SOL_SOCKET and typ == SCM_TIMESTAMPNS:
+            (sec, nsec) = struct.unpack_from(TIMESPEC, ctl, off + CMSG_HDR_LEN)
+            return sec + nsec * 1e-9
+        off += (clen + 7) & ~7
+    return None
+
+################################################################################
+
+class Receiver:
+
+    def __init__(self, sock, bufsize):
+
+        if not available(): raise TstampExc("recvmsg() not available")
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        except socket.error, se:
+            raise TstampExc("SO_TIMESTAMPNS: %s" % se)
+
+        self._fd   = sock.fileno()
+        self._buf  = ctypes.create_string_buffer(bufsize)
+        self._name = ctypes.create_string_buffer(SOCKADDR_LEN)
+        self._ctl  = ctypes.create_string_buffer(CONTROL_LEN)
+        self._iov  = iovec(ctypes.addressof(self._buf), bufsize)
+        self._msg  = msghdr(ctypes.addressof(self._name), SOCKADDR_LEN,
+                            ctypes.pointer(self._iov), 1,
+                            ctypes.addressof(self._ctl), CONTROL_LEN, 0)
+        self._ref  = ctypes.byref(self._msg)
+        self._addr = ctypes.addressof(self._buf)
+        self._srcs = {}         # raw sockaddr: unpacked, neighbours repeat
+
+        self.stamped = 0
+
+    def __repr__(self):
+
+        return "kernel timestamps on fd %d, stamped:%d" % (self._fd, self.stamped)
+
+    def recvfrom(self):
+
+        ## -> (data, (host, port, flowinfo, scope id), kernel time or None)
+        m = self._msg
+        m.msg_namelen    = SOCKADDR_LEN
+        m.msg_controllen = CONTROL_LEN
+        m.msg_flags      = 0
+
+        n = _recvmsg(self._fd, self._ref, 0)
+        if n < 0:
+            e = ctypes.get_errno()
+            raise socket.error(e, os.strerror(e))
+
+        data = ctypes.string_at(self._addr, n)
+
+        name = self._name.raw
+        try:
+            src = self._srcs[name]
+        except KeyError:
+            if len(self._srcs) >= MAX_SOURCES: self._srcs.clear()
+            src = self._srcs[name] = sockaddr(name)
+
+        ts = None ; clen = m.msg_controllen
+        if clen >= CMSG_STAMP_LEN:
+            (_, level, typ, sec, nsec) = struct.unpack_from(CMSG_STAMP, self._ctl)
+            if level == socket.SOL_SOCKET and typ == SCM_TIMESTAMPNS:
+                ts = sec + nsec * 1e-9
+            else:
+                ts = cmsgStamp(self._ctl.raw[:clen])
+        if ts is not None: self.stamped += 1
+
+        return (data, src, ts)
+
+################################################################################
+
+if __name__ == "__main__":
+
+    import sys, time
+
+    ## cost of a stamped receive against recvfrom(), over loopback UDP
+
+    n = len(sys.argv) > 1 and int(sys.argv[1]) or 20000
+    rx = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    rx.bind(("::1", 0))
+    tx = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    dst = rx.getsockname() ; msg = "x" * 200
+
+    for stamped in (0, 1):
+        r = stamped and Receiver(rx, 8192) or None
+        lag = 0.0 ; t = time.time()
+        for i in xrange(n):
+            tx.sendto(msg, dst)
+            if r is None:
+                rx.recvfrom(8192)
+            else:
+                (data, src, ts) = r.recvfrom()
+                lag += time.time() - ts
+        t = time.time() - t
+        print "%-9s %.2f us per send and receive" % (
+            stamped and "recvmsg" or "recvfrom", t / n * 1e6)
+        if r is not None:
+            print "%s, kernel stamp to return: %.2f us mean" % (r, lag / n * 1e6)
@@ -1,29 +1,99 @@
 # !/usr/bin/env python
 
-import sys, json, requests
+import sys, requests, time
 import subprocess
 from lib.ospfv3 import *
+from lib.codec import *
+from lib.stream import *
+from lib.spool import *
+
+DEFAULT_DRAIN_RATE = 200	# spooled records replayed per second
+POST_TIMEOUT = 5		# seconds a collector has to answer a post
 
 class LSAR(object):
 	
-	def __init__(self, dst_ip, dst_port):
+	def __init__(self, dst_ip, dst_port, codec=None, spool=None, rate=DEFAULT_DRAIN_RATE):
 		self.dst_ip = dst_ip
 		self.dst_port = dst_port
+		self.codec = codec or JsonCodec()
+		self.spool = spool
+		self.drain = Drain(rate)
+		self.metrics = None
 
-	def print_ospf_json(self, ospf_msg, verbose=1, level=0):
-		json_s = json.dumps(ospf_msg, ensure_ascii=False)
+	def export(self, ospf_msg, raw=None, verbose=1, level=0):
+		# encode once, for both the verbose print and the send
+		t0 = time.time()
+		data = self.codec.encode(ospf_msg, raw, ospf_msg.get('TS'))
+		if self.metrics is not None:
+			self.metrics.observe("encode", time.time() - t0)
 		if verbose > 1:
-			print (level+1)*INDENT + json_s
+			print (level+1)*INDENT + self.codec.show(data)
+		self.queue(ospf_msg, data)
+		# wire to collector: from the kernel's receive stamp to the
+		# hand-off (posted, streamed or spooled)
+		if self.metrics is not None and 'TS' in ospf_msg:
+			self.metrics.latency(MSG_TYPES[ospf_msg['T']],
+					     time.time() - ospf_msg['TS'])
+
+	def queue(self, ospf_msg, data):
+		# with a spool nothing is lost while the collector is away: once a
+		# send fails, topology messages go to disk (hellos are dropped, the
+		# next one is never more than a hello interval away) and are
+		# replayed in order, rate limited, when the collector is back
+		if self.spool is None:
+			self.post(data)
+			return
+		if len(self.spool) > 0 or not self.post(data):
+			if MSG_TYPES[ospf_msg['T']] != "HELLO":
+				self.spool.append(data)
+		if len(self.spool) > 0:
+			self.drain.run(self.spool, self.post)
 
-	def send_ospf_msg(self, ospf_msg):
+	def post(self, data):
 		uri = 'http://%s:%s/ospf_monitor/lsa_put' % (self.dst_ip, self.dst_port)
+		t0 = time.time()
 		try:
-			r = requests.post(uri, data=json.dumps(ospf_msg))
-			if (r.status_code != 200):
+			r = requests.post(uri, data=data, timeout=POST_TIMEOUT,
+					  headers={'Content-Type': self.codec.content_type})
+			# anything but a 2xx is not delivered: keep it spooled
+			if not 200 <= r.status_code < 300:
 				print "Sent OSPF message to %s,return code = %s" % (uri, r.status_code)
+				return False
 		except:
 			print "Can't send OSPF message to %s (server is not running?)" % (uri)
-			pass
-	
+			return False
+		finally:
+			if self.metrics is not None:
+				self.metrics.observe("post", time.time() - t0)
+		return True
 
-	
+class StreamLSAR(LSAR):
+
+	# export over one persistent framed TCP/Unix stream instead of an
+	# HTTP request per message; see lib/stream.py
+	def __init__(self, addr, codec=None, replay=DEFAULT_REPLAY, spool=None, rate=DEFAULT_DRAIN_RATE):
+		LSAR.__init__(self, None, None, codec, spool, rate)
+		self.stream = StreamExporter(addr, replay)
+		self.replay = replay
+		self.dropped = 0
+
+	def post(self, data):
+		# with a spool behind us, records only go into the replay buffer
+		# while there is a live connection and room, so none is pushed
+		# out of it unacked; anything not sent stays in the spool
+		if self.spool is not None:
+			if not self.stream.connect():
+				return False
+			if self.stream.pending() >= self.replay:
+				self.stream.pollAcks()
+				if self.stream.pending() >= self.replay:
+					return False
+		t0 = time.time()
+		ok = self.stream.send(data)
+		if self.metrics is not None:
+			self.metrics.observe("post", time.time() - t0)
+		if self.stream.dropped != self.dropped:
+			self.dropped = self.stream.dropped
+			print "Can't stream OSPF message to %s (collector is not running?), %d records dropped" % (self.stream._name, self.dropped)
+			ok = False
+		return ok
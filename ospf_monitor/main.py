@@ -1,8 +1,68 @@
 # !/usr/bin/env python
 
-import sys, select
+import sys, select, getopt, os, time, socket, traceback, errno
 from lsa_receiver import *
 from lib.ospfv3 import *
+from lib.lsdb import *
+from lib.api import *
+from lib.checkpoint import *
+from lib.adj import Speaker
+from lib.quarantine import Quarantine
+from lib.metrics import Metrics, sockStats
+from lib.profiler import Profiler
+from lib.churn import Churn
+from lib.bpf import parseFilter, BpfExc
+
+#-------------------------------------------------------------------------------
+
+EXPIRE_INTERVAL = 10            # seconds between LSDB/neighbour expiry passes
+
+def usage():
+
+    print """Usage: %s [ options ] <OSPF listener's host, eg, node1.srv6.phantomnet.emulab.net> <OSPF listener's port number, eg, 8080>
+       %s [ options ] -t unix <OSPF listener's socket path>
+    -h|--help                   : Help
+    -q|--quiet                  : Be quiet
+    -v|--verbose                : Be verbose
+    -e|--encoding json|bin      : Export encoding [def: json]
+    -t|--transport http|tcp|unix: Export transport; tcp and unix keep one
+                                  framed stream open (lib/stream.py) [def: http]
+    -s|--spool <dir>            : Spool exports to disk while the collector is
+                                  unreachable (lib/spool.py)
+    -r|--rate <n>               : Spool replay rate, records/s [def: %d]
+    -a|--api <addr>             : Serve the LSDB read API (lib/api.py) on
+                                  tcp:host:port or unix:path
+    -c|--checkpoint <file>      : Restore LSDB and neighbours from file at
+                                  startup, and checkpoint them to it
+                                  (lib/checkpoint.py)
+    -i|--interval <s>           : Checkpoint interval [def: %d]
+    -I|--interfaces <if,...>    : Listen on these interfaces only, one socket
+                                  each, and tag messages with the interface
+                                  they arrived on [def: all, one socket]
+    -T|--types <type,...>       : Only handle these message types, eg,
+                                  LSUPD,LSACK; others are dropped in the
+                                  kernel (lib/bpf.py) [def: all]
+    -N|--areas <id,...>         : Only handle messages for these areas
+    -F|--routers <id,...>       : Only handle messages from these routers
+    -A|--adjacency <ifname>     : Form adjacencies on ifname and pull the
+                                  LSDB by database exchange (lib/adj.py)
+    -R|--router-id <id>         : Router ID to use in adjacency mode
+    -Q|--quarantine <file>      : Keep messages that fail to parse in a
+                                  bounded pcap file (lib/quarantine.py)
+    -m|--metrics <addr>         : Serve Prometheus metrics (lib/metrics.py)
+                                  on tcp:host:port or unix:path
+    -P|--profile <dir>          : Sampling profiler (lib/profiler.py): SIGUSR2
+                                  writes a 10s profile to dir, and the API
+                                  serves /profile
+    -C|--no-checksums           : Take LSAs without checking their checksums;
+                                  by default those that fail are dropped
+                                  and counted as BADCKSUM faults
+    -M|--mrt <file prefix>      : Dump every message received to MRT files
+                                  (RFC 6396 OSPFv3_ET, lib/mrtd.py), stamped
+                                  with its receive time""" %\
+        (os.path.basename(sys.argv[0]), os.path.basename(sys.argv[0]),
+         DEFAULT_DRAIN_RATE, DEFAULT_INTERVAL)
+    sys.exit(1)
 
 if __name__ == "__main__":
 
@@ -12,32 +72,294 @@ if __name__ == "__main__":
     VERBOSE   = 1
     DUMP_MRTD = 0
     ADDRESS   = "::"
+    ENCODING  = "json"
+    TRANSPORT = "http"
+    SPOOL     = None
+    RATE      = DEFAULT_DRAIN_RATE
+    API       = None
+    CKPT      = None
+    INTERVAL  = DEFAULT_INTERVAL
+    ADJ_IF    = None
+    RID       = None
+    QFILE     = None
+    METRICS   = None
+    PROFILE   = None
+    IFNAMES   = None
+    TYPES     = None
+    AREAS     = None
+    ROUTERS   = None
+    CKSUMS    = True
+    MRT       = None
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hqve:t:s:r:a:c:i:I:T:N:F:A:R:Q:m:P:CM:",
+                                   ("help", "quiet", "verbose", "encoding=",
+                                    "transport=", "spool=", "rate=", "api=",
+                                    "checkpoint=", "interval=", "interfaces=",
+                                    "types=", "areas=", "routers=", "adjacency=",
+                                    "router-id=", "quarantine=", "metrics=",
+                                    "profile=", "no-checksums", "mrt=", ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-q', '--quiet'):
+            VERBOSE = 0
+
+        elif x in ('-v', '--verbose'):
+            VERBOSE = 2
+
+        elif x in ('-e', '--encoding'):
+            if y not in CODECS: usage()
+            ENCODING = y
+
+        elif x in ('-t', '--transport'):
+            if y not in ("http", "tcp", "unix"): usage()
+            TRANSPORT = y
+
+        elif x in ('-s', '--spool'):
+            SPOOL = y
+
+        elif x in ('-r', '--rate'):
+            RATE = float(y)
+
+        elif x in ('-a', '--api'):
+            API = y
+
+        elif x in ('-c', '--checkpoint'):
+            CKPT = y
+
+        elif x in ('-i', '--interval'):
+            INTERVAL = int(y)
+
+        elif x in ('-I', '--interfaces'):
+            IFNAMES = y.split(",")
+
+        elif x in ('-T', '--types'):
+            TYPES = y
+
+        elif x in ('-N', '--areas'):
+            AREAS = y
+
+        elif x in ('-F', '--routers'):
+            ROUTERS = y
+
+        elif x in ('-A', '--adjacency'):
+            ADJ_IF = y
+
+        elif x in ('-R', '--router-id'):
+            RID = str2id(y)
 
-    if len(sys.argv) != 3:
-	print "Usage: <OSPF listener's host, eg, node1.srv6.phantomnet.emulab.net> <OSPF listener's port number, eg, 8080>"
-	sys.exit(1)
+        elif x in ('-Q', '--quarantine'):
+            QFILE = y
 
-    LSAA_HOST = sys.argv[1]
-    LSAA_PORT = int(sys.argv[2])
-    #lsar = LSAR("155.98.39.112", 8080)
-    lsar = LSAR(LSAA_HOST, LSAA_PORT)
+        elif x in ('-m', '--metrics'):
+            METRICS = y
+
+        elif x in ('-P', '--profile'):
+            PROFILE = y
+
+        elif x in ('-C', '--no-checksums'):
+            CKSUMS = False
+
+        elif x in ('-M', '--mrt'):
+            MRT = y
+
+    if ADJ_IF and RID is None: usage()
+    try:
+        mfilt = parseFilter(TYPES, AREAS, ROUTERS)
+    except BpfExc, be:
+        print "[ *** %s *** ]" % be
+        usage()
+    ## an adjacency needs every message from its neighbours
+    if ADJ_IF and mfilt: usage()
+    if ADJ_IF and IFNAMES and ADJ_IF not in IFNAMES: IFNAMES.append(ADJ_IF)
+
+    spool = None
+    if SPOOL: spool = Spool(SPOOL)
+    if TRANSPORT == "unix":
+        if len(args) != 1: usage()
+        lsar = StreamLSAR("unix:%s" % args[0], CODECS[ENCODING](),
+                          spool=spool, rate=RATE)
+
+    else:
+        if len(args) != 2: usage()
+        LSAA_HOST = args[0]
+        LSAA_PORT = int(args[1])
+        if TRANSPORT == "tcp":
+            lsar = StreamLSAR("tcp:%s:%d" % (LSAA_HOST, LSAA_PORT), CODECS[ENCODING](),
+                              spool=spool, rate=RATE)
+        else:
+            #lsar = LSAR("155.98.39.112", 8080)
+            lsar = LSAR(LSAA_HOST, LSAA_PORT, CODECS[ENCODING](), spool, RATE)
 
 
     #---------------------------------------------------------------------------
 
-    ospf       = Ospfv3(ADDRESS)
+    ospf       = Ospfv3(ADDRESS, IFNAMES)
+    lsdb       = Lsdb()
+    nbrs       = Neighbours()
+    ckpt       = None
+
+    ## LSAs the LSDB holds already were checked when they arrived
+    ospf.verify = CKSUMS
+    ospf.seen   = lsdb.holds
+
+    if MRT:
+        from lib import mrtd
+        ospf._mrtd = mrtd.Mrtd(MRT, "w+b", mrtd.DEFAULT_SIZE,
+                               mrtd.MSG_TYPES["PROTOCOL_OSPF3_ET"], ospf)
+        if VERBOSE > 0: print ospf._mrtd
+
+    if mfilt:
+        ospf.filter = mfilt
+        for s in ospf.socks():
+            try:
+                mfilt.attach(s)
+            except BpfExc, be:
+                print "[ *** %s; filtering in userspace *** ]" % be
+        if VERBOSE > 0: print mfilt
+
+    if QFILE:
+        ospf.quarantine = Quarantine(QFILE)
+        if VERBOSE > 0: print ospf.quarantine
+
+    prof = None
+    if PROFILE:
+        prof = Profiler(PROFILE, verbose=VERBOSE)
+        if VERBOSE > 0: print prof
+
+    if CKPT:
+        ckpt = Checkpointer(CKPT, lsdb, nbrs, INTERVAL)
+        try:
+            (nlsas, nnbrs) = ckpt.load()
+            if VERBOSE > 0:
+                print "restored %d LSAs, %d neighbours from %s" % (nlsas, nnbrs, CKPT)
+        except CheckpointExc, ce:
+            print "[ *** %s; starting empty *** ]" % ce
+
+    spk = None
+    if ADJ_IF:
+        spk = Speaker(ospf, ADJ_IF, RID, lsdb, verbose=VERBOSE)
+        if VERBOSE > 0: print spk
+
+    ## churn rates and flap damping, for the API and metrics to report
+    churn = None
+    if API or METRICS:
+        churn = Churn(verbose=VERBOSE)
+        lsdb.subscribe(churn.changes)
+
+    metrics = None
+    if METRICS:
+        metrics = Metrics()
+        ospf.metrics = lsar.metrics = metrics
+
+        metrics.callback("parse_faults_total", "messages that failed to parse",
+                         "counter", "fault", lambda: ospf.faults)
+        metrics.callback("socket_rx_queue_bytes", "bytes waiting on the OSPF socket",
+                         fn=lambda: sum([ sockStats(s)[0] for s in ospf.socks() ]))
+        metrics.callback("socket_drops_total", "messages dropped by the kernel",
+                         "counter", fn=lambda: sum([ sockStats(s)[1] for s in ospf.socks() ]))
+        metrics.callback("socket_rcvbuf_bytes", "OSPF socket receive buffers",
+                         label="ifindex",
+                         fn=lambda: dict([ (i, s.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
+                                           for (i, s) in ospf.ifsocks() ]))
+        metrics.callback("filtered_total", "messages dropped by the filter in userspace",
+                         "counter", fn=lambda: ospf.filtered)
+        metrics.callback("lsdb_lsas", "LSAs held", fn=lambda: len(lsdb))
+        metrics.callback("lsdb_version", "LSDB version", fn=lsdb.version)
+        metrics.callback("neighbours", "neighbours heard", fn=lambda: len(nbrs))
+        for (name, help, kind, stat) in (
+            ("str_cache_hits_total", "id/address string cache hits", "counter", "HITS"),
+            ("str_cache_misses_total", "id/address string cache misses", "counter", "MISSES"),
+            ("str_cache_entries", "id/address strings cached", "gauge", "SIZE")):
+            metrics.callback(name, help, kind, "cache",
+                             lambda stat=stat: dict([ (c, v[stat]) for (c, v)
+                                                      in cacheStats().items() ]))
+        if spool is not None:
+            metrics.callback("spool_records", "export records spooled",
+                             fn=lambda: len(spool))
+            metrics.callback("spool_dropped_total", "spooled records dropped",
+                             "counter", fn=lambda: spool.dropped)
+        if isinstance(lsar, StreamLSAR):
+            metrics.callback("stream_pending", "records sent, not yet acked",
+                             fn=lsar.stream.pending)
+            metrics.callback("stream_sent_total", "records streamed",
+                             "counter", fn=lambda: lsar.stream.sent)
+            metrics.callback("stream_dropped_total", "records dropped by the stream",
+                             "counter", fn=lambda: lsar.stream.dropped)
+        if ckpt is not None:
+            metrics.callback("checkpoint_seconds", "duration of the last checkpoint",
+                             fn=lambda: ckpt.duration)
+        churn.register(metrics)
+
+        mapi = Api(METRICS, lsdb, VERBOSE, routes={ "/metrics": metrics.handle })
+        mapi.start()
+        if VERBOSE > 0: print "metrics on %s" % (mapi, )
+
+    if API:
+        api = Api(API, lsdb, VERBOSE)
+        api.route("/faults", lambda h, qs: h.reply(200, ospf.faults))
+        api.route("/neighbours", lambda h, qs: h.reply(200, nbrs.values()))
+        api.route("/churn", churn.handle)
+        if prof is not None: api.route("/profile", prof.handle)
+        api.start()
+        if VERBOSE > 0: print api
 
     try:
         timeout = Ospfv3._holdtimer
 
-        rv = None
+        rv = None ; expired = time.time()
         while 1:
 
-	    rv = ospf.parseMsg(VERBOSE, 0)
-	    if MSG_TYPES[int(rv['T'])] == "LSUPD" or MSG_TYPES[int(rv['T'])] == "HELLO":
-		lsar.print_ospf_json(rv, VERBOSE, 0)
-		lsar.send_ospf_msg(rv)
+            ## wait in select(), not recvfrom(), so the recv stage times
+            ## only the copy out of the socket
+            try:
+                rfds, _, _ = select.select([ospf], [], [],
+                                           (spk and 0.5) or 1)
+            except select.error, e:
+                if e[0] != errno.EINTR: raise
+                continue
+            if spk: spk.tick()
+            ## aged out LSAs and dead neighbours go with or without -c
+            now = time.time()
+            if now - expired > EXPIRE_INTERVAL or (ckpt and ckpt.due()):
+                lsdb.expire(now) ; nbrs.expire(now) ; expired = now
+            if ckpt and ckpt.due():
+                ckpt.write()
+            if not rfds: continue
+
+            ## one bad message must never stop the monitor: parse faults
+            ## come back as None, anything else is counted as INTERNAL
+            try:
+                rv = ospf.parseMsg(VERBOSE, 0)
+                if rv is None: continue
+
+                typ = MSG_TYPES.get(rv["T"])
+                if typ == "LSUPD":
+                    t = time.time()
+                    lsdb.update(rv, ospf._rcvd, rv["TS"])
+                    if metrics: metrics.observe("lsdb", time.time() - t)
+                if typ == "HELLO":
+                    nbrs.hello(rv)
+                if typ in ("DBDESC", "LSACK"):
+                    lsdb.learn(rv["V"]["AID"], rv["V"]["V"]["LSAS"])
+                if spk:
+                    spk.handle(rv, ospf._rcvd, ospf._src)
+                if typ in ("LSUPD", "HELLO"):
+                    lsar.export(rv, ospf._rcvd, VERBOSE, 0)
+
+            except Exception, e:
+                if VERBOSE > 1: traceback.print_exc()
+                ospf.fault("INTERNAL", "%s: %s" % (e.__class__.__name__, e), VERBOSE)
 
     except (KeyboardInterrupt):
+        if ckpt is not None: ckpt.write()
+        if spool is not None: spool.close()
+        if ospf.quarantine is not None: ospf.quarantine.close()
+        if VERBOSE > 0: print "faults: %s" % ospf.faults
         ospf.close()
         sys.exit(1)